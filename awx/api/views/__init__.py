@@ -27,7 +27,7 @@ from django.utils.safestring import mark_safe
 from django.utils.timezone import now
 from django.views.decorators.csrf import csrf_exempt
 from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext_lazy as _
 
@@ -59,7 +59,6 @@ from social_core.backends.utils import load_backends
 from oauth2_provider.models import get_access_token_model
 
 import pytz
-from wsgiref.util import FileWrapper
 
 # AWX
 from awx.main.tasks import send_notifications, update_inventory_computed_fields
@@ -104,7 +103,8 @@ from awx.main.scheduler.dag_workflow import WorkflowDAG
 from awx.api.views.mixin import (
     ControlledByScmMixin, InstanceGroupMembershipMixin,
     OrganizationCountsMixin, RelatedJobsPreventDeleteMixin,
-    UnifiedJobDeletionMixin, NoTruncateMixin,
+    UnifiedJobDeletionMixin, NoTruncateMixin, UnpartitionedEventLookupMixin,
+    UnpartitionedEventsListMixin,
 )
 from awx.api.views.organization import ( # noqa
     OrganizationList,
@@ -841,6 +841,11 @@ class ProjectUpdateEventsList(SubListAPIView):
     name = _('Project Update Events List')
     search_fields = ('stdout',)
 
+    def get_queryset(self):
+        parent = self.get_parent_object()
+        self.check_parent_access(parent)
+        return parent.get_event_queryset()
+
     def finalize_response(self, request, response, *args, **kwargs):
         response['X-UI-Max-Events'] = settings.MAX_UI_JOB_EVENTS
         return super(ProjectUpdateEventsList, self).finalize_response(request, response, *args, **kwargs)
@@ -855,6 +860,11 @@ class SystemJobEventsList(SubListAPIView):
     name = _('System Job Events List')
     search_fields = ('stdout',)
 
+    def get_queryset(self):
+        parent = self.get_parent_object()
+        self.check_parent_access(parent)
+        return parent.get_event_queryset()
+
     def finalize_response(self, request, response, *args, **kwargs):
         response['X-UI-Max-Events'] = settings.MAX_UI_JOB_EVENTS
         return super(SystemJobEventsList, self).finalize_response(request, response, *args, **kwargs)
@@ -3612,7 +3622,7 @@ class JobRelaunch(RetrieveAPIView):
                     'Wait until job finishes before retrying on {status_value} hosts.'
                 ).format(status_value=retry_hosts)}, status=status.HTTP_400_BAD_REQUEST)
             host_qs = obj.retry_qs(retry_hosts)
-            if not obj.job_events.filter(event='playbook_on_stats').exists():
+            if not obj.get_event_queryset().filter(event='playbook_on_stats').exists():
                 return Response({'hosts': _(
                     'Cannot retry on {status_value} hosts, playbook stats not available.'
                 ).format(status_value=retry_hosts)}, status=status.HTTP_400_BAD_REQUEST)
@@ -3740,14 +3750,14 @@ class JobHostSummaryDetail(RetrieveAPIView):
     serializer_class = serializers.JobHostSummarySerializer
 
 
-class JobEventList(NoTruncateMixin, ListAPIView):
+class JobEventList(UnpartitionedEventsListMixin, NoTruncateMixin, ListAPIView):
 
     model = models.JobEvent
     serializer_class = serializers.JobEventSerializer
     search_fields = ('stdout',)
 
 
-class JobEventDetail(RetrieveAPIView):
+class JobEventDetail(UnpartitionedEventLookupMixin, RetrieveAPIView):
 
     model = models.JobEvent
     serializer_class = serializers.JobEventSerializer
@@ -3758,7 +3768,7 @@ class JobEventDetail(RetrieveAPIView):
         return context
 
 
-class JobEventChildrenList(NoTruncateMixin, SubListAPIView):
+class JobEventChildrenList(UnpartitionedEventLookupMixin, NoTruncateMixin, SubListAPIView):
 
     model = models.JobEvent
     serializer_class = serializers.JobEventSerializer
@@ -3770,11 +3780,15 @@ class JobEventChildrenList(NoTruncateMixin, SubListAPIView):
     def get_queryset(self):
         parent_event = self.get_parent_object()
         self.check_parent_access(parent_event)
-        qs = self.request.user.get_queryset(self.model).filter(parent_uuid=parent_event.uuid)
+        qs = self.request.user.get_queryset(type(parent_event)).filter(
+            job=parent_event.job_id, parent_uuid=parent_event.uuid)
+        if isinstance(parent_event, models.JobEvent):
+            # a job's events are all in the partition of its created time
+            qs = qs.filter(job_created=parent_event.job_created)
         return qs
 
 
-class JobEventHostsList(HostRelatedSearchMixin, SubListAPIView):
+class JobEventHostsList(UnpartitionedEventLookupMixin, HostRelatedSearchMixin, SubListAPIView):
 
     model = models.Host
     serializer_class = serializers.HostSerializer
@@ -3785,7 +3799,7 @@ class JobEventHostsList(HostRelatedSearchMixin, SubListAPIView):
     def get_queryset(self):
         parent_event = self.get_parent_object()
         self.check_parent_access(parent_event)
-        qs = self.request.user.get_queryset(self.model).filter(job_events_as_primary_host=parent_event)
+        qs = self.request.user.get_queryset(self.model).filter(pk=parent_event.host_id)
         return qs
 
 
@@ -3803,7 +3817,7 @@ class BaseJobEventsList(NoTruncateMixin, SubListAPIView):
         return super(BaseJobEventsList, self).finalize_response(request, response, *args, **kwargs)
 
 
-class HostJobEventsList(BaseJobEventsList):
+class HostJobEventsList(UnpartitionedEventsListMixin, BaseJobEventsList):
 
     parent_model = models.Host
 
@@ -3814,10 +3828,16 @@ class HostJobEventsList(BaseJobEventsList):
         return qs
 
 
-class GroupJobEventsList(BaseJobEventsList):
+class GroupJobEventsList(UnpartitionedEventsListMixin, BaseJobEventsList):
 
     parent_model = models.Group
 
+    def get_queryset(self):
+        parent_obj = self.get_parent_object()
+        self.check_parent_access(parent_obj)
+        qs = self.request.user.get_queryset(self.model).filter(host__in=parent_obj.all_hosts)
+        return qs
+
 
 class JobJobEventsList(BaseJobEventsList):
 
@@ -3826,7 +3846,7 @@ class JobJobEventsList(BaseJobEventsList):
     def get_queryset(self):
         job = self.get_parent_object()
         self.check_parent_access(job)
-        qs = job.job_events.select_related('host').order_by('start_line')
+        qs = job.get_event_queryset().select_related('host').order_by('start_line')
         return qs.all()
 
 
@@ -3982,14 +4002,14 @@ class AdHocCommandRelaunch(GenericAPIView):
             return Response(data, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class AdHocCommandEventList(NoTruncateMixin, ListAPIView):
+class AdHocCommandEventList(UnpartitionedEventsListMixin, NoTruncateMixin, ListAPIView):
 
     model = models.AdHocCommandEvent
     serializer_class = serializers.AdHocCommandEventSerializer
     search_fields = ('stdout',)
 
 
-class AdHocCommandEventDetail(RetrieveAPIView):
+class AdHocCommandEventDetail(UnpartitionedEventLookupMixin, RetrieveAPIView):
 
     model = models.AdHocCommandEvent
     serializer_class = serializers.AdHocCommandEventSerializer
@@ -4010,10 +4030,16 @@ class BaseAdHocCommandEventsList(NoTruncateMixin, SubListAPIView):
     search_fields = ('stdout',)
 
 
-class HostAdHocCommandEventsList(BaseAdHocCommandEventsList):
+class HostAdHocCommandEventsList(UnpartitionedEventsListMixin, BaseAdHocCommandEventsList):
 
     parent_model = models.Host
 
+    def get_queryset(self):
+        parent_obj = self.get_parent_object()
+        self.check_parent_access(parent_obj)
+        qs = self.request.user.get_queryset(self.model).filter(host=parent_obj)
+        return qs
+
 
 #class GroupJobEventsList(BaseJobEventsList):
 #    parent_model = Group
@@ -4023,6 +4049,11 @@ class AdHocCommandAdHocCommandEventsList(BaseAdHocCommandEventsList):
 
     parent_model = models.AdHocCommand
 
+    def get_queryset(self):
+        parent = self.get_parent_object()
+        self.check_parent_access(parent)
+        return parent.get_event_queryset()
+
 
 class AdHocCommandActivityStreamList(SubListAPIView):
 
@@ -4097,44 +4128,30 @@ class UnifiedJobList(ListAPIView):
     search_fields = ('description', 'name', 'job__playbook',)
 
 
-def redact_ansi(line):
+def redact_ansi(content):
     # Remove ANSI escape sequences used to embed event data.
-    line = re.sub(r'\x1b\[K(?:[A-Za-z0-9+/=]+\x1b\[\d+D)+\x1b\[K', '', line)
+    content = re.sub(r'\x1b\[K(?:[A-Za-z0-9+/=]+\x1b\[\d+D)+\x1b\[K', '', content)
     # Remove ANSI color escape sequences.
-    return re.sub(r'\x1b[^m]*m', '', line)
+    return re.sub(r'\x1b[^m]*m', '', content)
 
 
 class StdoutFilter(object):
 
-    def __init__(self, fileobj):
+    def __init__(self, chunks):
         self._functions = []
-        self.fileobj = fileobj
-        self.extra_data = ''
-        if hasattr(fileobj, 'close'):
-            self.close = fileobj.close
-
-    def read(self, size=-1):
-        data = self.extra_data
-        while size > 0 and len(data) < size:
-            line = self.fileobj.readline(size)
-            if not line:
-                break
-            line = self.process_line(line)
-            data += line
-        if size > 0 and len(data) > size:
-            self.extra_data = data[size:]
-            data = data[:size]
-        else:
-            self.extra_data = ''
-        return data
+        self.chunks = chunks
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield self.process_chunk(chunk)
 
     def register(self, func):
         self._functions.append(func)
 
-    def process_line(self, line):
+    def process_chunk(self, chunk):
         for func in self._functions:
-            line = func(line)
-        return line
+            chunk = func(chunk)
+        return chunk
 
 
 class UnifiedJobStdout(RetrieveAPIView):
@@ -4192,13 +4209,12 @@ class UnifiedJobStdout(RetrieveAPIView):
                     pk=unified_job.id,
                     suffix='.ansi' if target_format == 'ansi_download' else ''
                 )
-                content_fd = unified_job.result_stdout_raw_handle(enforce_max_bytes=False)
-                redactor = StdoutFilter(content_fd)
+                redactor = StdoutFilter(unified_job.result_stdout_raw_stream())
                 if target_format == 'txt_download':
                     redactor.register(redact_ansi)
                 if type(unified_job) == models.ProjectUpdate:
                     redactor.register(UriCleaner.remove_sensitive)
-                response = HttpResponse(FileWrapper(redactor), content_type='text/plain')
+                response = StreamingHttpResponse(redactor, content_type='text/plain')
                 response["Content-Disposition"] = 'attachment; filename="{}"'.format(filename)
                 return response
             else:
@@ -6,6 +6,7 @@ import logging
 
 from django.db.models import Count
 from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
@@ -20,6 +21,7 @@ from awx.main.utils import (
     get_object_or_400,
     parse_yaml_or_json,
 )
+from awx.main.models.events import unpartitioned_event_model
 from awx.main.models.ha import (
     Instance,
     InstanceGroup,
@@ -253,3 +255,62 @@ class NoTruncateMixin(object):
         if self.request.query_params.get('no_truncate'):
             context.update(no_truncate=True)
         return context
+
+
+class UnpartitionedEventLookupMixin(object):
+    '''
+    Events of jobs created before the event tables were partitioned are kept
+    in the _unpartitioned_ tables; look an event (or a parent event) up there
+    when it isn't in the partitioned table.
+    '''
+
+    def get_object(self):
+        try:
+            return super(UnpartitionedEventLookupMixin, self).get_object()
+        except Http404:
+            model = unpartitioned_event_model(self.model)
+            if model is None:
+                raise
+            self.model = model
+            return super(UnpartitionedEventLookupMixin, self).get_object()
+
+    def get_parent_object(self):
+        try:
+            return super(UnpartitionedEventLookupMixin, self).get_parent_object()
+        except Http404:
+            model = unpartitioned_event_model(self.parent_model)
+            if model is None:
+                raise
+            self.parent_model = model
+            return super(UnpartitionedEventLookupMixin, self).get_parent_object()
+
+
+class UnpartitionedEventsListMixin(object):
+    '''
+    List the events of jobs created before the event tables were partitioned,
+    which are kept in the _unpartitioned_ tables, along with the others.  The
+    view's get_queryset must build on self.model, and the combined list can
+    only be ordered by the events' own columns.
+    '''
+
+    def filter_queryset(self, queryset):
+        queryset = super(UnpartitionedEventsListMixin, self).filter_queryset(queryset)
+        model = unpartitioned_event_model(self.model)
+        if model is None:
+            return queryset
+        partitioned_model, self.model = self.model, model
+        try:
+            unpartitioned = super(UnpartitionedEventsListMixin, self).filter_queryset(self.get_queryset())
+        finally:
+            self.model = partitioned_model
+        # both tables have the same columns, but the models list them in a
+        # different order
+        columns = [f.attname for f in partitioned_model._meta.concrete_fields]
+        ordering = [
+            field for field in (queryset.query.order_by or partitioned_model._meta.ordering)
+            if isinstance(field, str) and field.lstrip('-') in set(columns) | {'pk'}
+        ]
+        unpartitioned = unpartitioned.select_related(None).prefetch_related(None).order_by()
+        return queryset.select_related(None).order_by().union(
+            unpartitioned.values_list(*columns), all=True
+        ).order_by(*(ordering or ['pk']))
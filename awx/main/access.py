@@ -34,7 +34,8 @@ from awx.main.models import (
     JobHostSummary, JobLaunchConfig, JobTemplate, Label, Notification,
     NotificationTemplate, Organization, Project, ProjectUpdate,
     ProjectUpdateEvent, Role, Schedule, SystemJob, SystemJobEvent,
-    SystemJobTemplate, Team, UnifiedJob, UnifiedJobTemplate, WorkflowJob,
+    SystemJobTemplate, Team, UnifiedJob, UnifiedJobTemplate,
+    UnpartitionedAdHocCommandEvent, UnpartitionedJobEvent, WorkflowJob,
     WorkflowJobNode, WorkflowJobTemplate, WorkflowJobTemplateNode,
     WorkflowApproval, WorkflowApprovalTemplate,
     ROLE_SINGLETON_SYSTEM_ADMINISTRATOR, ROLE_SINGLETON_SYSTEM_AUDITOR
@@ -2167,6 +2168,15 @@ class AdHocCommandEventAccess(BaseAccess):
         return False
 
 
+class UnpartitionedAdHocCommandEventAccess(AdHocCommandEventAccess):
+    '''
+    Ad hoc command events of commands run before the event tables were
+    partitioned, with the same access as AdHocCommandEvent.
+    '''
+
+    model = UnpartitionedAdHocCommandEvent
+
+
 class JobHostSummaryAccess(BaseAccess):
     '''
     I can see job/host summary records whenever I can read both job and host.
@@ -2213,6 +2223,15 @@ class JobEventAccess(BaseAccess):
         return False
 
 
+class UnpartitionedJobEventAccess(JobEventAccess):
+    '''
+    Job events of jobs created before the event tables were partitioned, with
+    the same access as JobEvent.
+    '''
+
+    model = UnpartitionedJobEvent
+
+
 class ProjectUpdateEventAccess(BaseAccess):
     '''
     I can see project update event records whenever I can access the project update
@@ -2768,3 +2787,7 @@ class WorkflowApprovalTemplateAccess(BaseAccess):
 
 for cls in BaseAccess.__subclasses__():
     access_registry[cls.model] = cls
+
+# the events of jobs created before the event tables were partitioned
+for cls in (UnpartitionedJobEventAccess, UnpartitionedAdHocCommandEventAccess):
+    access_registry[cls.model] = cls
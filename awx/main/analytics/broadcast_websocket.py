@@ -52,11 +52,11 @@ class FixedSlidingWindow():
                 if k < self.start_time:
                     del self.buckets[k]
 
-    def record(self, ts=None):
+    def record(self, ts=None, count=1):
         now_bucket = ts or dt_to_seconds(datetime.datetime.now())
 
         val = self.buckets.get(now_bucket, 0)
-        self.buckets[now_bucket] = val + 1
+        self.buckets[now_bucket] = val + count
 
         self.cleanup(now_bucket)
 
@@ -137,15 +137,29 @@ class BroadcastWebsocketStats():
                                                    'Messages received per minute',
                                                    registry=self._registry)
         self._internal_messages_received_per_minute = FixedSlidingWindow()
+        self._frames_received_total = Counter(f'awx_{self.remote_name}_frames_received_total',
+                                              'Number of websocket frames received; a frame may carry several messages',
+                                              registry=self._registry)
+        self._bytes_received_total = Counter(f'awx_{self.remote_name}_bytes_received_total',
+                                             'Number of bytes received by the broadcast websocket system',
+                                             registry=self._registry)
+        self._subscribed_groups = Gauge(f'awx_{self.remote_name}_subscribed_groups',
+                                        'Number of groups with local subscribers that the remote host was asked to send',
+                                        registry=self._registry)
 
     def unregister(self):
         self._registry.unregister(f'awx_{self.remote_name}_messages_received')
         self._registry.unregister(f'awx_{self.remote_name}_connection')
 
-    def record_message_received(self):
-        self._internal_messages_received_per_minute.record()
-        self._messages_received.inc()
-        self._messages_received_total.inc()
+    def record_message_received(self, count=1, size=0):
+        self._internal_messages_received_per_minute.record(count=count)
+        self._messages_received.inc(count)
+        self._messages_received_total.inc(count)
+        self._frames_received_total.inc()
+        self._bytes_received_total.inc(size)
+
+    def record_interest(self, groups):
+        self._subscribed_groups.set(groups)
 
     def record_connection_established(self):
         self._connection.state('connected')
@@ -13,6 +13,7 @@ from awx.conf.license import get_license
 from awx.main.utils import (get_awx_version, get_ansible_version,
                             get_custom_venv_choices, camelcase_to_underscore)
 from awx.main import models
+from awx.main.models.events import unpartitioned_event_model
 from django.contrib.sessions.models import Session
 from awx.main.analytics import register
 
@@ -282,7 +283,7 @@ def _copy_table(table, query, path):
 
 @register('events_table', '1.2', format='csv', description=_('Automation task records'), expensive=True)
 def events_table(since, full_path, until, **kwargs):
-    events_query = '''COPY (SELECT main_jobevent.id, 
+    events_select = '''SELECT main_jobevent.id, 
                               main_jobevent.created,
                               main_jobevent.modified,
                               main_jobevent.uuid,
@@ -304,10 +305,18 @@ def events_table(since, full_path, until, **kwargs):
                               main_jobevent.event_data::json->'duration' AS duration,
                               main_jobevent.event_data::json->'res'->'warnings' AS warnings,
                               main_jobevent.event_data::json->'res'->'deprecations' AS deprecations
-                              FROM main_jobevent 
+                              FROM {} main_jobevent 
                               WHERE (main_jobevent.created > '{}' AND main_jobevent.created <= '{}')
-                              ORDER BY main_jobevent.id ASC) TO STDOUT WITH CSV HEADER
-                   '''.format(since.isoformat(),until.isoformat())
+                   '''
+    # events of jobs created before the event tables were partitioned are
+    # in the _unpartitioned_ table (until cleanup_jobs drops it)
+    tables = ['main_jobevent']
+    unpartitioned_model = unpartitioned_event_model(models.JobEvent)
+    if unpartitioned_model is not None:
+        tables.append(unpartitioned_model._meta.db_table)
+    events_query = 'COPY ({} ORDER BY id ASC) TO STDOUT WITH CSV HEADER'.format(' UNION ALL '.join(
+        events_select.format(table, since.isoformat(), until.isoformat()) for table in tables
+    ))
     return _copy_table(table='events', query=events_query, path=full_path)
 
 
@@ -1,15 +1,23 @@
+import json
+import logging
+
+import redis
 from django.conf import settings
+from django.utils.timezone import now
 from prometheus_client import (
     REGISTRY,
     PROCESS_COLLECTOR,
     PLATFORM_COLLECTOR,
     GC_COLLECTOR,
+    CollectorRegistry,
     Gauge,
     Info,
     generate_latest
 )
+from prometheus_client.core import CounterMetricFamily
 
 from awx.conf.license import get_license
+from awx.main.models import Instance, InstanceMetrics, TowerMetricsState
 from awx.main.utils import (get_awx_version, get_ansible_version)
 from awx.main.analytics.collectors import (
     counts,
@@ -19,6 +27,10 @@ from awx.main.analytics.collectors import (
 )
 
 
+logger = logging.getLogger('awx.main.analytics')
+
+METRICS_COUNTERS_KEY = 'awx_metrics_counters'
+
 REGISTRY.unregister(PROCESS_COLLECTOR)
 REGISTRY.unregister(PLATFORM_COLLECTOR)
 REGISTRY.unregister(GC_COLLECTOR)
@@ -52,8 +64,98 @@ INSTANCE_REMAINING_CAPACITY = Gauge('awx_instance_remaining_capacity', 'Remainin
 LICENSE_INSTANCE_TOTAL = Gauge('awx_license_instance_total', 'Total number of managed hosts provided by your license')
 LICENSE_INSTANCE_FREE = Gauge('awx_license_instance_free', 'Number of remaining managed hosts provided by your license')
 
+COUNTERS = {
+    'awx_job_status_transitions': ('Number of job status changes on this node', ['node', 'status']),
+    'awx_events_processed': ('Number of job events processed by the callback receiver on this node', ['node', 'type']),
+    'awx_playbook_on_stats_processed': ('Number of playbook_on_stats events processed on this node', ['node', 'status']),
+    'awx_playbook_on_stats_hosts': ('Number of host summaries updated from playbook_on_stats events on this node', ['node']),
+    'awx_playbook_on_stats_milliseconds': ('Time spent processing playbook_on_stats events on this node', ['node']),
+}
 
-def metrics():
+
+_redis = []
+
+
+def redis_client():
+    '''
+    The redis client (and connection pool) for this process; redis-py starts
+    a new pool in processes forked after it was created.
+    '''
+    if not _redis:
+        _redis.append(redis.Redis.from_url(settings.BROKER_URL))
+    return _redis[0]
+
+
+def inc_counter(name, amount=1, **labels):
+    '''
+    Increment one of the COUNTERS at its source.
+
+    Counters are kept in the node's redis so that every process (dispatcher
+    workers, the callback receiver, and the web workers serving the metrics
+    endpoint) sees the same values.
+    '''
+    labels['node'] = settings.CLUSTER_HOST_ID
+    field = json.dumps([name, [labels[label] for label in COUNTERS[name][1]]])
+    try:
+        redis_client().hincrby(METRICS_COUNTERS_KEY, field, amount)
+    except redis.exceptions.RedisError:
+        logger.debug('could not increment metrics counter {}'.format(name))
+
+
+def read_counters():
+    '''
+    Return this node's counters, as {field: value}.
+    '''
+    try:
+        values = redis_client().hgetall(METRICS_COUNTERS_KEY)
+    except redis.exceptions.RedisError:
+        logger.debug('could not read metrics counters')
+        return {}
+    return dict((field.decode('utf-8'), int(value)) for field, value in values.items())
+
+
+def store_counters():
+    '''
+    Copy this node's counters to the database, where the metrics endpoint of
+    every other node reads them from (see CounterCollector).
+    '''
+    instance = Instance.objects.filter(hostname=settings.CLUSTER_HOST_ID).first()
+    if instance is None:
+        return
+    InstanceMetrics.objects.update_or_create(instance=instance, defaults={'counters': read_counters()})
+
+
+class CounterCollector(object):
+
+    def collect(self):
+        # the counters of this node, and the last copy of every other node's
+        values = {}
+        for counters in InstanceMetrics.objects.exclude(
+            instance__hostname=settings.CLUSTER_HOST_ID
+        ).values_list('counters', flat=True):
+            values.update(counters)
+        values.update(read_counters())
+        families = {}
+        for field, value in sorted(values.items()):
+            name, label_values = json.loads(field)
+            if name not in COUNTERS:
+                continue
+            if name not in families:
+                documentation, labels = COUNTERS[name]
+                families[name] = CounterMetricFamily(name, documentation, labels=labels)
+            families[name].add_metric(label_values, int(value))
+        for name in sorted(families):
+            yield families[name]
+
+
+COUNTER_REGISTRY = CollectorRegistry(auto_describe=False)
+COUNTER_REGISTRY.register(CounterCollector())
+
+
+def refresh():
+    '''
+    Recompute the gauges and store their serialized form in the database.
+    '''
     license_info = get_license()
     SYSTEM_INFO.info({
         'install_uuid': settings.INSTALL_UUID,
@@ -127,8 +229,38 @@ def metrics():
         for status, value in statuses.items():
             INSTANCE_STATUS.labels(node=node, status=status).set(value)
 
+    gauges = generate_latest()
+    if settings.METRICS_CACHE_SECONDS:
+        state = TowerMetricsState.get_solo()
+        state.gauges = gauges.decode('utf-8')
+        state.gauges_updated = now()
+        state.save()
+    return gauges
+
+
+def cached_gauges():
+    '''
+    Return the age (in seconds) and the serialized form of the gauges stored
+    by the last refresh() on any node, or (None, None).
+    '''
+    state = TowerMetricsState.get_solo()
+    if state.gauges_updated is None:
+        return None, None
+    return (now() - state.gauges_updated).total_seconds(), state.gauges.encode('utf-8')
+
+
+def metrics():
+    '''
+    Serialize the gauges computed by the last refresh() and the counters
+    recorded at their source, on every node.
 
-    return generate_latest()
+    The gauges are only recomputed here when the periodic refresh hasn't run
+    within METRICS_CACHE_SECONDS (e.g., right after startup).
+    '''
+    age, gauges = cached_gauges()
+    if age is None or age > settings.METRICS_CACHE_SECONDS:
+        gauges = refresh()
+    return gauges + generate_latest(COUNTER_REGISTRY)
 
 
-__all__ = ['metrics']
+__all__ = ['metrics', 'refresh', 'inc_counter']
@@ -1,14 +1,19 @@
 import json
 import logging
+import os
 import time
 import hmac
 import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
 from django.utils.encoding import force_bytes
 from django.contrib.auth.models import User
 
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.layers import get_channel_layer
 from channels.db import database_sync_to_async
@@ -99,6 +104,10 @@ class BroadcastConsumer(AsyncJsonWebsocketConsumer):
             await self.close()
             return
 
+        # until the remote node says which groups it has subscribers for,
+        # send it everything
+        self.interest = None
+        self.compress = False
         await self.accept()
         await self.channel_layer.group_add(settings.BROADCAST_WEBSOCKET_GROUP_NAME, self.channel_name)
         logger.info(f"client '{self.channel_name}' joined the broadcast group.")
@@ -107,11 +116,93 @@ class BroadcastConsumer(AsyncJsonWebsocketConsumer):
         logger.info(f"client '{self.channel_name}' disconnected from the broadcast group.")
         await self.channel_layer.group_discard(settings.BROADCAST_WEBSOCKET_GROUP_NAME, self.channel_name)
 
+    async def receive_json(self, data):
+        if 'interest' in data:
+            self.interest = set(data['interest'])
+            self.compress = bool(data.get('compress'))
+
     async def internal_message(self, event):
         await self.send(event['text'])
 
+    async def internal_batch(self, event):
+        for text in event['texts']:
+            await self.send(text)
+
+    async def broadcast_messages(self, event):
+        from awx.main.wsbroadcast import wrap_broadcast_msg, compress_broadcast_msgs # noqa
+
+        group = event['group']
+        if self.interest is not None and group not in self.interest:
+            return
+        if self.compress:
+            await self.send(bytes_data=compress_broadcast_msgs(group, event['texts']))
+        else:
+            for text in event['texts']:
+                await self.send(wrap_broadcast_msg(group, text))
+
+
+def subscription_options(data):
+    '''
+    Validate the `options` of a subscription request, e.g.,
+
+        {'events': ['runner_on_ok'], 'fields': ['stdout'], 'summary': False,
+         'max_events_per_second': 10}
+
+    - events: only send job events of these types
+    - fields: only send these fields of job events (plus the fields used to
+      route them)
+    - summary: only send play, task and stats events
+    - max_events_per_second: rate limit this connection; messages beyond
+      what can be sent are buffered, and dropped once the buffer is full
+    '''
+    if not isinstance(data, dict):
+        raise ValueError('options must be an object')
+    options = {}
+    for key in ('events', 'fields'):
+        if key in data:
+            if not isinstance(data[key], list) or not all(isinstance(v, str) for v in data[key]):
+                raise ValueError(f'{key} must be a list of strings')
+            options[key] = set(data[key])
+    if 'summary' in data:
+        options['summary'] = bool(data['summary'])
+    if data.get('max_events_per_second') is not None:
+        rate = data['max_events_per_second']
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate <= 0:
+            raise ValueError('max_events_per_second must be a positive number')
+        options['max_events_per_second'] = rate
+    unknown = set(data) - {'events', 'fields', 'summary', 'max_events_per_second'}
+    if unknown:
+        raise ValueError('unknown options {}'.format(', '.join(sorted(unknown))))
+    return options
+
+
+# fields which are always sent for job events, since clients use them to
+# route and order events
+ROUTING_FIELDS = {
+    'id', 'group_name', 'counter', 'uuid', 'event', 'job', 'ad_hoc_command',
+    'project_update', 'inventory_update', 'system_job',
+}
+
 
 class EventConsumer(AsyncJsonWebsocketConsumer):
+
+    def __init__(self, *args, **kwargs):
+        super(EventConsumer, self).__init__(*args, **kwargs)
+        self.options = {}
+        # messages waiting to be sent to the client; job events
+        # are queued individually, and other messages (e.g., status changes)
+        # are coalesced so that only the latest for each object is sent
+        self.buffer = OrderedDict()
+        self.buffer_seq = 0
+        self.dropped = 0
+        self.sender = None
+        self.refresher = None
+        # (group_name, object id) -> (visible, expiration), so that clients
+        # re-sending their subscriptions don't repeat access checks
+        self.access_cache = {}
+        self.resolved_user = None
+        self.resolved_user_expires = 0
+
     async def connect(self):
         user = self.scope['user']
         if user and not user.is_anonymous:
@@ -131,23 +222,84 @@ class EventConsumer(AsyncJsonWebsocketConsumer):
             await self.close()
 
     async def disconnect(self, code):
+        if self.sender is not None:
+            self.sender.cancel()
+        if self.refresher is not None:
+            self.refresher.cancel()
+            self.refresher = None
         current_groups = set(self.scope['session'].pop('groups') if 'groups' in self.scope['session'] else [])
         for group_name in current_groups:
             await self.channel_layer.group_discard(
                 group_name,
                 self.channel_name,
             )
+        if current_groups:
+            await self.subscriptions_changed(set())
+
+    async def subscriptions_changed(self, groups):
+        # let the broadcast process tell other nodes which messages to send here
+        from awx.main.wsbroadcast import record_subscriptions, BROADCAST_WEBSOCKET_INTEREST_GROUP # noqa
+
+        try:
+            await sync_to_async(record_subscriptions)(self.channel_name, groups)
+            await self.channel_layer.group_send(BROADCAST_WEBSOCKET_INTEREST_GROUP, {"type": "interest.changed"})
+        except Exception:
+            logger.exception(f"failed to record subscriptions for '{self.channel_name}'")
+        if groups and self.refresher is None:
+            self.refresher = asyncio.ensure_future(self.refresh_subscriptions())
+        elif not groups and self.refresher is not None:
+            self.refresher.cancel()
+            self.refresher = None
+
+    async def refresh_subscriptions(self):
+        # subscriptions that aren't recorded again within
+        # BROADCAST_WEBSOCKET_SUBSCRIPTION_EXPIRY are pruned as abandoned, so
+        # keep re-recording them for as long as this connection is open
+        from awx.main.wsbroadcast import record_subscriptions, BROADCAST_WEBSOCKET_SUBSCRIPTION_REFRESH # noqa
+
+        while True:
+            await asyncio.sleep(BROADCAST_WEBSOCKET_SUBSCRIPTION_REFRESH)
+            groups = set(self.scope['session'].get('groups', []))
+            try:
+                await sync_to_async(record_subscriptions)(self.channel_name, groups)
+            except Exception:
+                logger.exception(f"failed to refresh subscriptions for '{self.channel_name}'")
 
     @database_sync_to_async
-    def user_can_see_object_id(self, user_access, oid):
+    def user_visible_object_ids(self, access_cls, oids):
         # At this point user is a channels.auth.UserLazyObject object
         # This causes problems with our generic role permissions checking.
         # Specifically, type(user) != User
         # Therefore, get the "real" User objects from the database before
         # calling the access permission methods
-        user_access.user = User.objects.get(id=user_access.user.id)
-        res = user_access.get_queryset().filter(pk=oid).exists()
-        return res
+        if self.resolved_user is None or time.time() > self.resolved_user_expires:
+            self.resolved_user = User.objects.get(id=self.scope['user'].id)
+            self.resolved_user_expires = time.time() + settings.WEBSOCKET_ACCESS_CACHE_SECONDS
+        qs = access_cls(self.resolved_user).get_queryset().filter(pk__in=oids)
+        return set(str(pk) for pk in qs.values_list('pk', flat=True))
+
+    async def visible_object_ids(self, group_name, access_cls, oids):
+        '''
+        Return the subset of `oids` this connection's user may subscribe to,
+        checking any that aren't cached in a single query.
+        '''
+        now = time.time()
+        visible, unknown = set(), []
+        for oid in oids:
+            cached = self.access_cache.get((group_name, str(oid)))
+            if cached is not None and cached[1] > now:
+                if cached[0]:
+                    visible.add(str(oid))
+            else:
+                unknown.append(oid)
+        if unknown:
+            found = await self.user_visible_object_ids(access_cls, unknown)
+            expires = now + settings.WEBSOCKET_ACCESS_CACHE_SECONDS
+            self.access_cache = {k: v for k, v in self.access_cache.items() if v[1] > now}
+            for oid in unknown:
+                self.access_cache[(group_name, str(oid))] = (str(oid) in found, expires)
+            visible |= found
+        return visible
 
     async def receive_json(self, data):
         from awx.main.access import consumer_access
@@ -162,20 +314,30 @@ class EventConsumer(AsyncJsonWebsocketConsumer):
             await self.send_json({"error": "access denied to channel"})
             return
 
+        if 'options' in data:
+            try:
+                self.options = subscription_options(data['options'])
+            except ValueError as e:
+                await self.send_json({"error": str(e)})
+                return
+            await self.send_json({
+                "options": {k: sorted(v) if isinstance(v, set) else v for k, v in self.options.items()}
+            })
+
         if 'groups' in data:
             groups = data['groups']
             new_groups = set()
             current_groups = set(self.scope['session'].pop('groups') if 'groups' in self.scope['session'] else [])
             for group_name,v in groups.items():
                 if type(v) is list:
+                    access_cls = consumer_access(group_name)
+                    if access_cls is not None:
+                        visible = await self.visible_object_ids(group_name, access_cls, v)
                     for oid in v:
                         name = '{}-{}'.format(group_name, oid)
-                        access_cls = consumer_access(group_name)
-                        if access_cls is not None:
-                            user_access = access_cls(user)
-                            if not await self.user_can_see_object_id(user_access, oid):
-                                await self.send_json({"error": "access denied to channel {0} for resource id {1}".format(group_name, oid)})
-                                continue
+                        if access_cls is not None and str(oid) not in visible:
+                            await self.send_json({"error": "access denied to channel {0} for resource id {1}".format(group_name, oid)})
+                            continue
                         new_groups.add(name)
                 else:
                     await self.send_json({"error": "access denied to channel"})
@@ -196,20 +358,86 @@ class EventConsumer(AsyncJsonWebsocketConsumer):
                     self.channel_name
                 )
             self.scope['session']['groups'] = new_groups
+            if old_groups or new_groups_exclusive:
+                await self.subscriptions_changed(new_groups)
             await self.send_json({
                 "groups_current": list(new_groups),
                 "groups_left": list(old_groups),
                 "groups_joined": list(new_groups_exclusive)
             })
 
-    async def internal_message(self, event):
-        await self.send(event['text'])
+    def filter_message(self, text):
+        '''
+        Apply this connection's subscription options to a message, returning
+        a (coalesce key, text) pair, or None if the message shouldn't be sent.
+        '''
+        from awx.main.models.events import MINIMAL_EVENTS # noqa
 
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return (None, text)
+        if not isinstance(payload, dict):
+            return (None, text)
+        if 'event' not in payload:
+            # not a job event; only the latest message about an object matters
+            key = (payload.get('group_name'), payload.get('unified_job_id', payload.get('id')))
+            return (key if key != (None, None) else None, text)
+        if 'events' in self.options and payload['event'] not in self.options['events']:
+            return None
+        if self.options.get('summary') and payload['event'] not in MINIMAL_EVENTS:
+            return None
+        if 'fields' in self.options:
+            fields = self.options['fields'] | ROUTING_FIELDS
+            text = _dump_payload({k: v for k, v in payload.items() if k in fields})
+        return (None, text)
 
-def run_sync(func):
-    event_loop = asyncio.new_event_loop()
-    event_loop.run_until_complete(func)
-    event_loop.close()
+    async def internal_message(self, event):
+        await self.deliver(event['text'])
+
+    async def internal_batch(self, event):
+        # clients still receive one message per frame
+        for text in event['texts']:
+            await self.deliver(text)
+
+    def max_events_per_second(self):
+        rates = [r for r in (self.options.get('max_events_per_second'), settings.WEBSOCKET_MAX_EVENTS_PER_SECOND) if r]
+        return min(rates) if rates else None
+
+    async def deliver(self, text):
+        # every message goes through the (bounded) buffer, so that a client
+        # which can't keep up costs at most WEBSOCKET_SEND_BUFFER_SIZE
+        # messages of memory, whether or not it's rate limited
+        filtered = self.filter_message(text)
+        if filtered is None:
+            return
+        key, text = filtered
+        if key is None:
+            self.buffer_seq += 1
+            key = self.buffer_seq
+        self.buffer.pop(key, None)
+        self.buffer[key] = text
+        if len(self.buffer) > settings.WEBSOCKET_SEND_BUFFER_SIZE:
+            self.buffer.popitem(last=False)
+            self.dropped += 1
+        if self.sender is None:
+            self.sender = asyncio.ensure_future(self.drain())
+
+    async def drain(self):
+        try:
+            while self.buffer:
+                _, text = self.buffer.popitem(last=False)
+                await self.send(text)
+                # without a rate, send as fast as the client accepts, but
+                # still yield, so that messages arriving meanwhile are
+                # buffered (and coalesced) behind the backlog
+                rate = self.max_events_per_second()
+                await asyncio.sleep(1.0 / rate if rate else 0)
+        finally:
+            self.sender = None
+            if self.dropped:
+                logger.debug(f"client '{self.channel_name}' fell behind, dropped {self.dropped} messages")
+                self.dropped = 0
 
 
 def _dump_payload(payload):
@@ -220,27 +448,75 @@ def _dump_payload(payload):
         return None
 
 
-def emit_channel_notification(group, payload):
-    from awx.main.wsbroadcast import wrap_broadcast_msg # noqa
+def channel_layer_message(texts):
+    if len(texts) == 1:
+        return {"type": "internal.message", "text": texts[0]}
+    return {"type": "internal.batch", "texts": texts}
+
+
+class ChannelEmitter(object):
+    '''
+    Sends notifications to the channel layer from synchronous code, using one
+    long-lived event loop per thread (rather than a new loop per message).
+
+    Within `batch()`, notifications are held and sent when the outermost
+    batch exits, with one channel layer message per group (and one for the
+    broadcast group) no matter how many notifications were sent to it.  If the
+    batch exits with an exception, its notifications are discarded.
+    '''
+
+    def __init__(self):
+        self.local = threading.local()
 
+    def event_loop(self):
+        loop = getattr(self.local, 'loop', None)
+        if loop is None or loop.is_closed() or self.local.pid != os.getpid():
+            loop = self.local.loop = asyncio.new_event_loop()
+            self.local.pid = os.getpid()
+        return loop
+
+    def notify(self, group, text):
+        pending = getattr(self.local, 'pending', None)
+        if pending is not None:
+            pending.setdefault(group, []).append(text)
+        else:
+            self.send({group: [text]})
+
+    def send(self, groups):
+        if not groups:
+            return
+        channel_layer = get_channel_layer()
+
+        async def _send():
+            for group, texts in groups.items():
+                await channel_layer.group_send(group, channel_layer_message(texts))
+                await channel_layer.group_send(
+                    settings.BROADCAST_WEBSOCKET_GROUP_NAME,
+                    {"type": "broadcast.messages", "group": group, "texts": texts}
+                )
+
+        self.event_loop().run_until_complete(_send())
+
+    @contextmanager
+    def batch(self):
+        if getattr(self.local, 'pending', None) is not None:
+            # nested; the outermost batch sends
+            yield
+            return
+        self.local.pending = {}
+        try:
+            yield
+        finally:
+            pending, self.local.pending = self.local.pending, None
+        # as with Publisher.batch, only send when the batch completes
+        self.send(pending)
+
+
+emitter = ChannelEmitter()
+
+
+def emit_channel_notification(group, payload):
     payload_dumped = _dump_payload(payload)
     if payload_dumped is None:
         return
-
-    channel_layer = get_channel_layer()
-
-    run_sync(channel_layer.group_send(
-        group,
-        {
-            "type": "internal.message",
-            "text": payload_dumped
-        },
-    ))
-
-    run_sync(channel_layer.group_send(
-        settings.BROADCAST_WEBSOCKET_GROUP_NAME,
-        {
-            "type": "internal.message",
-            "text": wrap_broadcast_msg(group, payload_dumped),
-        },
-    ))
+    emitter.notify(group, payload_dumped)
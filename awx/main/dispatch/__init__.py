@@ -1,13 +1,26 @@
+import base64
+import json
+import logging
+import os
 import psycopg2
 import select
+import threading
+import zlib
+from uuid import uuid4
 
 from contextlib import contextmanager
 
 from django.conf import settings
 
 
+logger = logging.getLogger('awx.main.dispatch')
+
 NOT_READY = ([], [], [])
 
+# postgres rejects NOTIFY payloads of 8000 bytes or more; leave room for the
+# chunk envelope
+MAX_PAYLOAD_BYTES = 7000
+
 
 def get_local_queuename():
     return settings.CLUSTER_HOST_ID
@@ -44,8 +57,67 @@ class PubSub(object):
         self.conn.close()
 
 
-@contextmanager
-def pg_bus_conn():
+def encode_payload(payload):
+    '''
+    Encode a JSON message as one or more pg_notify payloads.
+
+    Messages larger than `settings.DISPATCHER_COMPRESSION_THRESHOLD` bytes
+    are zlib compressed; any which are still too large for a single
+    notification are split into chunks.  Chunks must be sent in a single
+    transaction: postgres delivers the notifications of a transaction
+    together and in order, so `MessageAssembler` can put them back together
+    without any storage on the side.
+    '''
+    size = len(payload.encode('utf-8'))
+    threshold = getattr(settings, 'DISPATCHER_COMPRESSION_THRESHOLD', None)
+    if size < MAX_PAYLOAD_BYTES and (threshold is None or size <= threshold):
+        return [payload]
+    data = base64.b64encode(zlib.compress(payload.encode('utf-8'))).decode('ascii')
+    if len(data) < MAX_PAYLOAD_BYTES:
+        return [json.dumps({'compressed': data})]
+    chunk_id = str(uuid4())
+    chunks = [data[i:i + MAX_PAYLOAD_BYTES] for i in range(0, len(data), MAX_PAYLOAD_BYTES)]
+    return [
+        json.dumps({'chunk': [chunk_id, i, len(chunks)], 'compressed': chunk})
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+class MessageAssembler(object):
+    '''
+    Decode pg_notify payloads written by `encode_payload`, returning None for
+    chunks of a message which hasn't been fully received yet.
+    '''
+
+    MAX_PARTIAL = 100
+
+    def __init__(self):
+        self.partial = {}
+
+    def feed(self, payload):
+        body = json.loads(payload)
+        if not isinstance(body, dict):
+            return body
+        if 'chunk' in body:
+            chunk_id, index, total = body['chunk']
+            parts = self.partial.setdefault(chunk_id, {})
+            parts[index] = body['compressed']
+            if len(parts) < total:
+                if len(self.partial) > self.MAX_PARTIAL:
+                    # chunks are delivered together, so this should never
+                    # happen; don't hold on to fragments forever if it does
+                    stale = next(iter(self.partial))
+                    logger.error('discarding incomplete dispatcher message {}'.format(stale))
+                    del self.partial[stale]
+                return None
+            del self.partial[chunk_id]
+            body = {'compressed': ''.join(parts[i] for i in range(total))}
+        if 'compressed' in body:
+            body = json.loads(zlib.decompress(base64.b64decode(body['compressed'])).decode('utf-8'))
+        return body
+
+
+def pg_connect():
     conf = settings.DATABASES['default']
     conn = psycopg2.connect(dbname=conf['NAME'],
                             host=conf['HOST'],
@@ -55,8 +127,94 @@ def pg_bus_conn():
                             **conf.get("OPTIONS", {}))
     # Django connection.cursor().connection doesn't have autocommit=True on
     conn.set_session(autocommit=True)
+    return conn
+
+
+@contextmanager
+def pg_bus_conn():
+    conn = pg_connect()
     pubsub = PubSub(conn)
     yield pubsub
     conn.close()
 
 
+class Publisher(object):
+    '''
+    Publishes pg_notify messages over a long-lived autocommit connection
+    (one per process), rather than connecting for every message.
+
+    A connection which has failed is replaced (and the publish retried
+    once); a connection inherited across a fork is abandoned, *not* closed,
+    since closing it would terminate the parent's session.
+
+    Within `batch()`, messages are held and sent in a single round trip when
+    the outermost batch exits (and discarded if it exits with an exception).
+    '''
+
+    def __init__(self):
+        self.conn = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def connection(self):
+        if self.pid != os.getpid():
+            self.conn = None
+        if self.conn is None or self.conn.closed:
+            self.conn = pg_connect()
+            self.pid = os.getpid()
+        return self.conn
+
+    def close(self):
+        if self.conn is not None and self.pid == os.getpid():
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+        self.conn = None
+
+    def notify(self, channel, payload):
+        messages = [(channel, part) for part in encode_payload(payload)]
+        pending = getattr(self.local, 'pending', None)
+        if pending is not None:
+            pending.extend(messages)
+        else:
+            self.publish(messages)
+
+    def publish(self, messages):
+        if not messages:
+            return
+        sql = 'SELECT {};'.format(', '.join(['pg_notify(%s, %s)'] * len(messages)))
+        params = [arg for message in messages for arg in message]
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    with self.connection().cursor() as cur:
+                        cur.execute(sql, params)
+                    return
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    self.close()
+                    if attempt:
+                        raise
+                    logger.debug('pg_notify connection lost, reconnecting')
+
+    @contextmanager
+    def batch(self):
+        if getattr(self.local, 'pending', None) is not None:
+            # nested; the outermost batch publishes
+            yield
+            return
+        self.local.pending = []
+        try:
+            yield
+        finally:
+            pending, self.local.pending = self.local.pending, None
+        # only publish when the batch completes; if its body raised, that
+        # exception propagates (rather than being masked by a publish error),
+        # and the messages of the failed work aren't sent
+        self.publish(pending)
+
+
+publisher = Publisher()
+
+
@@ -28,6 +28,14 @@ else:
     logger = logging.getLogger('awx.main.dispatch')
 
 
+# tasks which run playbooks, and so may occupy a worker for hours
+LONG_RUNNING_TASKS = ('RunJob', 'RunProjectUpdate', 'RunInventoryUpdate', 'RunAdHocCommand', 'RunSystemJob')
+
+
+def is_long_running(body):
+    return isinstance(body, dict) and body.get('task', '').rsplit('.', 1)[-1] in LONG_RUNNING_TASKS
+
+
 class NoOpResultQueue(object):
 
     def put(self, item):
@@ -73,6 +81,8 @@ class PoolWorker(object):
         self.queue = MPQueue(queue_size)
         self.process = Process(target=target, args=(self.queue, self.finished) + args)
         self.process.daemon = True
+        # set by the pool for workers which only receive short tasks
+        self.reserved = False
 
     def start(self):
         self.process.start()
@@ -84,6 +94,9 @@ class PoolWorker(object):
                 body['uuid'] = str(uuid4())
             uuid = body['uuid']
         if self.track_managed_tasks:
+            if isinstance(body, dict):
+                # used to report how long messages wait behind other work
+                body.setdefault('time_queued', time.time())
             self.managed_tasks[uuid] = body
         self.queue.put(body, block=True, timeout=5)
         self.messages_sent += 1
@@ -194,6 +207,31 @@ class PoolWorker(object):
     def idle(self):
         return not self.busy
 
+    @property
+    def backlog(self):
+        self.calculate_managed_tasks()
+        return len(self.managed_tasks)
+
+    @property
+    def long_running(self):
+        '''
+        The number of long-running tasks this worker is running or has queued.
+        '''
+        self.calculate_managed_tasks()
+        return len([body for body in self.managed_tasks.values() if is_long_running(body)])
+
+    @property
+    def load(self):
+        '''
+        (whether any long-running tasks are running or queued, backlog); the
+        least loaded worker sorts first
+        '''
+        self.calculate_managed_tasks()
+        return (
+            any(is_long_running(body) for body in self.managed_tasks.values()),
+            len(self.managed_tasks)
+        )
+
 
 class StatefulPoolWorker(PoolWorker):
 
@@ -268,7 +306,8 @@ class WorkerPool(object):
             ' qsize={{ w.managed_tasks|length }}'
             ' rss={{ w.mb }}MB'
             '{% for task in w.managed_tasks.values() %}'
-            '\n     - {% if loop.index0 == 0 %}running {% if "age" in task %}for: {{ "%.1f" % task["age"] }}s {% endif %}{% else %}queued {% endif %}'
+            '\n     - {% if loop.index0 == 0 %}running {% if "age" in task %}for: {{ "%.1f" % task["age"] }}s {% endif %}'
+            '{% else %}queued {% if "time_queued" in task %}for: {{ "%.1f" % (time - task["time_queued"]) }}s {% endif %}{% endif %}'
             '{{ task["uuid"] }} '
             '{% if "task" in task %}'
             '{{ task["task"].rsplit(".", 1)[-1] }}'
@@ -285,7 +324,7 @@ class WorkerPool(object):
         now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')
         return tmpl.render(
             pool=self, workers=self.workers, meta=self.debug_meta,
-            dt=now
+            dt=now, time=time.time()
         )
 
     def write(self, preferred_queue, body):
@@ -353,6 +392,22 @@ class AutoscalePool(WorkerPool):
     def full(self):
         return len(self.workers) == self.max_workers
 
+    @property
+    def reserved(self):
+        '''
+        Workers which only receive short tasks, so that a burst of job
+        launches can't hold up e.g., heartbeats and notifications.  The lane
+        is only kept when there are other workers to run long tasks.
+        '''
+        reserved = [w for w in self.workers if w.reserved]
+        return reserved if len(reserved) < len(self.workers) else []
+
+    def candidates(self, body):
+        if is_long_running(body):
+            reserved = self.reserved
+            return [w for w in self.workers if w not in reserved]
+        return self.workers[:]
+
     @property
     def debug_meta(self):
         return 'min={} max={}'.format(self.min_workers, self.max_workers)
@@ -391,7 +446,7 @@ class AutoscalePool(WorkerPool):
                             logger.exception('failed to reap job UUID {}'.format(w.current_task['uuid']))
                 orphaned.extend(w.orphaned_tasks)
                 self.workers.remove(w)
-            elif w.idle and len(self.workers) > self.min_workers:
+            elif w.idle and len(self.workers) > self.min_workers and not w.reserved:
                 # the process has an empty queue (it's idle) and we have
                 # more processes in the pool than we need (> min)
                 # send this process a message so it will exit gracefully
@@ -442,25 +497,40 @@ class AutoscalePool(WorkerPool):
             idx = random.choice(range(len(self.workers)))
             return idx, self.workers[idx]
         else:
-            return super(AutoscalePool, self).up()
+            idx, worker = super(AutoscalePool, self).up()
+            # workers are marked as they're spawned (rather than by position)
+            # so the lane stays the same as other workers come and go
+            if len([w for w in self.workers if w.reserved]) < settings.DISPATCHER_SHORT_TASK_WORKERS:
+                worker.reserved = True
+            return idx, worker
 
     def write(self, preferred_queue, body):
         try:
             # when the cluster heartbeat occurs, clean up internally
             if isinstance(body, dict) and 'cluster_node_heartbeat' in body['task']:
                 self.cleanup()
-            if self.should_grow:
-                self.up()
-            # we don't care about "preferred queue" round robin distribution, just
-            # find the first non-busy worker and claim it
-            workers = self.workers[:]
-            random.shuffle(workers)
-            for w in workers:
-                if not w.busy:
+            # check each worker for finished tasks once per write
+            loads = {w: w.load for w in self.workers}
+            # (see should_grow)
+            grow = len(self.workers) < self.min_workers or all(backlog for _, backlog in loads.values())
+            if grow or not any(loads[w][1] == 0 for w in self.candidates(body)):
+                _, worker = self.up()
+                loads.setdefault(worker, worker.load)
+            # we don't care about "preferred queue" round robin distribution;
+            # pick the least loaded worker, avoiding any that are running (or
+            # have queued) a long task, since anything behind it will wait
+            candidates = sorted(self.candidates(body), key=lambda w: loads[w])
+            for w in candidates:
+                # if a worker's queue is full, fall back to the next least
+                # loaded candidate, so long tasks still stay out of the
+                # reserved lane
+                try:
                     w.put(body)
-                    break
-            else:
-                return super(AutoscalePool, self).write(preferred_queue, body)
+                    return self.workers.index(w)
+                except QueueFull:
+                    pass
+            logger.error("could not write payload to any of {} candidate queues".format(len(candidates)))
+            return None
         except Exception:
             for conn in connections.all():
                 # If the database connection has a hiccup, re-establish a new
@@ -6,7 +6,7 @@ from uuid import uuid4
 
 from django.conf import settings
 
-from . import pg_bus_conn
+from . import publisher
 
 logger = logging.getLogger('awx.main.dispatch')
 
@@ -87,8 +87,7 @@ class task:
                 if callable(queue):
                     queue = queue()
                 if not settings.IS_TESTING(sys.argv):
-                    with pg_bus_conn() as conn:
-                        conn.notify(queue, json.dumps(obj))
+                    publisher.notify(queue, json.dumps(obj))
                 return (obj, queue)
 
         # If the object we're wrapping *is* a class (e.g., RunJob), return
@@ -16,7 +16,7 @@ from django import db
 from django.conf import settings
 
 from awx.main.dispatch.pool import WorkerPool
-from awx.main.dispatch import pg_bus_conn
+from awx.main.dispatch import pg_bus_conn, MessageAssembler
 
 if 'run_callback_receiver' in sys.argv:
     logger = logging.getLogger('awx.main.commands.run_callback_receiver')
@@ -147,13 +147,16 @@ class AWXConsumerPG(AWXConsumerBase):
         while True:
             try:
                 with pg_bus_conn() as conn:
+                    assembler = MessageAssembler()
                     for queue in self.queues:
                         conn.listen(queue)
                     if init is False:
                         self.worker.on_start()
                         init = True
                     for e in conn.events():
-                        self.process_task(json.loads(e.payload))
+                        body = assembler.feed(e.payload)
+                        if body is not None:
+                            self.process_task(body)
                     if self.should_stop:
                         return
             except psycopg2.InterfaceError:
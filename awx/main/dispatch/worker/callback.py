@@ -1,3 +1,5 @@
+from collections import deque
+from io import StringIO
 import json
 import logging
 import os
@@ -14,12 +16,16 @@ import psutil
 
 import redis
 
-from awx.main.consumers import emit_channel_notification
+from awx.main.analytics.metrics import inc_counter
+from awx.main.consumers import emit_channel_notification, emitter
+from awx.main.dispatch import publisher
 from awx.main.models import (JobEvent, AdHocCommandEvent, ProjectUpdateEvent,
                              InventoryUpdateEvent, SystemJobEvent, UnifiedJob,
                              Job)
-from awx.main.tasks import handle_success_and_failure_notifications
-from awx.main.models.events import emit_event_detail
+from awx.main.tasks import handle_success_and_failure_notifications, propagate_parent_changes
+from awx.main.models.events import (BaseJobEvent, UNPARTITIONED_EVENT_MODELS,
+                                    emit_event_detail, unpartitioned_event)
+from awx.main.utils.db import create_partition, predates_event_partitions
 from awx.main.utils.profiling import AWXProfiler
 
 from .base import BaseWorker
@@ -37,6 +43,7 @@ class CallbackBrokerWorker(BaseWorker):
     '''
 
     MAX_RETRIES = 2
+    PARENT_UUID_TIMEOUT = 60
     last_stats = time.time()
     last_flush = time.time()
     total = 0
@@ -45,6 +52,9 @@ class CallbackBrokerWorker(BaseWorker):
 
     def __init__(self):
         self.buff = {}
+        self.pending = deque()
+        self.pending_parents = {}
+        self.batch_size = 1
         self.pid = os.getpid()
         self.redis = redis.Redis.from_url(settings.BROKER_URL)
         self.prof = AWXProfiler("CallbackBrokerWorker")
@@ -53,11 +63,19 @@ class CallbackBrokerWorker(BaseWorker):
 
     def read(self, queue):
         try:
+            if self.pending:
+                return self.pending.popleft()
             res = self.redis.blpop(settings.CALLBACK_QUEUE, timeout=1)
             if res is None:
                 return {'event': 'FLUSH'}
             self.total += 1
-            return json.loads(res[1])
+            body = json.loads(res[1])
+            if settings.JOB_EVENT_READ_BATCH_SIZE > 1:
+                try:
+                    self.read_batch()
+                except redis.exceptions.RedisError:
+                    logger.exception("encountered an error communicating with redis")
+            return body
         except redis.exceptions.RedisError:
             logger.exception("encountered an error communicating with redis")
             time.sleep(1)
@@ -67,6 +85,27 @@ class CallbackBrokerWorker(BaseWorker):
             self.record_statistics()
         return {'event': 'FLUSH'}
 
+    def read_batch(self):
+        # drain up to batch_size additional messages in one round trip;
+        # LRANGE + LTRIM run in a MULTI so no message is read twice
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.lrange(settings.CALLBACK_QUEUE, 0, self.batch_size - 1)
+        pipe.ltrim(settings.CALLBACK_QUEUE, self.batch_size, -1)
+        pipe.llen(settings.CALLBACK_QUEUE)
+        messages, _, remaining = pipe.execute()
+        for message in messages:
+            self.total += 1
+            try:
+                self.pending.append(json.loads(message))
+            except (json.JSONDecodeError, KeyError):
+                logger.exception("failed to decode JSON message from redis")
+        # size the next batch to this worker's share of the backlog, so that
+        # small queues keep latency low and deep queues are drained quickly
+        self.batch_size = max(1, min(
+            settings.JOB_EVENT_READ_BATCH_SIZE,
+            remaining // max(settings.JOB_EVENT_WORKERS, 1)
+        ))
+
     def record_statistics(self):
         # buffer stat recording to once per (by default) 5s
         if time.time() - self.last_stats > settings.JOB_EVENT_STATISTICS_INTERVAL:
@@ -78,7 +117,7 @@ class CallbackBrokerWorker(BaseWorker):
                 self.last_stats = time.time()
 
     def debug(self):
-        return f'.  worker[pid:{self.pid}] sent={self.total} rss={self.mb}MB {self.last_event}'
+        return f'.  worker[pid:{self.pid}] sent={self.total} batch={self.batch_size} rss={self.mb}MB {self.last_event}'
 
     @property
     def mb(self):
@@ -106,28 +145,191 @@ class CallbackBrokerWorker(BaseWorker):
             (time.time() - self.last_flush) > settings.JOB_EVENT_BUFFER_SECONDS or
             any([len(events) >= 1000 for events in self.buff.values()])
         ):
-            for cls, events in self.buff.items():
-                logger.debug(f'{cls.__name__}.objects.bulk_create({len(events)})')
-                for e in events:
-                    if not e.created:
-                        e.created = now
-                    e.modified = now
-                try:
-                    cls.objects.bulk_create(events)
-                except Exception:
-                    # if an exception occurs, we should re-attempt to save the
-                    # events one-by-one, because something in the list is
-                    # broken/stale
-                    for e in events:
-                        try:
-                            e.save()
-                        except Exception:
-                            logger.exception('Database Error Saving Job Event')
-                for e in events:
-                    emit_event_detail(e)
+            self.flush_buffer(now)
             self.buff = {}
+            self.propagate_parent_changes()
             self.last_flush = time.time()
 
+    def flush_buffer(self, now):
+        routed = {}
+        for cls, events in self.buff.items():
+            for e in events:
+                if not e.created:
+                    e.created = now
+                e.modified = now
+            self.fill_job_created(cls, events)
+            for model, model_events in self.route_events(cls, events).items():
+                routed.setdefault(model, []).extend(model_events)
+        # buffer the routed events themselves, so that if a write fails and
+        # perform_work() retries the flush, the events written by the first
+        # attempt are known (see persist) and aren't written again
+        self.buff = routed
+        for cls, events in routed.items():
+            self.save_events(cls, events)
+
+    def save_events(self, cls, events):
+        events = [e for e in events if e._state.adding]
+        if not events:
+            return
+        logger.debug(f'{cls.__name__} persisting {len(events)} events ({settings.JOB_EVENT_PERSISTENCE_MODE})')
+        if settings.JOB_EVENT_PERSISTENCE_MODE == 'copy' and django_connection.vendor == 'postgresql':
+            self.allocate_ids(cls, [e for e in events if e.pk is None])
+            self.persist(self.copy_events, cls, events)
+        else:
+            self.persist(self.bulk_create_events, cls, events)
+
+    def events_saved(self, cls, events):
+        for e in events:
+            e._state.adding = False
+        inc_counter('awx_events_processed', len(events), type=cls.__name__)
+        # batched per write, rather than per flush, so that the messages for
+        # saved events are sent even if a later write in the flush fails
+        with publisher.batch(), emitter.batch():
+            for e in events:
+                emit_event_detail(e)
+                if issubclass(cls, BaseJobEvent) and e.event == 'playbook_on_stats' and e.pk:
+                    e.defer_playbook_on_stats()
+        if issubclass(cls, BaseJobEvent):
+            self.track_parent_changes(cls, events)
+
+    def route_events(self, cls, events):
+        # the same rule as event reads (see UnifiedJob.get_event_queryset):
+        # events of jobs created before the event tables were partitioned go
+        # to the _unpartitioned_ tables, the rest to the partition for their
+        # job's created time
+        if not cls._meta.managed:
+            # already routed by an earlier attempt at this flush
+            return {cls: events}
+        routed = {}
+        for e in events:
+            if predates_event_partitions(e.job_created):
+                routed.setdefault(UNPARTITIONED_EVENT_MODELS[cls], []).append(unpartitioned_event(e))
+            else:
+                routed.setdefault(cls, []).append(e)
+        for job_created in set(e.job_created for e in routed.get(cls, [])):
+            if job_created:
+                create_partition(cls._meta.db_table, job_created)
+        return routed
+
+    def fill_job_created(self, cls, events):
+        # events are saved in the partition for their job's created time;
+        # the task that runs the job includes it in every event, but fall back
+        # to looking it up (e.g., for jobs started by an older version)
+        missing = [e for e in events if not e.job_created]
+        if not missing:
+            return
+        attname = f'{cls.JOB_REFERENCE}_id'
+        created = dict(UnifiedJob.objects.filter(
+            id__in=set(getattr(e, attname) for e in missing)
+        ).values_list('id', 'created'))
+        for e in missing:
+            e.job_created = created.get(getattr(e, attname))
+
+    def persist(self, write, cls, events):
+        try:
+            write(cls, events)
+        except (OperationalError, InterfaceError):
+            # connectivity problems aren't the fault of any particular event;
+            # let perform_work() reconnect and retry the flush
+            raise
+        except Exception:
+            # something in the list is broken/stale; rather than saving the
+            # events one-by-one, split the batch in half and retry each half
+            # so that bad events are isolated in O(log n) writes
+            if len(events) == 1:
+                logger.exception('Database Error Saving Job Event')
+                return
+            middle = len(events) // 2
+            self.persist(write, cls, events[:middle])
+            self.persist(write, cls, events[middle:])
+        else:
+            self.events_saved(cls, events)
+
+    def bulk_create_events(self, cls, events):
+        cls.objects.bulk_create(events)
+
+    def allocate_ids(self, cls, events):
+        # COPY doesn't return generated primary keys, but emitted websocket
+        # messages need them; reserve ids from the table's sequence up front
+        # (the _unpartitioned_ tables draw from the partitioned table's)
+        tblname = cls._meta.db_table
+        if not cls._meta.managed:
+            tblname = tblname[len('_unpartitioned_'):]
+        with django_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [tblname, len(events)]
+            )
+            for e, (pk,) in zip(events, cursor.fetchall()):
+                e.pk = pk
+
+    def copy_events(self, cls, events):
+        fields = cls._meta.concrete_fields
+        buff = StringIO()
+        for e in events:
+            values = []
+            for field in fields:
+                value = field.get_db_prep_save(getattr(e, field.attname), django_connection)
+                if value is None:
+                    # in CSV mode, an unquoted empty value is NULL
+                    values.append('')
+                else:
+                    values.append('"{}"'.format(str(value).replace('"', '""')))
+            buff.write(','.join(values) + '\n')
+        buff.seek(0)
+        with django_connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH CSV'.format(
+                    cls._meta.db_table,
+                    ', '.join(django_connection.ops.quote_name(field.column) for field in fields)
+                ),
+                buff
+            )
+
+    def track_parent_changes(self, cls, events):
+        # remember which parent events have a changed/failed child, so the
+        # flags can be propagated as events stream in (rather than with a
+        # pass over every event of the job once it finishes)
+        for e in events:
+            if e.parent_uuid and (e.changed or e.failed):
+                pending = self.pending_parents.setdefault(
+                    e.job_id, {'changed': set(), 'failed': set(), 'since': time.time(),
+                               'job_created': e.job_created, 'model': cls}
+                )
+                if e.changed:
+                    pending['changed'].add(e.parent_uuid)
+                if e.failed:
+                    pending['failed'].add(e.parent_uuid)
+
+    def propagate_parent_changes(self):
+        for job_id, pending in list(self.pending_parents.items()):
+            # a job's events are spread across workers, so a parent may not
+            # be saved yet; those stay pending until a later flush
+            found = set(pending['model'].objects.filter(
+                job_id=job_id, job_created=pending['job_created'],
+                uuid__in=pending['changed'] | pending['failed']
+            ).values_list('uuid', flat=True))
+            for field in ('changed', 'failed'):
+                resolved = pending[field] & found
+                if resolved:
+                    pending['model'].objects.filter(
+                        job_id=job_id, job_created=pending['job_created'],
+                        uuid__in=resolved, **{field: False}
+                    ).update(**{field: True})
+                    pending[field] -= resolved
+            if not (pending['changed'] or pending['failed']):
+                del self.pending_parents[job_id]
+            elif time.time() - pending['since'] > self.PARENT_UUID_TIMEOUT:
+                # fall back to a set-based pass over the job's events, in the
+                # dispatcher rather than here (it runs again when the job's
+                # playbook_on_stats event is processed)
+                logger.warning('Job {} parent events {} were not saved within {} seconds, '
+                               'propagating changed/failed with a pass over the job\'s events'.format(
+                                   job_id, pending['changed'] | pending['failed'], self.PARENT_UUID_TIMEOUT
+                               ))
+                propagate_parent_changes.apply_async([job_id])
+                del self.pending_parents[job_id]
+
     def perform_work(self, body):
         try:
             flush = body.get('event') == 'FLUSH'
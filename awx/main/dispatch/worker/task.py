@@ -2,6 +2,7 @@ import inspect
 import logging
 import importlib
 import sys
+import time
 import traceback
 
 from kubernetes.config import kube_config
@@ -22,6 +23,9 @@ class TaskWorker(BaseWorker):
     `awx.main.dispatch.publish`.
     '''
 
+    # seconds a task may wait in a worker's queue before it's logged as a warning
+    QUEUE_WAIT_WARNING = 30
+
     @classmethod
     def resolve_callable(cls, task):
         '''
@@ -58,7 +62,12 @@ class TaskWorker(BaseWorker):
             # return its `run()` method
             _call = _call().run
         # don't print kwargs, they often contain launch-time secrets
-        logger.debug('task {} starting {}(*{})'.format(uuid, task, args))
+        if 'time_queued' in body:
+            waited = time.time() - body['time_queued']
+            log = logger.warning if waited > self.QUEUE_WAIT_WARNING else logger.debug
+            log('task {} starting {}(*{}) after waiting {:.3f}s in queue'.format(uuid, task, args, waited))
+        else:
+            logger.debug('task {} starting {}(*{})'.format(uuid, task, args))
         return _call(*args, **kwargs)
 
     def perform_work(self, body):
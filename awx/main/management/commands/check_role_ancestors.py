@@ -0,0 +1,89 @@
+# Copyright (c) 2020 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+# AWX
+from awx.main.models import Role, invalidate_access_cache
+from awx.main.models.rbac import apply_role_ancestry, diff_role_ancestry, role_ancestry
+
+
+class Command(BaseCommand):
+    '''
+    Management command to verify (and optionally repair) the role ancestry
+    table maintained by Role.rebuild_role_ancestor_list.
+    '''
+
+    help = 'Verify that every role has the correct role ancestor entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', dest='repair', action='store_true', default=False,
+                            help='Insert missing and delete extra role ancestor entries')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=10000, metavar='N',
+                            help='Check the roles in ranges of N ids. Defaults to 10000.')
+        parser.add_argument('--workers', dest='workers', type=int, default=1, metavar='N',
+                            help='Check N ranges of roles at once, each with its own database connection')
+
+    def init_logging(self):
+        log_levels = dict(enumerate([logging.ERROR, logging.INFO,
+                                     logging.DEBUG, 0]))
+        self.logger = logging.getLogger('awx.main.commands.check_role_ancestors')
+        self.logger.setLevel(log_levels.get(self.verbosity, 0))
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+        self.logger.propagate = False
+
+    def check_chunk(self, start):
+        end = start + self.chunk_size
+        started = time.time()
+        with transaction.atomic(), connection.cursor() as cursor:
+            ancestry = role_ancestry(cursor, 'id >= %s AND id < %s', [start, end])
+            missing, extra = diff_role_ancestry(cursor, ancestry)
+            if self.repair and (missing or extra):
+                apply_role_ancestry(cursor, missing, extra)
+        self.logger.debug('roles %d-%d: %d missing, %d extra entries (%.3fs)',
+                          start, end - 1, len(missing), len(extra), time.time() - started)
+        return len(missing), len(extra)
+
+    def check_chunk_in_thread(self, start):
+        try:
+            return self.check_chunk(start)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options.get('verbosity', 1))
+        self.init_logging()
+        self.repair = bool(options.get('repair', False))
+        self.chunk_size = max(int(options.get('chunk_size') or 10000), 1)
+        workers = max(int(options.get('workers') or 1), 1)
+
+        max_id = Role.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        starts = range(1, max_id + 1, self.chunk_size)
+        if workers == 1:
+            results = [self.check_chunk(start) for start in starts]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.check_chunk_in_thread, starts))
+        missing = sum(m for m, _ in results)
+        extra = sum(e for _, e in results)
+
+        if self.repair:
+            if missing or extra:
+                invalidate_access_cache()
+            self.logger.log(99, 'Repaired role ancestors: %d entries added, %d removed.', missing, extra)
+        elif missing or extra:
+            raise CommandError(
+                '{} role ancestor entries are missing and {} are extra; run with --repair to fix them.'.format(missing, extra)
+            )
+        else:
+            self.logger.log(99, 'Role ancestors are consistent.')
@@ -4,10 +4,13 @@
 # Python
 import datetime
 import logging
+import time
 
 
 # Django
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
 from django.utils.timezone import now
 
 # AWX
@@ -27,6 +30,11 @@ class Command(BaseCommand):
         parser.add_argument('--dry-run', dest='dry_run', action='store_true',
                             default=False, help='Dry run mode (show items that would '
                             'be removed)')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=10000, metavar='N',
+                            help='Remove at most N activity stream events per transaction')
+        parser.add_argument('--time-limit', dest='time_limit', type=int, default=0, metavar='SECONDS',
+                            help='Stop removing events after SECONDS; the rest are removed '
+                            'by the next run (0, the default, means no limit)')
 
     def init_logging(self):
         log_levels = dict(enumerate([logging.ERROR, logging.INFO,
@@ -39,27 +47,46 @@ class Command(BaseCommand):
         self.logger.propagate = False
 
     def cleanup_activitystream(self):
-        n_deleted_items = 0
-        pks_to_delete = set()
-        for asobj in ActivityStream.objects.iterator():
-            asobj_disp = '"%s" id: %s' % (str(asobj), asobj.id)
-            if asobj.timestamp >= self.cutoff:
-                if self.dry_run:
-                    self.logger.info("would skip %s" % asobj_disp)
-            else:
-                if self.dry_run:
-                    self.logger.info("would delete %s" % asobj_disp)
-                else:
-                    pks_to_delete.add(asobj.pk)
-            # Cleanup objects in batches instead of deleting each one individually.
-            if len(pks_to_delete) >= 500:
-                ActivityStream.objects.filter(pk__in=pks_to_delete).delete()
-                n_deleted_items += len(pks_to_delete)
-                pks_to_delete.clear()
-        if len(pks_to_delete):
-            ActivityStream.objects.filter(pk__in=pks_to_delete).delete()
-            n_deleted_items += len(pks_to_delete)
-        self.logger.info("Removed {} items".format(n_deleted_items))
+        old = ActivityStream.objects.filter(timestamp__lt=self.cutoff)
+        relations = [
+            (f.remote_field.through, f.m2m_field_name())
+            for f in ActivityStream._meta.many_to_many
+        ]
+        if self.dry_run:
+            summary = old.aggregate(count=Count('pk'), oldest=Min('timestamp'))
+            n_relations = sum(
+                through.objects.filter(**{f'{field_name}__timestamp__lt': self.cutoff}).count()
+                for through, field_name in relations
+            )
+            self.logger.info("Would remove {} items (oldest from {}) and {} related rows".format(
+                summary['count'], summary['oldest'], n_relations))
+            return
+
+        started = time.time()
+        n_deleted_items, n_deleted_relations = 0, 0
+        last_pk = 0
+        while True:
+            # entries are created in timestamp order, so walking the primary
+            # key finds the old ones first without scanning the newer ones;
+            # each batch starts after the last one, rather than rescanning
+            # from the start of the table
+            pks = list(old.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                break
+            batch = old.filter(pk__gt=last_pk, pk__lte=pks[-1])
+            last_pk = pks[-1]
+            with transaction.atomic():
+                for through, field_name in relations:
+                    qs = through.objects.filter(**{f'{field_name}__in': batch.values('pk')})
+                    n_deleted_relations += qs._raw_delete(qs.db)
+                n_deleted_items += batch._raw_delete(batch.db)
+            elapsed = time.time() - started
+            self.logger.info("Removed {} items so far ({:.1f}s elapsed)".format(n_deleted_items, elapsed))
+            if self.time_limit and elapsed >= self.time_limit:
+                self.logger.info("Stopping after {}s, remaining items will be removed by the next run".format(
+                    self.time_limit))
+                break
+        self.logger.info("Removed {} items and {} related rows".format(n_deleted_items, n_deleted_relations))
 
     def handle(self, *args, **options):
         self.verbosity = int(options.get('verbosity', 1))
@@ -67,4 +94,6 @@ class Command(BaseCommand):
         self.days = int(options.get('days', 30))
         self.cutoff = now() - datetime.timedelta(days=self.days)
         self.dry_run = bool(options.get('dry_run', False))
+        self.batch_size = max(int(options.get('batch_size') or 10000), 1)
+        self.time_limit = int(options.get('time_limit') or 0)
         self.cleanup_activitystream()
@@ -4,23 +4,28 @@
 # Python
 import datetime
 import logging
+import time
 
 
 # Django
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
 from django.utils.timezone import now
 
 # AWX
 from awx.main.models import (
     Job, AdHocCommand, ProjectUpdate, InventoryUpdate,
-    SystemJob, WorkflowJob, Notification
+    SystemJob, WorkflowJob, Notification, UnifiedJob, Project, InventorySource,
+    JobEvent, AdHocCommandEvent, ProjectUpdateEvent, InventoryUpdateEvent,
+    SystemJobEvent, Host, JobHostSummary
 )
 from awx.main.signals import (
     disable_activity_stream,
     disable_computed_fields
 )
 
+from awx.main.utils.db import event_partitions, get_event_partition_epoch
 from awx.main.utils.deletion import AWXCollector, pre_delete
 
 
@@ -31,6 +36,16 @@ class Command(BaseCommand):
 
     help = 'Remove old jobs, project and inventory updates from the database.'
 
+    # events aren't deleted along with their jobs; the event table partitions
+    # are dropped instead, once all of the jobs they hold events for are gone
+    event_models = {
+        'jobs': (Job, JobEvent),
+        'ad_hoc_commands': (AdHocCommand, AdHocCommandEvent),
+        'project_updates': (ProjectUpdate, ProjectUpdateEvent),
+        'inventory_updates': (InventoryUpdate, InventoryUpdateEvent),
+        'management_jobs': (SystemJob, SystemJobEvent),
+    }
+
     def add_arguments(self, parser):
         parser.add_argument('--days', dest='days', type=int, default=90, metavar='N',
                             help='Remove jobs/updates executed more than N days ago. Defaults to 90.')
@@ -58,125 +73,189 @@ class Command(BaseCommand):
         parser.add_argument('--workflow-jobs', default=False,
                             action='store_true', dest='only_workflow_jobs',
                             help='Remove workflow jobs')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000, metavar='N',
+                            help='Delete at most N jobs per transaction. Defaults to 1000.')
+        parser.add_argument('--pause', dest='pause', type=float, default=0, metavar='SECONDS',
+                            help='Wait SECONDS between batches, to limit the load on the database')
 
 
-    def cleanup_jobs(self):
-        skipped, deleted = 0, 0
-
-        batch_size = 1000000
+    def bulk_delete(self, qs):
+        '''
+        Delete the jobs in `qs` in batches of `--batch-size`, each in its own
+        short transaction, pausing `--pause` seconds between batches so that
+        the cleanup can run alongside production load.
 
+        Related rows are removed with set-based statements (the many-to-many
+        rows explicitly, the rest by AWXCollector), and no per-object delete
+        signals are sent.
+        '''
+        deleted = 0
+        model = qs.model
         while True:
-            # get queryset for available jobs to remove
-            qs = Job.objects.filter(created__lt=self.cutoff).exclude(status__in=['pending', 'waiting', 'running'])
-            # get pk list for the first N (batch_size) objects
-            pk_list = qs[0:batch_size].values_list('pk')
-            # You cannot delete queries with sql LIMIT set, so we must
-            # create a new query from this pk_list
-            qs_batch = Job.objects.filter(pk__in=pk_list)
-            just_deleted = 0
-            if not self.dry_run:
-                del_query = pre_delete(qs_batch)
+            pk_list = list(qs.order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not pk_list:
+                break
+            with transaction.atomic():
+                # the batch's labels and notifications associations, with one
+                # statement per table (rather than leaving them for the
+                # collector to find)
+                for through in (UnifiedJob.labels.through, UnifiedJob.notifications.through):
+                    m2m = through.objects.filter(unifiedjob_id__in=pk_list)
+                    m2m._raw_delete(m2m.db)
+                del_query = pre_delete(model.objects.filter(pk__in=pk_list))
                 collector = AWXCollector(del_query.db)
                 collector.collect(del_query)
                 _, models_deleted = collector.delete()
-                if models_deleted:
-                    just_deleted = models_deleted['main.Job']
-                deleted += just_deleted
-            else:
-                just_deleted = 0 # break from loop, this is dry run
-                deleted = qs.count()
+            deleted += models_deleted.get(model._meta.label, 0)
+            self.logger.info('deleted %d %s', deleted, model._meta.verbose_name_plural)
+            if self.pause:
+                time.sleep(self.pause)
+        return deleted
 
-            if just_deleted == 0:
-                break
+    def update_host_last_jobs(self, host_pks):
+        # point each host at its most recent remaining job summary, which is
+        # what update_host_last_job_after_job_deleted does one host at a time
+        latest = JobHostSummary.objects.filter(host=OuterRef('pk')).order_by('-job_id')
+        for i in range(0, len(host_pks), self.batch_size):
+            Host.objects.filter(pk__in=host_pks[i:i + self.batch_size]).update(
+                last_job=Subquery(latest.values('job_id')[:1]),
+                last_job_host_summary=Subquery(latest.values('pk')[:1]),
+            )
 
-        skipped += (Job.objects.filter(created__gte=self.cutoff) | Job.objects.filter(status__in=['pending', 'waiting', 'running'])).count()
+    def cleanup_jobs(self):
+        qs = Job.objects.filter(created__lt=self.cutoff).exclude(status__in=['pending', 'waiting', 'running'])
+        if self.dry_run:
+            deleted = qs.count()
+        else:
+            # the hosts whose last job is removed are found up front, and
+            # updated once all of the jobs are gone
+            host_pks = list(Host.objects.filter(last_job__in=qs.values('pk')).values_list('pk', flat=True))
+            deleted = self.bulk_delete(qs)
+            self.update_host_last_jobs(host_pks)
+        skipped = (Job.objects.filter(created__gte=self.cutoff) | Job.objects.filter(status__in=['pending', 'waiting', 'running'])).count()
         return skipped, deleted
 
     def cleanup_ad_hoc_commands(self):
-        skipped, deleted = 0, 0
-        ad_hoc_commands = AdHocCommand.objects.filter(created__lt=self.cutoff)
-        for ad_hoc_command in ad_hoc_commands.iterator():
-            ad_hoc_command_display = '"%s" (%d events)' % \
-                (str(ad_hoc_command),
-                 ad_hoc_command.ad_hoc_command_events.count())
-            if ad_hoc_command.status in ('pending', 'waiting', 'running'):
-                action_text = 'would skip' if self.dry_run else 'skipping'
-                self.logger.debug('%s %s ad hoc command %s', action_text, ad_hoc_command.status, ad_hoc_command_display)
-                skipped += 1
-            else:
-                action_text = 'would delete' if self.dry_run else 'deleting'
-                self.logger.info('%s %s', action_text, ad_hoc_command_display)
-                if not self.dry_run:
-                    ad_hoc_command.delete()
-                deleted += 1
-
-        skipped += AdHocCommand.objects.filter(created__gte=self.cutoff).count()
+        qs = AdHocCommand.objects.filter(created__lt=self.cutoff).exclude(status__in=['pending', 'waiting', 'running'])
+        deleted = qs.count() if self.dry_run else self.bulk_delete(qs)
+        skipped = AdHocCommand.objects.exclude(pk__in=qs.values('pk')).count()
         return skipped, deleted
 
     def cleanup_project_updates(self):
-        skipped, deleted = 0, 0
-        project_updates = ProjectUpdate.objects.filter(created__lt=self.cutoff)
-        for pu in project_updates.iterator():
-            pu_display = '"%s" (type %s)' % (str(pu), str(pu.launch_type))
-            if pu.status in ('pending', 'waiting', 'running'):
-                action_text = 'would skip' if self.dry_run else 'skipping'
-                self.logger.debug('%s %s project update %s', action_text, pu.status, pu_display)
-                skipped += 1
-            elif pu in (pu.project.current_update, pu.project.last_update) and pu.project.scm_type:
-                action_text = 'would skip' if self.dry_run else 'skipping'
-                self.logger.debug('%s %s', action_text, pu_display)
-                skipped += 1
-            else:
-                action_text = 'would delete' if self.dry_run else 'deleting'
-                self.logger.info('%s %s', action_text, pu_display)
-                if not self.dry_run:
-                    pu.delete()
-                deleted += 1
-
-        skipped += ProjectUpdate.objects.filter(created__gte=self.cutoff).count()
+        # the current and last updates of SCM projects are kept, since the
+        # project's status and revision come from them
+        scm_projects = Project.objects.exclude(scm_type='').exclude(scm_type__isnull=True)
+        qs = ProjectUpdate.objects.filter(created__lt=self.cutoff).exclude(
+            status__in=['pending', 'waiting', 'running']
+        ).exclude(
+            pk__in=scm_projects.filter(current_job__isnull=False).values('current_job')
+        ).exclude(
+            pk__in=scm_projects.filter(last_job__isnull=False).values('last_job')
+        )
+        deleted = qs.count() if self.dry_run else self.bulk_delete(qs)
+        skipped = ProjectUpdate.objects.exclude(pk__in=qs.values('pk')).count()
         return skipped, deleted
 
     def cleanup_inventory_updates(self):
-        skipped, deleted = 0, 0
-        inventory_updates = InventoryUpdate.objects.filter(created__lt=self.cutoff)
-        for iu in inventory_updates.iterator():
-            iu_display = '"%s" (source %s)' % (str(iu), str(iu.source))
-            if iu.status in ('pending', 'waiting', 'running'):
-                action_text = 'would skip' if self.dry_run else 'skipping'
-                self.logger.debug('%s %s inventory update %s', action_text, iu.status, iu_display)
-                skipped += 1
-            elif iu in (iu.inventory_source.current_update, iu.inventory_source.last_update) and iu.inventory_source.source:
-                action_text = 'would skip' if self.dry_run else 'skipping'
-                self.logger.debug('%s %s', action_text, iu_display)
-                skipped += 1
-            else:
-                action_text = 'would delete' if self.dry_run else 'deleting'
-                self.logger.info('%s %s', action_text, iu_display)
-                if not self.dry_run:
-                    iu.delete()
-                deleted += 1
-
-        skipped += InventoryUpdate.objects.filter(created__gte=self.cutoff).count()
+        # likewise for the current and last updates of inventory sources
+        sources = InventorySource.objects.exclude(source='').exclude(source__isnull=True)
+        qs = InventoryUpdate.objects.filter(created__lt=self.cutoff).exclude(
+            status__in=['pending', 'waiting', 'running']
+        ).exclude(
+            pk__in=sources.filter(current_job__isnull=False).values('current_job')
+        ).exclude(
+            pk__in=sources.filter(last_job__isnull=False).values('last_job')
+        )
+        deleted = qs.count() if self.dry_run else self.bulk_delete(qs)
+        skipped = InventoryUpdate.objects.exclude(pk__in=qs.values('pk')).count()
         return skipped, deleted
 
     def cleanup_management_jobs(self):
-        skipped, deleted = 0, 0
-        system_jobs = SystemJob.objects.filter(created__lt=self.cutoff)
-        for sj in system_jobs.iterator():
-            sj_display = '"%s" (type %s)' % (str(sj), str(sj.job_type))
-            if sj.status in ('pending', 'waiting', 'running'):
-                action_text = 'would skip' if self.dry_run else 'skipping'
-                self.logger.debug('%s %s system_job %s', action_text, sj.status, sj_display)
-                skipped += 1
-            else:
+        qs = SystemJob.objects.filter(created__lt=self.cutoff).exclude(status__in=['pending', 'waiting', 'running'])
+        deleted = qs.count() if self.dry_run else self.bulk_delete(qs)
+        skipped = SystemJob.objects.exclude(pk__in=qs.values('pk')).count()
+        return skipped, deleted
+
+    def cleanup_events(self, job_model, event_model):
+        dropped, deleted = 0, 0
+        tblname = event_model._meta.db_table
+        job_fk = f'{event_model.JOB_REFERENCE}_id'
+        if connection.vendor != 'postgresql':
+            # no partitions to drop, so delete the events of deleted jobs
+            orphans = event_model.objects.filter(job_created__lt=self.cutoff).exclude(
+                **{f'{job_fk}__in': job_model.objects.values('id')}
+            )
+            deleted = orphans.count()
+            if not self.dry_run:
+                orphans.delete()
+            return dropped, deleted
+
+        for name, start, end in event_partitions(tblname):
+            if end > self.cutoff:
+                continue
+            if job_model.objects.filter(created__gte=start, created__lt=end).exists():
+                # some of this partition's jobs were kept (e.g., because
+                # they're still running); only remove the events of the rest
                 action_text = 'would delete' if self.dry_run else 'deleting'
-                self.logger.info('%s %s', action_text, sj_display)
+                self.logger.debug('%s events of deleted jobs from %s', action_text, name)
                 if not self.dry_run:
-                    sj.delete()
-                deleted += 1
+                    deleted += self.delete_orphaned_events(name, job_fk)
+                continue
+            action_text = 'would drop' if self.dry_run else 'dropping'
+            self.logger.info('%s %s', action_text, name)
+            if not self.dry_run:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE {name}')
+            dropped += 1
 
-        skipped += SystemJob.objects.filter(created__gte=self.cutoff).count()
-        return skipped, deleted
+        # jobs created before the event tables were partitioned have their
+        # events in a separate table, which is dropped as soon as the last of
+        # those jobs is gone
+        epoch = get_event_partition_epoch()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [f'_unpartitioned_{tblname}'])
+            legacy = cursor.fetchone()[0] is not None
+        if legacy and epoch and not job_model.objects.filter(created__lt=epoch).exists():
+            action_text = 'would drop' if self.dry_run else 'dropping'
+            self.logger.info('%s _unpartitioned_%s', action_text, tblname)
+            if not self.dry_run:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE _unpartitioned_{tblname}')
+            dropped += 1
+        elif legacy:
+            # some of those jobs were kept; only remove the events of the rest
+            action_text = 'would delete' if self.dry_run else 'deleting'
+            self.logger.debug('%s events of deleted jobs from _unpartitioned_%s', action_text, tblname)
+            if not self.dry_run:
+                deleted += self.delete_orphaned_events(f'_unpartitioned_{tblname}', job_fk)
+        return dropped, deleted
+
+    def delete_orphaned_events(self, table, job_fk):
+        '''
+        Delete the events in `table` whose job no longer exists, walking the
+        table by id in batches of `--batch-size`, each in its own statement,
+        pausing `--pause` seconds between batches.
+        '''
+        deleted, last_id = 0, 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f'SELECT max(id) FROM (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s) batch',
+                    [last_id, self.batch_size]
+                )
+                batch_end = cursor.fetchone()[0]
+                if batch_end is None:
+                    break
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE id > %s AND id <= %s AND NOT EXISTS '
+                    f'(SELECT 1 FROM main_unifiedjob WHERE main_unifiedjob.id = {table}.{job_fk})',
+                    [last_id, batch_end]
+                )
+                deleted += cursor.rowcount
+                last_id = batch_end
+                if self.pause:
+                    time.sleep(self.pause)
+        return deleted
 
     def init_logging(self):
         log_levels = dict(enumerate([logging.ERROR, logging.INFO,
@@ -230,12 +309,13 @@ class Command(BaseCommand):
         skipped += Notification.objects.filter(created__gte=self.cutoff).count()
         return skipped, deleted
 
-    @transaction.atomic
     def handle(self, *args, **options):
         self.verbosity = int(options.get('verbosity', 1))
         self.init_logging()
         self.days = int(options.get('days', 90))
         self.dry_run = bool(options.get('dry_run', False))
+        self.batch_size = max(int(options.get('batch_size') or 1000), 1)
+        self.pause = float(options.get('pause') or 0)
         try:
             self.cutoff = now() - datetime.timedelta(days=self.days)
         except OverflowError:
@@ -248,6 +328,8 @@ class Command(BaseCommand):
                 models_to_cleanup.add(m)
         if not models_to_cleanup:
             models_to_cleanup.update(model_names)
+        # jobs are deleted in batches, each in its own transaction, so that
+        # locks aren't held (and work isn't lost) for the whole run
         with disable_activity_stream(), disable_computed_fields():
             for m in model_names:
                 if m in models_to_cleanup:
@@ -256,3 +338,14 @@ class Command(BaseCommand):
                         self.logger.log(99, '%s: %d would be deleted, %d would be skipped.', m.replace('_', ' '), deleted, skipped)
                     else:
                         self.logger.log(99, '%s: %d deleted, %d skipped.', m.replace('_', ' '), deleted, skipped)
+        # partitions are dropped once the jobs are gone, each in its own
+        # (brief) transaction
+        for m in model_names:
+            if m in models_to_cleanup and m in self.event_models:
+                dropped, deleted = self.cleanup_events(*self.event_models[m])
+                if self.dry_run:
+                    self.logger.log(99, '%s events: %d partitions would be dropped, %d events would be deleted.',
+                                    m.replace('_', ' '), dropped, deleted)
+                else:
+                    self.logger.log(99, '%s events: %d partitions dropped, %d events deleted.',
+                                    m.replace('_', ' '), dropped, deleted)
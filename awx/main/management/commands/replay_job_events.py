@@ -10,14 +10,7 @@ from django.utils import timezone
 from django.core.management.base import BaseCommand
 
 from awx.main.models.events import emit_event_detail
-from awx.main.models import (
-    UnifiedJob,
-    Job,
-    AdHocCommand,
-    ProjectUpdate,
-    InventoryUpdate,
-    SystemJob
-)
+from awx.main.models import UnifiedJob
 
 
 class JobStatusLifeCycle():
@@ -74,16 +67,7 @@ class ReplayJobEvents(JobStatusLifeCycle):
         return self.replay_elapsed().total_seconds() - (self.recording_elapsed(created).total_seconds() * (1.0 / speed))
 
     def get_job_events(self, job):
-        if type(job) is Job:
-            job_events = job.job_events.order_by('created')
-        elif type(job) is AdHocCommand:
-            job_events = job.ad_hoc_command_events.order_by('created')
-        elif type(job) is ProjectUpdate:
-            job_events = job.project_update_events.order_by('created')
-        elif type(job) is InventoryUpdate:
-            job_events = job.inventory_update_events.order_by('created')
-        elif type(job) is SystemJob:
-            job_events = job.system_job_events.order_by('created')
+        job_events = job.get_event_queryset().order_by('created')
         count = job_events.count()
         if count == 0:
             raise RuntimeError("No events for job id {}".format(job.id))
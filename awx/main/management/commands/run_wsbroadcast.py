@@ -81,14 +81,17 @@ class Command(BaseCommand):
 
     @classmethod
     def get_connection_stats(cls, me, hostnames, data):
-        host_stats = [('hostname', 'total', 'per minute')]
+        host_stats = [('hostname', 'total', 'per minute', 'bytes', 'groups')]
         for h in hostnames:
             h_safe = safe_name(h)
             prefix = f'awx_{h_safe}'
             messages_total = data.get(f'{prefix}_messages_received', '0')
             messages_per_minute = data.get(f'{prefix}_messages_received_per_minute', '0')
+            bytes_total = data.get(f'{prefix}_bytes_received', '0')
+            groups = data.get(f'{prefix}_subscribed_groups', '0')
 
-            host_stats.append((h, str(int(messages_total)), str(int(messages_per_minute))))
+            host_stats.append((h, str(int(messages_total)), str(int(messages_per_minute)),
+                               str(int(bytes_total)), str(int(groups))))
 
         return host_stats
 
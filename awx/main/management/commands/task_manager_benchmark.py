@@ -0,0 +1,71 @@
+# Copyright (c) 2020 Ansible by Red Hat
+# All Rights Reserved.
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from awx.main.scheduler.benchmark import PHASES, seed, complete_started, run_cycle
+
+
+class Command(BaseCommand):
+    """
+    Seed pending jobs and measure task manager scheduling cycles against them.
+    Everything (including the jobs the task manager starts) is rolled back
+    when the command exits, and no work is dispatched.
+    """
+
+    help = 'Measure task manager scheduling cycles against generated pending jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=1000,
+                            help='Number of pending jobs to create (default=1000)')
+        parser.add_argument('--instance-groups', type=int, default=1,
+                            help='Number of instance groups to spread jobs across (default=1)')
+        parser.add_argument('--instances', type=int, default=1,
+                            help='Number of instances in each instance group (default=1)')
+        parser.add_argument('--capacity', type=int, default=100,
+                            help='Capacity of each instance (default=100)')
+        parser.add_argument('--projects', type=int, default=1,
+                            help='Number of projects (default=1)')
+        parser.add_argument('--project-updates', action='store_true', default=False,
+                            help='Update projects on launch')
+        parser.add_argument('--inventories', type=int, default=1,
+                            help='Number of inventories (default=1)')
+        parser.add_argument('--inventory-sources', type=int, default=0,
+                            help='Number of update-on-launch sources per inventory (default=0)')
+        parser.add_argument('--cycles', type=int, default=5,
+                            help='Number of scheduling cycles to run (default=5)')
+        parser.add_argument('--complete', action='store_true', default=False,
+                            help='Mark started jobs successful between cycles, freeing capacity')
+
+    def handle(self, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('Warning: timings are only representative against PostgreSQL.')
+        with transaction.atomic():
+            seeded = seed(
+                jobs=options['jobs'], instance_groups=options['instance_groups'],
+                instances=options['instances'], capacity=options['capacity'],
+                projects=options['projects'], project_updates=options['project_updates'],
+                inventories=options['inventories'], inventory_sources=options['inventory_sources'],
+            )
+            self.stdout.write('Seeded {} pending jobs across {} instance group(s) (START_TASK_LIMIT={}).'.format(
+                len(seeded.jobs), len(seeded.instance_groups), settings.START_TASK_LIMIT
+            ))
+            for cycle in range(options['cycles']):
+                timer = run_cycle()
+                started = timer.calls['start_task']
+                self.stdout.write('')
+                self.stdout.write('cycle {}: started {} task(s) in {:.3f}s ({:.1f}/s), {} queries'.format(
+                    cycle + 1, started, timer.seconds['total'],
+                    started / timer.seconds['total'], timer.queries['total']
+                ))
+                self.stdout.write('  {:<36} {:>7} {:>11} {:>9}'.format('phase', 'calls', 'time (ms)', 'queries'))
+                for name in PHASES:
+                    if timer.calls[name]:
+                        self.stdout.write('  {:<36} {:>7} {:>11.1f} {:>9}'.format(
+                            name, timer.calls[name], timer.seconds[name] * 1000, timer.queries[name]
+                        ))
+                if options['complete']:
+                    complete_started(seeded)
+            transaction.set_rollback(True)
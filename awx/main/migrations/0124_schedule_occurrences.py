@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0123_drop_hg_support'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schedule',
+            name='next_run',
+            field=models.DateTimeField(db_index=True, default=None, editable=False, help_text='The next time that the scheduled action will run.', null=True),
+        ),
+        migrations.CreateModel(
+            name='ScheduleOccurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_time', models.DateTimeField(db_index=True)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='main.Schedule')),
+            ],
+            options={
+                'unique_together': {('schedule', 'run_time')},
+            },
+        ),
+    ]
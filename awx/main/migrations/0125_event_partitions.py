@@ -0,0 +1,264 @@
+# Generated by Django 2.2.16 on 2026-10-18 12:00
+
+import awx.main.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+EVENT_TABLES = (
+    'main_jobevent', 'main_inventoryupdateevent',
+    'main_projectupdateevent', 'main_adhoccommandevent',
+    'main_systemjobevent'
+)
+
+
+def partition_event_tables(apps, schema_editor):
+    # replace each event table with one that is range partitioned by the
+    # created time of the job that each event belongs to; partitions are
+    # created as jobs run (see awx.main.utils.db.create_partition)
+    #
+    # copying billions of existing events into the new tables would take
+    # hours, so the existing tables are kept (with an _unpartitioned_ prefix)
+    # and jobs created before this migration read their events from there
+    # until cleanup_jobs drops them
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tblname in EVENT_TABLES:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [tblname])
+            indexes = cursor.fetchall()
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [tblname])
+            sequence = cursor.fetchone()[0]
+
+            cursor.execute(f'ALTER TABLE {tblname} RENAME TO _unpartitioned_{tblname}')
+            for indexname, indexdef in indexes:
+                cursor.execute(f'ALTER INDEX {indexname} RENAME TO _unpartitioned_{indexname}')
+
+            cursor.execute(
+                f'CREATE TABLE {tblname} (LIKE _unpartitioned_{tblname} INCLUDING DEFAULTS) '
+                f'PARTITION BY RANGE (job_created)'
+            )
+            # the primary key of a partitioned table has to include the
+            # partition key
+            cursor.execute(f'ALTER TABLE {tblname} ADD PRIMARY KEY (id, job_created)')
+            # keep ids unique across both tables, and keep the sequence when
+            # the old table is dropped
+            cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {tblname}.id')
+            for indexname, indexdef in indexes:
+                if indexname != f'{tblname}_pkey':
+                    # indexdef still refers to the table by its original name
+                    cursor.execute(indexdef)
+
+            # nothing to keep (e.g., a new install)
+            cursor.execute(f'SELECT 1 FROM _unpartitioned_{tblname} LIMIT 1')
+            empty = cursor.fetchone() is None
+            cursor.execute('SELECT to_regclass(%s)', [f'_old_{tblname}'])
+            if empty and cursor.fetchone()[0] is None:
+                cursor.execute(f'DROP TABLE _unpartitioned_{tblname}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0124_schedule_occurrences'),
+    ]
+
+    operations = [
+        # foreign keys from partitioned tables would have to be enforced on
+        # every partition; events are removed by dropping partitions instead
+        # of cascading from their jobs
+        migrations.AlterField(
+            model_name='adhoccommandevent',
+            name='ad_hoc_command',
+            field=models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ad_hoc_command_events', to='main.AdHocCommand'),
+        ),
+        migrations.AlterField(
+            model_name='adhoccommandevent',
+            name='host',
+            field=models.ForeignKey(db_constraint=False, default=None, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ad_hoc_command_events', to='main.Host'),
+        ),
+        migrations.AlterField(
+            model_name='inventoryupdateevent',
+            name='inventory_update',
+            field=models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='inventory_update_events', to='main.InventoryUpdate'),
+        ),
+        migrations.AlterField(
+            model_name='jobevent',
+            name='host',
+            field=models.ForeignKey(db_constraint=False, default=None, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job_events_as_primary_host', to='main.Host'),
+        ),
+        migrations.AlterField(
+            model_name='jobevent',
+            name='job',
+            field=models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='job_events', to='main.Job'),
+        ),
+        migrations.AlterField(
+            model_name='projectupdateevent',
+            name='project_update',
+            field=models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='project_update_events', to='main.ProjectUpdate'),
+        ),
+        migrations.AlterField(
+            model_name='systemjobevent',
+            name='system_job',
+            field=models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='system_job_events', to='main.SystemJob'),
+        ),
+        migrations.AddField(
+            model_name='adhoccommandevent',
+            name='job_created',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='inventoryupdateevent',
+            name='job_created',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='jobevent',
+            name='job_created',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectupdateevent',
+            name='job_created',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemjobevent',
+            name='job_created',
+            field=models.DateTimeField(default=None, editable=False, null=True),
+        ),
+        migrations.RunPython(partition_event_tables),
+        # the original tables of jobs created before this migration
+        migrations.CreateModel(
+            name='UnpartitionedAdHocCommandEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=None, editable=False)),
+                ('modified', models.DateTimeField(default=None, editable=False)),
+                ('event_data', awx.main.fields.JSONField(blank=True, default=dict)),
+                ('uuid', models.CharField(default='', editable=False, max_length=1024)),
+                ('counter', models.PositiveIntegerField(default=0, editable=False)),
+                ('stdout', models.TextField(default='', editable=False)),
+                ('verbosity', models.PositiveIntegerField(default=0, editable=False)),
+                ('start_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('end_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('job_created', models.DateTimeField(default=None, editable=False, null=True)),
+                ('event', models.CharField(choices=[('runner_on_failed', 'Host Failed'), ('runner_on_ok', 'Host OK'), ('runner_on_unreachable', 'Host Unreachable'), ('runner_on_skipped', 'Host Skipped'), ('debug', 'Debug'), ('verbose', 'Verbose'), ('deprecated', 'Deprecated'), ('warning', 'Warning'), ('system_warning', 'System Warning'), ('error', 'Error')], max_length=100)),
+                ('failed', models.BooleanField(default=False, editable=False)),
+                ('changed', models.BooleanField(default=False, editable=False)),
+                ('host_name', models.CharField(default='', editable=False, max_length=1024)),
+                ('ad_hoc_command', models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.AdHocCommand')),
+                ('host', models.ForeignKey(db_constraint=False, default=None, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.Host')),
+            ],
+            options={
+                'db_table': '_unpartitioned_main_adhoccommandevent',
+                'ordering': ('-pk',),
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UnpartitionedInventoryUpdateEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=None, editable=False)),
+                ('modified', models.DateTimeField(default=None, editable=False)),
+                ('event_data', awx.main.fields.JSONField(blank=True, default=dict)),
+                ('uuid', models.CharField(default='', editable=False, max_length=1024)),
+                ('counter', models.PositiveIntegerField(default=0, editable=False)),
+                ('stdout', models.TextField(default='', editable=False)),
+                ('verbosity', models.PositiveIntegerField(default=0, editable=False)),
+                ('start_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('end_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('job_created', models.DateTimeField(default=None, editable=False, null=True)),
+                ('inventory_update', models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.InventoryUpdate')),
+            ],
+            options={
+                'db_table': '_unpartitioned_main_inventoryupdateevent',
+                'ordering': ('-pk',),
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UnpartitionedJobEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True, default=None, editable=False, null=True)),
+                ('modified', models.DateTimeField(default=None, editable=False)),
+                ('event', models.CharField(choices=[('runner_on_failed', 'Host Failed'), ('runner_on_start', 'Host Started'), ('runner_on_ok', 'Host OK'), ('runner_on_error', 'Host Failure'), ('runner_on_skipped', 'Host Skipped'), ('runner_on_unreachable', 'Host Unreachable'), ('runner_on_no_hosts', 'No Hosts Remaining'), ('runner_on_async_poll', 'Host Polling'), ('runner_on_async_ok', 'Host Async OK'), ('runner_on_async_failed', 'Host Async Failure'), ('runner_item_on_ok', 'Item OK'), ('runner_item_on_failed', 'Item Failed'), ('runner_item_on_skipped', 'Item Skipped'), ('runner_retry', 'Host Retry'), ('runner_on_file_diff', 'File Difference'), ('playbook_on_start', 'Playbook Started'), ('playbook_on_notify', 'Running Handlers'), ('playbook_on_include', 'Including File'), ('playbook_on_no_hosts_matched', 'No Hosts Matched'), ('playbook_on_no_hosts_remaining', 'No Hosts Remaining'), ('playbook_on_task_start', 'Task Started'), ('playbook_on_vars_prompt', 'Variables Prompted'), ('playbook_on_setup', 'Gathering Facts'), ('playbook_on_import_for_host', 'internal: on Import for Host'), ('playbook_on_not_import_for_host', 'internal: on Not Import for Host'), ('playbook_on_play_start', 'Play Started'), ('playbook_on_stats', 'Playbook Complete'), ('debug', 'Debug'), ('verbose', 'Verbose'), ('deprecated', 'Deprecated'), ('warning', 'Warning'), ('system_warning', 'System Warning'), ('error', 'Error')], max_length=100)),
+                ('event_data', awx.main.fields.JSONField(blank=True, default=dict)),
+                ('failed', models.BooleanField(default=False, editable=False)),
+                ('changed', models.BooleanField(default=False, editable=False)),
+                ('uuid', models.CharField(default='', editable=False, max_length=1024)),
+                ('playbook', models.CharField(default='', editable=False, max_length=1024)),
+                ('play', models.CharField(default='', editable=False, max_length=1024)),
+                ('role', models.CharField(default='', editable=False, max_length=1024)),
+                ('task', models.CharField(default='', editable=False, max_length=1024)),
+                ('counter', models.PositiveIntegerField(default=0, editable=False)),
+                ('stdout', models.TextField(default='', editable=False)),
+                ('verbosity', models.PositiveIntegerField(default=0, editable=False)),
+                ('start_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('end_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('job_created', models.DateTimeField(default=None, editable=False, null=True)),
+                ('host_name', models.CharField(default='', editable=False, max_length=1024)),
+                ('parent_uuid', models.CharField(default='', editable=False, max_length=1024)),
+                ('host', models.ForeignKey(db_constraint=False, default=None, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.Host')),
+                ('job', models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.Job')),
+            ],
+            options={
+                'db_table': '_unpartitioned_main_jobevent',
+                'ordering': ('pk',),
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UnpartitionedProjectUpdateEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True, default=None, editable=False, null=True)),
+                ('modified', models.DateTimeField(default=None, editable=False)),
+                ('event', models.CharField(choices=[('runner_on_failed', 'Host Failed'), ('runner_on_start', 'Host Started'), ('runner_on_ok', 'Host OK'), ('runner_on_error', 'Host Failure'), ('runner_on_skipped', 'Host Skipped'), ('runner_on_unreachable', 'Host Unreachable'), ('runner_on_no_hosts', 'No Hosts Remaining'), ('runner_on_async_poll', 'Host Polling'), ('runner_on_async_ok', 'Host Async OK'), ('runner_on_async_failed', 'Host Async Failure'), ('runner_item_on_ok', 'Item OK'), ('runner_item_on_failed', 'Item Failed'), ('runner_item_on_skipped', 'Item Skipped'), ('runner_retry', 'Host Retry'), ('runner_on_file_diff', 'File Difference'), ('playbook_on_start', 'Playbook Started'), ('playbook_on_notify', 'Running Handlers'), ('playbook_on_include', 'Including File'), ('playbook_on_no_hosts_matched', 'No Hosts Matched'), ('playbook_on_no_hosts_remaining', 'No Hosts Remaining'), ('playbook_on_task_start', 'Task Started'), ('playbook_on_vars_prompt', 'Variables Prompted'), ('playbook_on_setup', 'Gathering Facts'), ('playbook_on_import_for_host', 'internal: on Import for Host'), ('playbook_on_not_import_for_host', 'internal: on Not Import for Host'), ('playbook_on_play_start', 'Play Started'), ('playbook_on_stats', 'Playbook Complete'), ('debug', 'Debug'), ('verbose', 'Verbose'), ('deprecated', 'Deprecated'), ('warning', 'Warning'), ('system_warning', 'System Warning'), ('error', 'Error')], max_length=100)),
+                ('event_data', awx.main.fields.JSONField(blank=True, default=dict)),
+                ('failed', models.BooleanField(default=False, editable=False)),
+                ('changed', models.BooleanField(default=False, editable=False)),
+                ('uuid', models.CharField(default='', editable=False, max_length=1024)),
+                ('playbook', models.CharField(default='', editable=False, max_length=1024)),
+                ('play', models.CharField(default='', editable=False, max_length=1024)),
+                ('role', models.CharField(default='', editable=False, max_length=1024)),
+                ('task', models.CharField(default='', editable=False, max_length=1024)),
+                ('counter', models.PositiveIntegerField(default=0, editable=False)),
+                ('stdout', models.TextField(default='', editable=False)),
+                ('verbosity', models.PositiveIntegerField(default=0, editable=False)),
+                ('start_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('end_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('job_created', models.DateTimeField(default=None, editable=False, null=True)),
+                ('project_update', models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.ProjectUpdate')),
+            ],
+            options={
+                'db_table': '_unpartitioned_main_projectupdateevent',
+                'ordering': ('pk',),
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UnpartitionedSystemJobEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=None, editable=False)),
+                ('modified', models.DateTimeField(default=None, editable=False)),
+                ('event_data', awx.main.fields.JSONField(blank=True, default=dict)),
+                ('uuid', models.CharField(default='', editable=False, max_length=1024)),
+                ('counter', models.PositiveIntegerField(default=0, editable=False)),
+                ('stdout', models.TextField(default='', editable=False)),
+                ('verbosity', models.PositiveIntegerField(default=0, editable=False)),
+                ('start_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('end_line', models.PositiveIntegerField(default=0, editable=False)),
+                ('job_created', models.DateTimeField(default=None, editable=False, null=True)),
+                ('system_job', models.ForeignKey(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.SystemJob')),
+            ],
+            options={
+                'db_table': '_unpartitioned_main_systemjobevent',
+                'ordering': ('-pk',),
+                'managed': False,
+            },
+        ),
+    ]
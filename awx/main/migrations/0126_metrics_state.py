@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 12:00
+
+import awx.main.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0125_event_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TowerMetricsState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gauges', models.TextField(default='')),
+                ('gauges_updated', models.DateTimeField(default=None, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='InstanceMetrics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counters', awx.main.fields.JSONField(blank=True, default=dict)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('instance', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.Instance')),
+            ],
+        ),
+    ]
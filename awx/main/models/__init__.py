@@ -31,18 +31,19 @@ from awx.main.models.jobs import (  # noqa
 )
 from awx.main.models.events import (  # noqa
     AdHocCommandEvent, InventoryUpdateEvent, JobEvent, ProjectUpdateEvent,
-    SystemJobEvent,
+    SystemJobEvent, UnpartitionedAdHocCommandEvent, UnpartitionedInventoryUpdateEvent,
+    UnpartitionedJobEvent, UnpartitionedProjectUpdateEvent, UnpartitionedSystemJobEvent,
 )
 from awx.main.models.ad_hoc_commands import AdHocCommand # noqa
-from awx.main.models.schedules import Schedule # noqa
+from awx.main.models.schedules import Schedule, ScheduleOccurrence # noqa
 from awx.main.models.activity_stream import ActivityStream # noqa
 from awx.main.models.ha import (  # noqa
-    Instance, InstanceGroup, TowerScheduleState,
+    Instance, InstanceGroup, InstanceMetrics, TowerMetricsState, TowerScheduleState,
 )
 from awx.main.models.rbac import (  # noqa
     Role, batch_role_ancestor_rebuilding, get_roles_on_resource,
-    role_summary_fields_generator, ROLE_SINGLETON_SYSTEM_ADMINISTRATOR,
-    ROLE_SINGLETON_SYSTEM_AUDITOR,
+    role_summary_fields_generator, invalidate_access_cache,
+    ROLE_SINGLETON_SYSTEM_ADMINISTRATOR, ROLE_SINGLETON_SYSTEM_AUDITOR,
 )
 from awx.main.models.mixins import (  # noqa
     CustomVirtualEnvMixin, ResourceMixin, SurveyJobMixin,
@@ -2,6 +2,7 @@
 
 import datetime
 import logging
+import time
 from collections import defaultdict
 
 from django.conf import settings
@@ -17,7 +18,8 @@ from awx.api.versioning import reverse
 from awx.main import consumers
 from awx.main.fields import JSONField
 from awx.main.models.base import CreatedModifiedModel
-from awx.main.utils import ignore_inventory_computed_fields, camelcase_to_underscore
+from awx.main.utils import ignore_inventory_computed_fields
+from awx.main.utils.db import create_partition, predates_event_partitions, table_exists
 
 analytics_logger = logging.getLogger('awx.analytics.job_events')
 
@@ -25,7 +27,9 @@ logger = logging.getLogger('awx.main.models.events')
 
 
 __all__ = ['JobEvent', 'ProjectUpdateEvent', 'AdHocCommandEvent',
-           'InventoryUpdateEvent', 'SystemJobEvent']
+           'InventoryUpdateEvent', 'SystemJobEvent', 'UnpartitionedJobEvent',
+           'UnpartitionedProjectUpdateEvent', 'UnpartitionedAdHocCommandEvent',
+           'UnpartitionedInventoryUpdateEvent', 'UnpartitionedSystemJobEvent']
 
 
 def sanitize_event_keys(kwargs, valid_keys):
@@ -65,29 +69,52 @@ MINIMAL_EVENTS = set([
 ])
 
 
+class EventRateLimiter(object):
+    '''
+    Counts the websocket events sent per job channel in one second windows,
+    so that a single very chatty job can't flood its subscribers.
+    '''
+
+    MAX_CHANNELS = 1000
+
+    def __init__(self):
+        self.windows = {}
+
+    def allow(self, channel, limit):
+        second = int(time.time())
+        window = self.windows.get(channel)
+        if window is None or window[0] != second:
+            if len(self.windows) >= self.MAX_CHANNELS:
+                self.windows = {k: v for k, v in self.windows.items() if v[0] == second}
+            window = self.windows[channel] = [second, 0]
+        window[1] += 1
+        if window[1] == limit + 1:
+            logger.debug(f'{channel} exceeded {limit} websocket events per second, dropping events')
+        return window[1] <= limit
+
+
+event_rate_limiter = EventRateLimiter()
+
+
 def emit_event_detail(event):
     if (
         settings.UI_LIVE_UPDATES_ENABLED is False and
         event.event not in MINIMAL_EVENTS
     ):
         return
-    cls = event.__class__
-    relation = {
-        JobEvent: 'job_id',
-        AdHocCommandEvent: 'ad_hoc_command_id',
-        ProjectUpdateEvent: 'project_update_id',
-        InventoryUpdateEvent: 'inventory_update_id',
-        SystemJobEvent: 'system_job_id',
-    }[cls]
+    # the same for events stored in the partitioned and _unpartitioned_ tables
+    relation = '{}_id'.format(event.JOB_REFERENCE)
+    group = '{}_events'.format(event.JOB_REFERENCE)
     url = ''
-    if isinstance(event, JobEvent):
-        url = '/api/v2/job_events/{}'.format(event.id)
-    if isinstance(event, AdHocCommandEvent):
-        url = '/api/v2/ad_hoc_command_events/{}'.format(event.id)
-    group = camelcase_to_underscore(cls.__name__) + 's'
+    if event.JOB_REFERENCE in ('job', 'ad_hoc_command'):
+        url = '/api/v2/{}/{}'.format(group, event.id)
+    channel = '-'.join([group, str(getattr(event, relation))])
+    limit = settings.UI_LIVE_UPDATES_MAX_EVENTS_PER_SECOND
+    if limit and event.event not in MINIMAL_EVENTS and not event_rate_limiter.allow(channel, limit):
+        return
     timestamp = event.created.isoformat()
     consumers.emit_channel_notification(
-        '-'.join([group, str(getattr(event, relation))]),
+        channel,
         {
             'id': event.id,
             relation.replace('_id', ''): getattr(event, relation),
@@ -123,7 +150,7 @@ class BasePlaybookEvent(CreatedModifiedModel):
     VALID_KEYS = [
         'event', 'event_data', 'playbook', 'play', 'role', 'task', 'created',
         'counter', 'uuid', 'stdout', 'parent_uuid', 'start_line', 'end_line',
-        'host_id', 'host_name', 'verbosity',
+        'host_id', 'host_name', 'verbosity', 'job_created',
     ]
 
     class Meta:
@@ -272,6 +299,27 @@ class BasePlaybookEvent(CreatedModifiedModel):
         editable=False,
         db_index=True,
     )
+    job_created = models.DateTimeField(
+        null=True,
+        default=None,
+        editable=False,
+    )
+
+    def save(self, *args, **kwargs):
+        # the callback receiver stamps job_created on every event it saves;
+        # events saved any other way take it from their job, so that they end
+        # up in the partition (or _unpartitioned_ table) where lookups for
+        # that job's events look
+        if self.job_created is None:
+            self.job_created = getattr(self, self.JOB_REFERENCE).created
+        if self.pk is None and self._meta.managed:
+            if predates_event_partitions(self.job_created):
+                event = unpartitioned_event(self)
+                event.save(*args, **kwargs)
+                self.pk = event.pk
+                return
+            create_partition(self._meta.db_table, self.job_created)
+        super().save(*args, **kwargs)
 
     @property
     def event_level(self):
@@ -348,39 +396,9 @@ class BasePlaybookEvent(CreatedModifiedModel):
                 self.changed = bool(sum(changed_dict.values()))
             except (AttributeError, TypeError):
                 pass
-
-            if isinstance(self, JobEvent):
-                try:
-                    job = self.job
-                except ObjectDoesNotExist:
-                    job = None
-                if job:
-                    hostnames = self._hostnames()
-                    self._update_host_summary_from_stats(set(hostnames))
-                    if job.inventory:
-                        try:
-                            job.inventory.update_computed_fields()
-                        except DatabaseError:
-                            logger.exception('Computed fields database error saving event {}'.format(self.pk))
-
-                    # find parent links and progagate changed=T and failed=T
-                    changed = job.job_events.filter(changed=True).exclude(parent_uuid=None).only('parent_uuid').values_list('parent_uuid', flat=True).distinct()  # noqa
-                    failed = job.job_events.filter(failed=True).exclude(parent_uuid=None).only('parent_uuid').values_list('parent_uuid', flat=True).distinct()  # noqa
-
-                    JobEvent.objects.filter(
-                        job_id=self.job_id, uuid__in=changed
-                    ).update(changed=True)
-                    JobEvent.objects.filter(
-                        job_id=self.job_id, uuid__in=failed
-                    ).update(failed=True)
-
-                    # send success/failure notifications when we've finished handling the playbook_on_stats event
-                    from awx.main.tasks import handle_success_and_failure_notifications  # circular import
-
-                    def _send_notifications():
-                        handle_success_and_failure_notifications.apply_async([job.id])
-                    connection.on_commit(_send_notifications)
-
+            # for JobEvents, the (expensive) remaining side effects of
+            # playbook_on_stats are deferred until after the event is saved;
+            # see JobEvent.process_playbook_on_stats
 
         for field in ('playbook', 'play', 'task', 'role'):
             value = force_text(event_data.get(field, '')).strip()
@@ -442,30 +460,24 @@ class BasePlaybookEvent(CreatedModifiedModel):
         return 0
 
 
-class JobEvent(BasePlaybookEvent):
+class BaseJobEvent(BasePlaybookEvent):
     '''
     An event/message logged from the callback when running a job.
     '''
 
     VALID_KEYS = BasePlaybookEvent.VALID_KEYS + ['job_id', 'workflow_job_id']
+    JOB_REFERENCE = 'job'
 
     class Meta:
-        app_label = 'main'
-        ordering = ('pk',)
-        index_together = [
-            ('job', 'event'),
-            ('job', 'uuid'),
-            ('job', 'start_line'),
-            ('job', 'end_line'),
-            ('job', 'parent_uuid'),
-        ]
+        abstract = True
 
     id = models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')
     job = models.ForeignKey(
         'Job',
         related_name='job_events',
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
         editable=False,
+        db_constraint=False,
     )
     host = models.ForeignKey(
         'Host',
@@ -474,6 +486,7 @@ class JobEvent(BasePlaybookEvent):
         default=None,
         on_delete=models.SET_NULL,
         editable=False,
+        db_constraint=False,
     )
     host_name = models.CharField(
         max_length=1024,
@@ -501,6 +514,53 @@ class JobEvent(BasePlaybookEvent):
             pass
         return hostnames
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super().save(*args, **kwargs)
+        # the callback receiver bulk inserts events (without calling save())
+        # and defers their playbook_on_stats itself; _state.adding is still
+        # set if a copy was saved to the _unpartitioned_ table in its place
+        # (which deferred it already)
+        if created and self.event == 'playbook_on_stats' and not self._state.adding:
+            connection.on_commit(self.defer_playbook_on_stats)
+
+    def defer_playbook_on_stats(self):
+        '''
+        Dispatch the side effects of a saved playbook_on_stats event to the
+        task dispatcher, so the callback receiver doesn't block on them.
+        '''
+        from awx.main.tasks import process_playbook_on_stats  # circular import
+        process_playbook_on_stats.apply_async([self.pk, self.job_id], {'host_map': getattr(self, 'host_map', {})})
+
+    def process_playbook_on_stats(self):
+        '''
+        Build host summaries, recompute inventory computed fields, and send
+        notifications for the job.  (changed/failed flags are propagated to
+        parent events by the callback receiver as events are saved; the
+        set-based pass here catches any parents it gave up on.)
+        '''
+        try:
+            job = self.job
+        except ObjectDoesNotExist:
+            job = None
+        if not job:
+            return
+        job.propagate_parent_changes()
+        hostnames = self._hostnames()
+        self._update_host_summary_from_stats(set(hostnames))
+        if job.inventory:
+            try:
+                job.inventory.update_computed_fields()
+            except DatabaseError:
+                logger.exception('Computed fields database error saving event {}'.format(self.pk))
+
+        # send success/failure notifications when we've finished handling the playbook_on_stats event
+        from awx.main.tasks import handle_success_and_failure_notifications  # circular import
+
+        def _send_notifications():
+            handle_success_and_failure_notifications.apply_async([job.id])
+        connection.on_commit(_send_notifications)
+
     def _update_host_summary_from_stats(self, hostnames):
         with ignore_inventory_computed_fields():
             try:
@@ -565,26 +625,35 @@ class JobEvent(BasePlaybookEvent):
         return self.job.verbosity
 
 
-class ProjectUpdateEvent(BasePlaybookEvent):
-
-    VALID_KEYS = BasePlaybookEvent.VALID_KEYS + ['project_update_id', 'workflow_job_id']
+class JobEvent(BaseJobEvent):
 
     class Meta:
         app_label = 'main'
         ordering = ('pk',)
         index_together = [
-            ('project_update', 'event'),
-            ('project_update', 'uuid'),
-            ('project_update', 'start_line'),
-            ('project_update', 'end_line'),
+            ('job', 'event'),
+            ('job', 'uuid'),
+            ('job', 'start_line'),
+            ('job', 'end_line'),
+            ('job', 'parent_uuid'),
         ]
 
+
+class BaseProjectUpdateEvent(BasePlaybookEvent):
+
+    VALID_KEYS = BasePlaybookEvent.VALID_KEYS + ['project_update_id', 'workflow_job_id']
+    JOB_REFERENCE = 'project_update'
+
+    class Meta:
+        abstract = True
+
     id = models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')
     project_update = models.ForeignKey(
         'ProjectUpdate',
         related_name='project_update_events',
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
         editable=False,
+        db_constraint=False,
     )
 
     @property
@@ -592,6 +661,19 @@ class ProjectUpdateEvent(BasePlaybookEvent):
         return 'localhost'
 
 
+class ProjectUpdateEvent(BaseProjectUpdateEvent):
+
+    class Meta:
+        app_label = 'main'
+        ordering = ('pk',)
+        index_together = [
+            ('project_update', 'event'),
+            ('project_update', 'uuid'),
+            ('project_update', 'start_line'),
+            ('project_update', 'end_line'),
+        ]
+
+
 class BaseCommandEvent(CreatedModifiedModel):
     '''
     An event/message logged from a command for each host.
@@ -599,7 +681,7 @@ class BaseCommandEvent(CreatedModifiedModel):
 
     VALID_KEYS = [
         'event_data', 'created', 'counter', 'uuid', 'stdout', 'start_line',
-        'end_line', 'verbosity'
+        'end_line', 'verbosity', 'job_created',
     ]
 
     class Meta:
@@ -634,10 +716,31 @@ class BaseCommandEvent(CreatedModifiedModel):
         default=0,
         editable=False,
     )
+    job_created = models.DateTimeField(
+        null=True,
+        default=None,
+        editable=False,
+    )
 
     def __str__(self):
         return u'%s @ %s' % (self.get_event_display(), self.created.isoformat())
 
+    def save(self, *args, **kwargs):
+        # the callback receiver stamps job_created on every event it saves;
+        # events saved any other way take it from their job, so that they end
+        # up in the partition (or _unpartitioned_ table) where lookups for
+        # that job's events look
+        if self.job_created is None:
+            self.job_created = getattr(self, self.JOB_REFERENCE).created
+        if self.pk is None and self._meta.managed:
+            if predates_event_partitions(self.job_created):
+                event = unpartitioned_event(self)
+                event.save(*args, **kwargs)
+                self.pk = event.pk
+                return
+            create_partition(self._meta.db_table, self.job_created)
+        super().save(*args, **kwargs)
+
     @classmethod
     def create_from_data(cls, **kwargs):
         #
@@ -686,21 +789,15 @@ class BaseCommandEvent(CreatedModifiedModel):
         pass
 
 
-class AdHocCommandEvent(BaseCommandEvent):
+class BaseAdHocCommandEvent(BaseCommandEvent):
 
     VALID_KEYS = BaseCommandEvent.VALID_KEYS + [
         'ad_hoc_command_id', 'event', 'host_name', 'host_id', 'workflow_job_id'
     ]
+    JOB_REFERENCE = 'ad_hoc_command'
 
     class Meta:
-        app_label = 'main'
-        ordering = ('-pk',)
-        index_together = [
-            ('ad_hoc_command', 'event'),
-            ('ad_hoc_command', 'uuid'),
-            ('ad_hoc_command', 'start_line'),
-            ('ad_hoc_command', 'end_line'),
-        ]
+        abstract = True
 
     EVENT_TYPES = [
         # (event, verbose name, failed)
@@ -747,8 +844,9 @@ class AdHocCommandEvent(BaseCommandEvent):
     ad_hoc_command = models.ForeignKey(
         'AdHocCommand',
         related_name='ad_hoc_command_events',
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
         editable=False,
+        db_constraint=False,
     )
     host = models.ForeignKey(
         'Host',
@@ -757,6 +855,7 @@ class AdHocCommandEvent(BaseCommandEvent):
         default=None,
         on_delete=models.SET_NULL,
         editable=False,
+        db_constraint=False,
     )
     host_name = models.CharField(
         max_length=1024,
@@ -781,25 +880,34 @@ class AdHocCommandEvent(BaseCommandEvent):
         )
 
 
-class InventoryUpdateEvent(BaseCommandEvent):
-
-    VALID_KEYS = BaseCommandEvent.VALID_KEYS + ['inventory_update_id', 'workflow_job_id']
+class AdHocCommandEvent(BaseAdHocCommandEvent):
 
     class Meta:
         app_label = 'main'
         ordering = ('-pk',)
         index_together = [
-            ('inventory_update', 'uuid'),
-            ('inventory_update', 'start_line'),
-            ('inventory_update', 'end_line'),
+            ('ad_hoc_command', 'event'),
+            ('ad_hoc_command', 'uuid'),
+            ('ad_hoc_command', 'start_line'),
+            ('ad_hoc_command', 'end_line'),
         ]
 
+
+class BaseInventoryUpdateEvent(BaseCommandEvent):
+
+    VALID_KEYS = BaseCommandEvent.VALID_KEYS + ['inventory_update_id', 'workflow_job_id']
+    JOB_REFERENCE = 'inventory_update'
+
+    class Meta:
+        abstract = True
+
     id = models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')
     inventory_update = models.ForeignKey(
         'InventoryUpdate',
         related_name='inventory_update_events',
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
         editable=False,
+        db_constraint=False,
     )
 
     @property
@@ -815,25 +923,33 @@ class InventoryUpdateEvent(BaseCommandEvent):
         return False
 
 
-class SystemJobEvent(BaseCommandEvent):
-
-    VALID_KEYS = BaseCommandEvent.VALID_KEYS + ['system_job_id']
+class InventoryUpdateEvent(BaseInventoryUpdateEvent):
 
     class Meta:
         app_label = 'main'
         ordering = ('-pk',)
         index_together = [
-            ('system_job', 'uuid'),
-            ('system_job', 'start_line'),
-            ('system_job', 'end_line'),
+            ('inventory_update', 'uuid'),
+            ('inventory_update', 'start_line'),
+            ('inventory_update', 'end_line'),
         ]
 
+
+class BaseSystemJobEvent(BaseCommandEvent):
+
+    VALID_KEYS = BaseCommandEvent.VALID_KEYS + ['system_job_id']
+    JOB_REFERENCE = 'system_job'
+
+    class Meta:
+        abstract = True
+
     id = models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')
     system_job = models.ForeignKey(
         'SystemJob',
         related_name='system_job_events',
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
         editable=False,
+        db_constraint=False,
     )
 
     @property
@@ -847,3 +963,155 @@ class SystemJobEvent(BaseCommandEvent):
     @property
     def changed(self):
         return False
+
+
+class SystemJobEvent(BaseSystemJobEvent):
+
+    class Meta:
+        app_label = 'main'
+        ordering = ('-pk',)
+        index_together = [
+            ('system_job', 'uuid'),
+            ('system_job', 'start_line'),
+            ('system_job', 'end_line'),
+        ]
+
+
+# Events for jobs created before the event tables were partitioned stay in the
+# original tables, which were renamed with an _unpartitioned_ prefix (see
+# predates_event_partitions); nothing references these tables, since
+# cleanup_jobs drops them once their jobs are gone
+class UnpartitionedJobEvent(BaseJobEvent):
+
+    class Meta:
+        app_label = 'main'
+        managed = False
+        db_table = '_unpartitioned_main_jobevent'
+        ordering = ('pk',)
+
+    job = models.ForeignKey(
+        'Job',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+    host = models.ForeignKey(
+        'Host',
+        related_name='+',
+        null=True,
+        default=None,
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+
+
+class UnpartitionedProjectUpdateEvent(BaseProjectUpdateEvent):
+
+    class Meta:
+        app_label = 'main'
+        managed = False
+        db_table = '_unpartitioned_main_projectupdateevent'
+        ordering = ('pk',)
+
+    project_update = models.ForeignKey(
+        'ProjectUpdate',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+
+
+class UnpartitionedAdHocCommandEvent(BaseAdHocCommandEvent):
+
+    class Meta:
+        app_label = 'main'
+        managed = False
+        db_table = '_unpartitioned_main_adhoccommandevent'
+        ordering = ('-pk',)
+
+    ad_hoc_command = models.ForeignKey(
+        'AdHocCommand',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+    host = models.ForeignKey(
+        'Host',
+        related_name='+',
+        null=True,
+        default=None,
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+
+
+class UnpartitionedInventoryUpdateEvent(BaseInventoryUpdateEvent):
+
+    class Meta:
+        app_label = 'main'
+        managed = False
+        db_table = '_unpartitioned_main_inventoryupdateevent'
+        ordering = ('-pk',)
+
+    inventory_update = models.ForeignKey(
+        'InventoryUpdate',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+
+
+class UnpartitionedSystemJobEvent(BaseSystemJobEvent):
+
+    class Meta:
+        app_label = 'main'
+        managed = False
+        db_table = '_unpartitioned_main_systemjobevent'
+        ordering = ('-pk',)
+
+    system_job = models.ForeignKey(
+        'SystemJob',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        editable=False,
+        db_constraint=False,
+    )
+
+
+UNPARTITIONED_EVENT_MODELS = {
+    JobEvent: UnpartitionedJobEvent,
+    ProjectUpdateEvent: UnpartitionedProjectUpdateEvent,
+    AdHocCommandEvent: UnpartitionedAdHocCommandEvent,
+    InventoryUpdateEvent: UnpartitionedInventoryUpdateEvent,
+    SystemJobEvent: UnpartitionedSystemJobEvent,
+}
+
+
+def unpartitioned_event(event):
+    '''
+    Return a copy of an unsaved event that is saved in the _unpartitioned_
+    table of its model
+    '''
+    cls = UNPARTITIONED_EVENT_MODELS[type(event)]
+    copy = cls()
+    # field values, plus what the callback receiver attaches (e.g., host_map)
+    copy.__dict__.update((k, v) for k, v in event.__dict__.items() if k != '_state')
+    return copy
+
+
+def unpartitioned_event_model(model):
+    '''
+    Return the model of the _unpartitioned_ table of an event model, or None
+    if that table doesn't exist (it's only there on upgraded installs, until
+    cleanup_jobs drops it)
+    '''
+    cls = UNPARTITIONED_EVENT_MODELS.get(model)
+    if cls is None or not table_exists(cls._meta.db_table):
+        return None
+    return cls
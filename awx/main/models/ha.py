@@ -24,7 +24,7 @@ from awx.main.models.unified_jobs import UnifiedJob
 from awx.main.utils import get_cpu_capacity, get_mem_capacity, get_system_task_capacity
 from awx.main.models.mixins import RelatedJobsMixin
 
-__all__ = ('Instance', 'InstanceGroup', 'TowerScheduleState')
+__all__ = ('Instance', 'InstanceGroup', 'InstanceMetrics', 'TowerMetricsState', 'TowerScheduleState')
 
 
 class HasPolicyEditsMixin(HasEditsMixin):
@@ -298,6 +298,29 @@ class TowerScheduleState(SingletonModel):
     schedule_last_run = models.DateTimeField(auto_now_add=True)
 
 
+class TowerMetricsState(SingletonModel):
+    '''
+    The serialized gauges served by /api/v2/metrics/, which are the same on
+    every node, so one node at a time computes them for all of them.
+    '''
+    gauges = models.TextField(default='')
+    gauges_updated = models.DateTimeField(null=True, default=None)
+
+
+class InstanceMetrics(models.Model):
+    '''
+    A copy of a node's metrics counters (which are kept in the node's redis),
+    so that the metrics endpoint of every node can serve them.
+    '''
+    instance = models.OneToOneField(
+        Instance,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    counters = JSONField(blank=True, default=dict)
+    modified = models.DateTimeField(auto_now=True)
+
+
 def schedule_policy_task():
     from awx.main.tasks import apply_cluster_membership_policies
     connection.on_commit(lambda: apply_cluster_membership_policies.apply_async())
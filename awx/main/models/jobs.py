@@ -32,7 +32,9 @@ from awx.main.models.base import (
     JOB_TYPE_CHOICES, NEW_JOB_TYPE_CHOICES, VERBOSITY_CHOICES,
     VarsDictProperty
 )
-from awx.main.models.events import JobEvent, SystemJobEvent
+from awx.main.models.events import (
+    JobEvent, SystemJobEvent, UnpartitionedJobEvent, UnpartitionedSystemJobEvent
+)
 from awx.main.models.unified_jobs import (
     UnifiedJobTemplate, UnifiedJob
 )
@@ -631,8 +633,22 @@ class Job(UnifiedJob, JobOptions, SurveyJobMixin, JobNotificationMixin, TaskMana
 
     @property
     def event_class(self):
+        if self.has_unpartitioned_events:
+            return UnpartitionedJobEvent
         return JobEvent
 
+    def propagate_parent_changes(self):
+        '''
+        Mark every event of this job with a changed (or failed) child as
+        changed (or failed) itself, in one set-based pass over the job's
+        events.  The callback receiver does this as events are saved; this is
+        its fallback for parents it gave up on (see CallbackBrokerWorker).
+        '''
+        events = self.get_event_queryset()
+        for field in ('changed', 'failed'):
+            parents = events.filter(**{field: True}).exclude(parent_uuid=None).values_list('parent_uuid', flat=True).distinct()
+            events.filter(uuid__in=parents, **{field: False}).update(**{field: True})
+
     def copy_unified_job(self, **new_prompts):
         # Needed for job slice relaunch consistency, do no re-spawn workflow job
         # target same slice as original job
@@ -1280,6 +1296,8 @@ class SystemJob(UnifiedJob, SystemJobOptions, JobNotificationMixin):
 
     @property
     def event_class(self):
+        if self.has_unpartitioned_events:
+            return UnpartitionedSystemJobEvent
         return SystemJobEvent
 
     @property
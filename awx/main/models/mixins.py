@@ -20,7 +20,7 @@ from django.utils.translation import ugettext_lazy as _
 # AWX
 from awx.main.models.base import prevent_search
 from awx.main.models.rbac import (
-    Role, RoleAncestorEntry, get_roles_on_resource
+    Role, RoleAncestorEntry, cached_accessible_ids, get_roles_on_resource
 )
 from awx.main.utils import parse_yaml_or_json, get_custom_venv_choices, get_licenser
 from awx.main.utils.encryption import decrypt_value, get_encryption_key, is_encrypted
@@ -71,15 +71,19 @@ class ResourceMixin(models.Model):
                                                  object_id=accessor.id)
 
         if content_types is None:
-            ct_kwarg = dict(content_type_id = ContentType.objects.get_for_model(cls).id)
+            content_types = [ContentType.objects.get_for_model(cls).id]
+            ct_kwarg = dict(content_type_id = content_types[0])
         else:
             ct_kwarg = dict(content_type_id__in = content_types)
 
-        return RoleAncestorEntry.objects.filter(
+        pk_qs = RoleAncestorEntry.objects.filter(
             ancestor__in = ancestor_roles,
             role_field = role_field,
             **ct_kwarg
         ).values_list('object_id').distinct()
+        if type(accessor) == User and settings.RBAC_ACCESS_CACHE_SECONDS:
+            return cached_accessible_ids(accessor, role_field, content_types, pk_qs)
+        return pk_qs
 
 
     @staticmethod
@@ -6,8 +6,12 @@ import logging
 import threading
 import contextlib
 import re
+import time
+from uuid import uuid4
 
 # Django
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models, transaction, connection
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -23,7 +27,9 @@ __all__ = [
     'get_roles_on_resource',
     'ROLE_SINGLETON_SYSTEM_ADMINISTRATOR',
     'ROLE_SINGLETON_SYSTEM_AUDITOR',
-    'role_summary_fields_generator'
+    'role_summary_fields_generator',
+    'cached_accessible_ids',
+    'invalidate_access_cache',
 ]
 
 logger = logging.getLogger('awx.main.models.rbac')
@@ -77,6 +83,10 @@ role_descriptions = {
 
 tls = threading.local() # thread local storage
 
+# the number of role ids bound as parameters in each rebuild statement;
+# SQLite allows up to 999
+ROLE_ANCESTRY_BATCH_SIZE = 500
+
 
 def check_singleton(func):
     '''
@@ -235,64 +245,40 @@ class Role(models.Model):
         # =================================================
         #
         #   When something changes in our role "hierarchy", we need to update
-        #   the `Role.ancestors` mapping to reflect these changes. The basic
-        #   idea, which the code in this method is modeled after, is to do
-        #   this: When a change happens to a role's parents list, we update
-        #   that role's ancestry list, then we recursively update any child
-        #   roles ancestry lists.  Because our role relationships are not
-        #   strictly hierarchical, and can even have loops, this process may
-        #   necessarily visit the same nodes more than once. To handle this
-        #   without having to keep track of what should be updated (again) and
-        #   in what order, we simply use the termination condition of stopping
-        #   when our stored ancestry list matches what our list should be, eg,
-        #   when nothing changes. This can be simply implemented:
-        #
-        #      if actual_ancestors != stored_ancestors:
-        #          for id in actual_ancestors - stored_ancestors:
-        #              self.ancestors.add(id)
-        #          for id in stored_ancestors - actual_ancestors:
-        #              self.ancestors.remove(id)
+        #   the `Role.ancestors` mapping to reflect these changes. When a
+        #   change happens to a role's parents list, the ancestry lists of
+        #   that role and of all of its descendents may change, and every
+        #   other role's list stays the same. So we:
         #
-        #          for child in self.children.all():
-        #              child.rebuild_role_ancestor_list()
+        #     1. find the changed roles and all of their descendents (the
+        #        affected roles),
+        #     2. compute the ancestry lists the affected roles should have,
+        #     3. compare those to the stored lists, and insert the missing
+        #        entries and delete the extra ones.
         #
-        #   However this results in a lot of calls to the database, so the
-        #   optimized implementation below effectively does this same thing,
-        #   but we update all children at once, so effectively we sweep down
-        #   through our hierarchy one layer at a time instead of one node at a
-        #   time. Because of how this method works, we can also start from many
-        #   roots at once and sweep down a large set of roles, which we take
-        #   advantage of when performing bulk operations.
+        #   Because we can start from many roles at once, this is also what
+        #   bulk operations use (see batch_role_ancestor_rebuilding).
         #
         #
         # SQL Breakdown
         # =============
-        #   We operate under the assumption that our parent's ancestor list is
-        #   correct, thus we can always compute what our ancestor list should
-        #   be by taking the union of our parent's ancestor lists and adding
-        #   our self reference entry where ancestor_id = descendent_id
-        #
-        #   The DELETE query deletes all entries in the ancestor table that
-        #   should no longer be there (as determined by the NOT EXISTS query,
-        #   which checks to see if the ancestor is still an ancestor of one
-        #   or more of our parents)
-        #
-        #   The INSERT query computes the list of what our ancestor maps should
-        #   be, and inserts any missing entries.
-        #
-        #   Once complete, we select all of the children for the roles we are
-        #   working with, this list becomes the new role list we are working
-        #   with.
+        #   Steps 1 and 2 are a single recursive query (see
+        #   `role_ancestry`): the `affected` CTE walks down the parents table
+        #   from the changed roles, and the `closure` CTE walks back up from
+        #   every affected role, collecting all of its ancestors. Since these
+        #   use UNION, each role is visited once per path, and loops in the
+        #   hierarchy terminate.
         #
-        #   When our delete or insert query return that they have not performed
-        #   any work, then we know that our children will also not need to be
-        #   updated, and so we can terminate our loop.
+        #   Step 3 happens in memory, and the differences are written with
+        #   batched DELETE and INSERT statements (see `apply_role_ancestry`).
         #
         #
 
         if len(additions) == 0 and len(removals) == 0:
             return
 
+        invalidate_access_cache()
+
         global tls
         batch_role_rebuilding = getattr(tls, 'batch_role_rebuilding', False)
 
@@ -301,108 +287,22 @@ class Role(models.Model):
             getattr(tls, 'removals').update(set(removals))
             return
 
-        cursor = connection.cursor()
-        loop_ct = 0
-
-        sql_params = {
-            'ancestors_table': Role.ancestors.through._meta.db_table,
-            'parents_table': Role.parents.through._meta.db_table,
-            'roles_table': Role._meta.db_table,
-        }
-
-        # SQLlite has a 1M sql statement limit.. since the django sqllite
-        # driver isn't letting us pass in the ids through the preferred
-        # parameter binding system, this function exists to obey this.
-        # est max 12 bytes per number, used up to 2 times in a query,
-        # minus 4k of padding for the other parts of the query, leads us
-        # to the magic number of 41496, or 40000 for a nice round number
-        def split_ids_for_sqlite(role_ids):
-            for i in range(0, len(role_ids), 40000):
-                yield role_ids[i:i + 40000]
-
-
-        with transaction.atomic():
-            while len(additions) > 0 or len(removals) > 0:
-                if loop_ct > 100:
-                    raise Exception('Role ancestry rebuilding error: infinite loop detected')
-                loop_ct += 1
-
-                delete_ct = 0
-                if len(removals) > 0:
-                    for ids in split_ids_for_sqlite(removals):
-                        sql_params['ids'] = ','.join(str(x) for x in ids)
-                        cursor.execute('''
-                            DELETE FROM %(ancestors_table)s
-                            WHERE descendent_id IN (%(ids)s)
-                                  AND descendent_id != ancestor_id
-                                  AND NOT EXISTS (
-                                      SELECT 1
-                                        FROM %(parents_table)s as parents
-                                             INNER JOIN %(ancestors_table)s as inner_ancestors
-                                                     ON (parents.to_role_id = inner_ancestors.descendent_id)
-                                       WHERE parents.from_role_id = %(ancestors_table)s.descendent_id
-                                             AND %(ancestors_table)s.ancestor_id = inner_ancestors.ancestor_id
-                                  )
-                        ''' % sql_params)
-
-                        delete_ct += cursor.rowcount
-
-                insert_ct = 0
-                if len(additions) > 0:
-                    for ids in split_ids_for_sqlite(additions):
-                        sql_params['ids'] = ','.join(str(x) for x in ids)
-                        cursor.execute('''
-                            INSERT INTO %(ancestors_table)s (descendent_id, ancestor_id, role_field, content_type_id, object_id)
-                            SELECT from_id, to_id, new_ancestry_list.role_field, new_ancestry_list.content_type_id, new_ancestry_list.object_id FROM  (
-                                  SELECT roles.id from_id,
-                                         ancestors.ancestor_id to_id,
-                                         roles.role_field,
-                                         COALESCE(roles.content_type_id, 0) content_type_id,
-                                         COALESCE(roles.object_id, 0) object_id
-                                    FROM %(roles_table)s as roles
-                                         INNER JOIN %(parents_table)s as parents
-                                                 ON (parents.from_role_id = roles.id)
-                                         INNER JOIN %(ancestors_table)s as ancestors
-                                                 ON (parents.to_role_id = ancestors.descendent_id)
-                                   WHERE roles.id IN (%(ids)s)
-
-                                   UNION
-
-                                  SELECT id from_id,
-                                         id to_id,
-                                         role_field,
-                                         COALESCE(content_type_id, 0) content_type_id,
-                                         COALESCE(object_id, 0) object_id
-                                   from %(roles_table)s WHERE id IN (%(ids)s)
-                             ) new_ancestry_list
-                             WHERE NOT EXISTS (
-                                SELECT 1 FROM %(ancestors_table)s
-                                 WHERE %(ancestors_table)s.descendent_id = new_ancestry_list.from_id
-                                       AND %(ancestors_table)s.ancestor_id = new_ancestry_list.to_id
-                             )
-
-                        ''' % sql_params)
-                        insert_ct += cursor.rowcount
-
-                if insert_ct == 0 and delete_ct == 0:
-                    break
-
-                new_additions = set()
-                for ids in split_ids_for_sqlite(additions):
-                    sql_params['ids'] = ','.join(str(x) for x in ids)
-                    # get all children for the roles we're operating on
-                    cursor.execute('SELECT DISTINCT from_role_id FROM %(parents_table)s WHERE to_role_id IN (%(ids)s)' % sql_params)
-                    new_additions.update([row[0] for row in cursor.fetchall()])
-                additions = list(new_additions)
-
-                new_removals = set()
-                for ids in split_ids_for_sqlite(removals):
-                    sql_params['ids'] = ','.join(str(x) for x in ids)
-                    # get all children for the roles we're operating on
-                    cursor.execute('SELECT DISTINCT from_role_id FROM %(parents_table)s WHERE to_role_id IN (%(ids)s)' % sql_params)
-                    new_removals.update([row[0] for row in cursor.fetchall()])
-                removals = list(new_removals)
-
+        started = time.time()
+        role_ids = sorted(set(additions) | set(removals))
+        ancestry = set()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for i in range(0, len(role_ids), ROLE_ANCESTRY_BATCH_SIZE):
+                ids = role_ids[i:i + ROLE_ANCESTRY_BATCH_SIZE]
+                ancestry |= role_ancestry(
+                    cursor, 'id IN ({})'.format(', '.join(['%s'] * len(ids))), ids,
+                    include_descendents=True
+                )
+            missing, extra = diff_role_ancestry(cursor, ancestry)
+            apply_role_ancestry(cursor, missing, extra)
+        logger.debug(
+            'Rebuilt the ancestry of %d roles (%d entries added, %d removed) in %.3fs',
+            len({descendent for descendent, _ in ancestry}), len(missing), len(extra), time.time() - started
+        )
 
     @staticmethod
     def visible_roles(user):
@@ -457,6 +357,160 @@ class RoleAncestorEntry(models.Model):
     object_id       = models.PositiveIntegerField(null=False)
 
 
+def role_ancestry(cursor, where, params, include_descendents=False):
+    '''
+    Computes the ancestry entries that the roles matching `where` (a
+    condition on the roles table) should have, returned as a set of
+    (descendent_id, ancestor_id) pairs. With `include_descendents`, the
+    entries of all of the descendents of those roles are included too.
+    '''
+    sql_params = {
+        'parents_table': Role.parents.through._meta.db_table,
+        'roles_table': Role._meta.db_table,
+        'where': where,
+        'seed': 'affected' if include_descendents else 'changed',
+    }
+    cursor.execute('''
+        WITH RECURSIVE changed(id) AS (
+            SELECT id FROM %(roles_table)s WHERE %(where)s
+        ), affected(id) AS (
+            SELECT id FROM changed
+            UNION
+            SELECT parents.from_role_id
+              FROM %(parents_table)s AS parents
+                   INNER JOIN affected ON (parents.to_role_id = affected.id)
+        ), closure(descendent_id, ancestor_id) AS (
+            SELECT id, id FROM %(seed)s
+            UNION
+            SELECT closure.descendent_id, parents.to_role_id
+              FROM closure
+                   INNER JOIN %(parents_table)s AS parents
+                           ON (parents.from_role_id = closure.ancestor_id)
+        )
+        SELECT descendent_id, ancestor_id FROM closure
+    ''' % sql_params, params)
+    return set(cursor.fetchall())
+
+
+def diff_role_ancestry(cursor, ancestry):
+    '''
+    Compares `ancestry` (see `role_ancestry`) to the entries stored for the
+    same descendent roles, returning the set of missing (descendent_id,
+    ancestor_id) pairs and the list of ids of extra (or duplicate) entries.
+    '''
+    descendents = sorted({descendent for descendent, _ in ancestry})
+    stored, extra = set(), []
+    for i in range(0, len(descendents), ROLE_ANCESTRY_BATCH_SIZE):
+        ids = descendents[i:i + ROLE_ANCESTRY_BATCH_SIZE]
+        cursor.execute(
+            'SELECT id, descendent_id, ancestor_id FROM {} WHERE descendent_id IN ({})'.format(
+                RoleAncestorEntry._meta.db_table, ', '.join(['%s'] * len(ids))
+            ),
+            ids
+        )
+        for pk, descendent, ancestor in cursor.fetchall():
+            if (descendent, ancestor) in ancestry and (descendent, ancestor) not in stored:
+                stored.add((descendent, ancestor))
+            else:
+                extra.append(pk)
+    return ancestry - stored, extra
+
+
+def apply_role_ancestry(cursor, missing, extra):
+    '''
+    Inserts the `missing` ancestry entries and deletes the `extra` ones, as
+    returned by `diff_role_ancestry`.
+    '''
+    for i in range(0, len(extra), ROLE_ANCESTRY_BATCH_SIZE):
+        ids = extra[i:i + ROLE_ANCESTRY_BATCH_SIZE]
+        cursor.execute(
+            'DELETE FROM {} WHERE id IN ({})'.format(
+                RoleAncestorEntry._meta.db_table, ', '.join(['%s'] * len(ids))
+            ),
+            ids
+        )
+    descendents = sorted({descendent for descendent, _ in missing})
+    roles = {}
+    for i in range(0, len(descendents), ROLE_ANCESTRY_BATCH_SIZE):
+        for role in Role.objects.filter(id__in=descendents[i:i + ROLE_ANCESTRY_BATCH_SIZE]).values(
+                'id', 'role_field', 'content_type_id', 'object_id'):
+            roles[role['id']] = role
+    RoleAncestorEntry.objects.bulk_create([
+        RoleAncestorEntry(
+            descendent_id=descendent,
+            ancestor_id=ancestor,
+            role_field=roles[descendent]['role_field'],
+            content_type_id=roles[descendent]['content_type_id'] or 0,
+            object_id=roles[descendent]['object_id'] or 0,
+        )
+        for descendent, ancestor in sorted(missing)
+    ], batch_size=ROLE_ANCESTRY_BATCH_SIZE)
+
+
+ACCESS_CACHE_GENERATION_KEY = 'awx_rbac_access_generation'
+
+
+def bump_access_cache_generation():
+    '''
+    Invalidates the accessible object ids cached on this node (see
+    `cached_accessible_ids`).
+    '''
+    cache.set(ACCESS_CACHE_GENERATION_KEY, uuid4().hex, None)
+
+
+def _invalidate_access_cache():
+    from awx.main.tasks import handle_role_changes
+    # the cache is local to each node: invalidate this node's right away, and
+    # every node's through the dispatcher's broadcast queue
+    bump_access_cache_generation()
+    handle_role_changes.delay()
+
+
+def invalidate_access_cache():
+    '''
+    Invalidates every user's cached accessible object ids (see
+    `cached_accessible_ids`), on every node, once the current transaction
+    commits.
+    '''
+    if not settings.RBAC_ACCESS_CACHE_SECONDS:
+        return
+    if not any(func is _invalidate_access_cache for _, func in connection.run_on_commit):
+        connection.on_commit(_invalidate_access_cache)
+
+
+def cached_accessible_ids(user, role_field, content_types, pk_qs):
+    '''
+    Returns the object ids selected by `pk_qs`, the accessible pk queryset of
+    `user` for `role_field` on `content_types`, from the cache; on a miss, the
+    queryset is evaluated and its ids are cached for
+    RBAC_ACCESS_CACHE_SECONDS.
+
+    Returns `pk_qs` itself when the ids can't be used: while the current
+    transaction holds an uncommitted role change, and for sets of more than
+    RBAC_ACCESS_CACHE_MAX_IDS ids, which filter more slowly as a list than
+    as the subquery.
+    '''
+    if any(func is _invalidate_access_cache for _, func in connection.run_on_commit):
+        return pk_qs
+    generation = cache.get(ACCESS_CACHE_GENERATION_KEY)
+    if generation is None:
+        cache.add(ACCESS_CACHE_GENERATION_KEY, uuid4().hex, None)
+        generation = cache.get(ACCESS_CACHE_GENERATION_KEY)
+    key = 'awx_rbac_access-{}-{}-{}-{}'.format(
+        generation, user.pk, '.'.join(str(ct) for ct in sorted(content_types)), role_field
+    )
+    ids = cache.get(key)
+    if ids is None:
+        limit = settings.RBAC_ACCESS_CACHE_MAX_IDS
+        ids = [object_id for (object_id,) in pk_qs[:limit + 1]]
+        if len(ids) > limit:
+            ids = False
+        cache.set(key, ids, settings.RBAC_ACCESS_CACHE_SECONDS)
+    if ids is False:
+        return pk_qs
+    return ids
+
+
 def get_roles_on_resource(resource, accessor):
     '''
     Returns a string list of the roles a accessor has for a given resource.
@@ -4,6 +4,8 @@
 import datetime
 import logging
 import re
+import threading
+from collections import OrderedDict
 
 import dateutil.rrule
 import dateutil.parser
@@ -11,7 +13,8 @@ from dateutil.tz import datetime_exists, tzutc
 from dateutil.zoneinfo import get_zonefile_instance
 
 # Django
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.db.models.query import QuerySet
 from django.utils.timezone import now, make_aware
 from django.utils.translation import ugettext_lazy as _
@@ -28,7 +31,7 @@ import pytz
 
 logger = logging.getLogger('awx.main.models.schedule')
 
-__all__ = ['Schedule']
+__all__ = ['Schedule', 'ScheduleOccurrence']
 
 
 UTC_TIMEZONES = {x: tzutc() for x in dateutil.parser.parserinfo().UTCZONE}
@@ -102,9 +105,15 @@ class Schedule(PrimordialModel, LaunchTimeConfig):
         null=True,
         default=None,
         editable=False,
+        db_index=True,
         help_text=_("The next time that the scheduled action will run.")
     )
 
+    # (rrule, date) -> parsed rrule; see cached_rrulestr
+    RRULE_CACHE_SIZE = 1000
+    rrule_cache = OrderedDict()
+    rrule_cache_lock = threading.Lock()
+
     @classmethod
     def get_zoneinfo(self):
         return sorted(get_zonefile_instance().zones)
@@ -225,6 +234,80 @@ class Schedule(PrimordialModel, LaunchTimeConfig):
                 pass
         return x
 
+    @classmethod
+    def cached_rrulestr(cls, rrule):
+        """
+        Schedule.rrulestr, cached by rule text.  The date is part of the key
+        because minutely and hourly rules are fast-forwarded relative to it.
+        """
+        key = (rrule, now().date())
+        with cls.rrule_cache_lock:
+            if key in cls.rrule_cache:
+                cls.rrule_cache.move_to_end(key)
+                return cls.rrule_cache[key]
+        parsed = Schedule.rrulestr(rrule)
+        with cls.rrule_cache_lock:
+            cls.rrule_cache[key] = parsed
+            while len(cls.rrule_cache) > cls.RRULE_CACHE_SIZE:
+                cls.rrule_cache.popitem(last=False)
+        return parsed
+
+    def upcoming_runs(self, after, count):
+        """
+        The next `count` runs of this schedule after `after` (in UTC)
+        """
+        runs = []
+        if count <= 0:
+            return runs
+        for run in Schedule.cached_rrulestr(self.rrule).xafter(after):
+            if not datetime_exists(run):
+                # skip imaginary dates, like 2:30 on DST boundaries
+                continue
+            runs.append(run.astimezone(pytz.utc))
+            if len(runs) >= count:
+                break
+        return runs
+
+    def reset_occurrences(self):
+        self.occurrences.all().delete()
+        if self.enabled:
+            ScheduleOccurrence.refill([self])
+
+    @classmethod
+    def advance(cls, schedules, run_now):
+        """
+        Move each of `schedules` on to its next run after `run_now`, using
+        (and topping up) the stored occurrences rather than parsing every
+        rrule, and save the new next_run values in bulk.
+        """
+        if not schedules:
+            return
+        with transaction.atomic():
+            # lock and re-read the schedules, so that one whose rrule was
+            # changed (or which was disabled) since `schedules` were loaded
+            # isn't topped up with runs of its old rrule; a concurrent save()
+            # waits for this to commit, then resets the occurrences itself
+            schedules = list(Schedule.objects.select_for_update().filter(
+                pk__in=[schedule.pk for schedule in schedules], enabled=True
+            ).order_by('pk'))
+            ScheduleOccurrence.objects.filter(schedule__in=schedules, run_time__lte=run_now).delete()
+            next_runs = ScheduleOccurrence.refill(schedules, after=run_now)
+            changed = []
+            for schedule in schedules:
+                next_run = next_runs.get(schedule.pk)
+                if next_run != schedule.next_run:
+                    schedule.next_run = next_run
+                    changed.append(schedule)
+            # like update_computed_fields, this leaves `modified` alone
+            Schedule.objects.bulk_update(changed, ['next_run'])
+        templates = {}
+        for schedule in changed:
+            emit_channel_notification('schedules-changed', dict(id=schedule.id, group_name='schedules'))
+            templates[schedule.unified_job_template_id] = schedule.unified_job_template
+        with ignore_inventory_computed_fields():
+            for template in templates.values():
+                template.update_computed_fields()
+
     def __str__(self):
         return u'%s_t%s_%s_%s' % (self.name, self.unified_job_template.id, self.id, self.next_run)
 
@@ -245,7 +328,7 @@ class Schedule(PrimordialModel, LaunchTimeConfig):
         for field_name in affects_fields:
             starting_values[field_name] = getattr(self, field_name)
 
-        future_rs = Schedule.rrulestr(self.rrule)
+        future_rs = Schedule.cached_rrulestr(self.rrule)
 
         if self.enabled:
             next_run_actual = future_rs.after(now())
@@ -281,6 +364,7 @@ class Schedule(PrimordialModel, LaunchTimeConfig):
         # in order for that method to be correct
         # by adding modified to update fields, we avoid updating modified time
         super(Schedule, self).save(update_fields=['next_run', 'dtstart', 'dtend', 'modified'])
+        self.reset_occurrences()
         with ignore_inventory_computed_fields():
             self.unified_job_template.update_computed_fields()
 
@@ -292,6 +376,7 @@ class Schedule(PrimordialModel, LaunchTimeConfig):
                 if field_name not in kwargs['update_fields']:
                     kwargs['update_fields'].append(field_name)
         super(Schedule, self).save(*args, **kwargs)
+        self.reset_occurrences()
         if changed:
             with ignore_inventory_computed_fields():
                 self.unified_job_template.update_computed_fields()
@@ -303,3 +388,52 @@ class Schedule(PrimordialModel, LaunchTimeConfig):
             with ignore_inventory_computed_fields():
                 ujt.update_computed_fields()
         return r
+
+
+class ScheduleOccurrence(models.Model):
+    '''
+    An upcoming run of a schedule.  The next few runs of each enabled schedule
+    are stored so that the periodic scheduler can move schedules on to their
+    next run without parsing their rrules every time.
+    '''
+
+    class Meta:
+        app_label = 'main'
+        unique_together = ('schedule', 'run_time')
+
+    schedule = models.ForeignKey(
+        'Schedule',
+        related_name='occurrences',
+        on_delete=models.CASCADE,
+    )
+    run_time = models.DateTimeField(
+        db_index=True,
+    )
+
+    @classmethod
+    def refill(cls, schedules, after=None):
+        """
+        Top up the stored runs after `after` of each of `schedules` to
+        settings.SCHEDULE_STORED_OCCURRENCES, returning {schedule id: next run}
+
+        New runs come from each schedule's rrule as given, so the schedules
+        should be current (see Schedule.advance).
+        """
+        after = after or now()
+        stored = {}
+        for schedule_id, run_time in cls.objects.filter(
+            schedule__in=schedules, run_time__gt=after
+        ).order_by('run_time').values_list('schedule_id', 'run_time'):
+            stored.setdefault(schedule_id, []).append(run_time)
+        new = []
+        next_runs = {}
+        for schedule in schedules:
+            runs = stored.get(schedule.pk, [])
+            missing = settings.SCHEDULE_STORED_OCCURRENCES - len(runs)
+            if missing > 0:
+                added = schedule.upcoming_runs(runs[-1] if runs else after, missing)
+                new.extend(cls(schedule_id=schedule.pk, run_time=run) for run in added)
+                runs = runs + added
+            next_runs[schedule.pk] = runs[0] if runs else None
+        cls.objects.bulk_create(new, ignore_conflicts=True)
+        return next_runs
@@ -16,6 +16,7 @@ from collections import OrderedDict
 
 # Django
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models, connection
 from django.core.exceptions import NON_FIELD_ERRORS
 from django.utils.translation import ugettext_lazy as _
@@ -47,6 +48,8 @@ from awx.main.utils import (
     get_type_for_model, parse_yaml_or_json, getattr_dne,
     polymorphic, schedule_task_manager
 )
+from awx.main.utils.db import predates_event_partitions
+from awx.main.utils.stdout_cache import StdoutArtifact
 from awx.main.constants import ACTIVE_STATES, CAN_CANCEL
 from awx.main.redact import UriCleaner, REPLACE_STR
 from awx.main.consumers import emit_channel_notification
@@ -548,6 +551,10 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
 
     PASSWORD_FIELDS = ('start_args',)
 
+    # how long a read remembers that a finished job's events are still being
+    # saved, before checking again whether its stdout artifact can be built
+    STDOUT_ARTIFACT_PENDING_SECONDS = 30
+
     class Meta:
         app_label = 'main'
         ordering = ('id',)
@@ -873,6 +880,9 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
 
         # If status changed, update the parent instance.
         if self.status != status_before:
+            from awx.main.analytics.metrics import inc_counter  # circular import
+            status = self.status
+            connection.on_commit(lambda: inc_counter('awx_job_status_transitions', status=status))
             # Update parent outside of the transaction for Job w/ allow_simultaneous=True
             # This dodges lock contention at the expense of the foreign key not being
             # completely correct.
@@ -996,8 +1006,31 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
             'main_systemjob': 'system_job_id',
         }[tablename]
 
+    @property
+    def has_unpartitioned_events(self):
+        '''
+        Jobs created before the event tables were partitioned keep their
+        events in the original (_unpartitioned_) tables
+        '''
+        return predates_event_partitions(self.created)
+
     def get_event_queryset(self):
-        return self.event_class.objects.filter(**{self.event_parent_key: self.id})
+        kwargs = {self.event_parent_key: self.id}
+        if not self.has_unpartitioned_events:
+            # all of a job's events are stored in the partition for the job's
+            # created time; filtering on it limits the lookup to that partition
+            kwargs['job_created'] = self.created
+        return self.event_class.objects.filter(**kwargs)
+
+    def _event_table_filter(self):
+        '''
+        The table and WHERE clause that select this job's events, for raw SQL
+        (see get_event_queryset)
+        '''
+        where = '{}={}'.format(self.event_parent_key, self.id)
+        if not self.has_unpartitioned_events:
+            where += " and job_created = '{}'".format(self.created.isoformat())
+        return self.event_class._meta.db_table, where
 
     @property
     def event_processing_finished(self):
@@ -1023,6 +1056,12 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
         """
         max_supported = settings.STDOUT_MAX_BYTES_DISPLAY
 
+        artifact = self._stdout_artifact()
+        if artifact is not None:
+            if enforce_max_bytes and artifact.size > max_supported:
+                raise StdoutMaxBytesExceeded(artifact.size, max_supported)
+            return artifact.open()
+
         if enforce_max_bytes:
             # If enforce_max_bytes is True, we're not grabbing the whole file,
             # just the first <settings.STDOUT_MAX_BYTES_DISPLAY> bytes;
@@ -1089,10 +1128,8 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
                 fd.write = lambda s: _write(smart_text(s))
 
                 cursor.copy_expert(
-                    "copy (select stdout from {} where {}={} and stdout != '' order by start_line) to stdout".format(
-                        self._meta.db_table + 'event',
-                        self.event_parent_key,
-                        self.id
+                    "copy (select stdout from {} where {} and stdout != '' order by start_line) to stdout".format(
+                        *self._event_table_filter()
                     ),
                     fd
                 )
@@ -1109,6 +1146,83 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
                     fd = StringIO(fd.getvalue().replace('\\r\\n', '\n'))
                     return fd
 
+    def result_stdout_raw_stream(self, chunk_lines=10000):
+        """
+        This method returns a generator which yields all stdout for the
+        UnifiedJob in chunks of text, without buffering the entire output
+        on disk or in memory.
+
+        Events are fetched with `COPY`, one window of `chunk_lines` lines
+        (by `start_line`) at a time, so memory use is bounded by the size of
+        a single window regardless of the total size of the output.
+        """
+        artifact = self._stdout_artifact()
+        if artifact is not None:
+            yield from artifact.iter_chunks()
+            return
+        yield from self._result_stdout_copy_chunks(chunk_lines)
+
+    def _result_stdout_copy_chunks(self, chunk_lines=10000):
+        legacy_stdout_text = self.result_stdout_text
+        if legacy_stdout_text:
+            yield legacy_stdout_text
+            return
+
+        last_line = self.get_event_queryset().aggregate(
+            last_line=models.Max('start_line')
+        )['last_line'] or 0
+
+        for window_start in range(0, last_line + 1, chunk_lines):
+            fd = StringIO()
+            # psycopg2's copy_expert writes bytes; decode on the fly
+            _write = fd.write
+            fd.write = lambda s: _write(smart_text(s))
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    "copy (select stdout from {} where {} and stdout != '' "
+                    "and start_line >= {} and start_line < {} order by start_line) to stdout".format(
+                        *self._event_table_filter(),
+                        window_start,
+                        window_start + chunk_lines
+                    ),
+                    fd
+                )
+            chunk = fd.getvalue().replace('\\r\\n', '\n')
+            if chunk:
+                yield chunk
+
+    def _stdout_artifact(self):
+        """
+        Return the on-disk stdout artifact for this job, or None if
+        `settings.STDOUT_CACHE_ENABLED` is off or the job's output is not final
+        yet.
+
+        Artifacts are local to each node, and are built by the first read on
+        that node once all of the job's events have been saved.  Until then,
+        the (node-local) cache remembers that the output isn't final for
+        `STDOUT_ARTIFACT_PENDING_SECONDS`, so that every read doesn't pay for
+        the COUNT behind `event_processing_finished`.
+        """
+        if not settings.STDOUT_CACHE_ENABLED:
+            return None
+        artifact = StdoutArtifact(self.model_to_str(), self.pk)
+        if artifact.exists():
+            return artifact
+        if self.status in ACTIVE_STATES:
+            return None
+        pending_key = 'stdout-artifact-pending-{}-{}'.format(artifact.name, artifact.pk)
+        if cache.get(pending_key):
+            return None
+        if not self.event_processing_finished:
+            cache.set(pending_key, True, self.STDOUT_ARTIFACT_PENDING_SECONDS)
+            return None
+        try:
+            artifact.build(self._result_stdout_copy_chunks())
+        except OSError:
+            logger.exception('Could not build stdout artifact for {}'.format(self.log_format))
+            return None
+        return artifact
+
     def _escape_ascii(self, content):
         # Remove ANSI escape sequences used to embed event data.
         content = re.sub(r'\x1b\[K(?:[A-Za-z0-9+/=]+\x1b\[\d+D)+\x1b\[K', '', content)
@@ -1132,7 +1246,88 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
     def result_stdout(self):
         return self._result_stdout_raw(escape_ascii=True)
 
+    @staticmethod
+    def _resolve_stdout_range(start_line, end_line, absolute_end):
+        start_line = int(start_line)
+        if start_line < 0:
+            return max(absolute_end + start_line, 0), absolute_end
+        start_actual = min(start_line, absolute_end)
+        if end_line is not None:
+            return start_actual, max(min(int(end_line), absolute_end), start_actual)
+        return start_actual, absolute_end
+
+    def _result_stdout_cached_range(self, start_line=0, end_line=None):
+        """
+        Fetch a range of stdout lines from the on-disk stdout artifact, if
+        there is one for this job; returns None otherwise.
+        """
+        artifact = self._stdout_artifact()
+        if artifact is None:
+            return None
+        absolute_end = artifact.lines
+        start_actual, end_actual = self._resolve_stdout_range(start_line, end_line, absolute_end)
+        content = artifact.read_lines(start_actual, end_actual)
+        max_supported = settings.STDOUT_MAX_BYTES_DISPLAY
+        if len(content) > max_supported:
+            raise StdoutMaxBytesExceeded(len(content), max_supported)
+        return content, start_actual, end_actual, absolute_end
+
+    def _result_stdout_raw_range(self, start_line=0, end_line=None):
+        """
+        Fetch a range of stdout lines using the `start_line` and `end_line`
+        columns on the event table, so that only the events which overlap
+        the requested range are read from the database.
+
+        Returns None if line-indexed events aren't available for this job
+        (legacy stdout, models without events, or events which were never
+        assigned line numbers), in which case callers should fall back to
+        reading the full output.
+        """
+        try:
+            event_qs = self.get_event_queryset()
+        except NotImplementedError:
+            return None
+        absolute_end = event_qs.aggregate(
+            absolute_end=models.Max('end_line')
+        )['absolute_end'] or 0
+        if absolute_end == 0 or self.result_stdout_text:
+            return None
+
+        start_actual, end_actual = self._resolve_stdout_range(start_line, end_line, absolute_end)
+        event_qs = event_qs.filter(
+            end_line__gt=start_actual, start_line__lt=end_actual
+        ).exclude(stdout='')
+        max_supported = settings.STDOUT_MAX_BYTES_DISPLAY
+        total = event_qs.aggregate(
+            total=models.Sum(models.Func(models.F('stdout'), function='LENGTH'))
+        )['total'] or 0
+        if total > max_supported:
+            raise StdoutMaxBytesExceeded(total, max_supported)
+
+        return_buffer = StringIO()
+        for event_start, stdout in event_qs.order_by('start_line').values_list(
+            'start_line', 'stdout'
+        ).iterator():
+            # mirror the output of `result_stdout_raw_handle`, where every
+            # event is written as a single newline-terminated row
+            event_lines = StringIO(stdout.replace('\r\n', '\n') + '\n').readlines()
+            for lineno, line in enumerate(event_lines, start=event_start):
+                if start_actual <= lineno < end_actual:
+                    return_buffer.write(line)
+        return return_buffer.getvalue(), start_actual, end_actual, absolute_end
+
     def _result_stdout_raw_limited(self, start_line=0, end_line=None, redact_sensitive=True, escape_ascii=False):
+        ranged = self._result_stdout_cached_range(start_line, end_line)
+        if ranged is None:
+            ranged = self._result_stdout_raw_range(start_line, end_line)
+        if ranged is not None:
+            return_buffer, start_actual, end_actual, absolute_end = ranged
+            if redact_sensitive:
+                return_buffer = UriCleaner.remove_sensitive(return_buffer)
+            if escape_ascii:
+                return_buffer = self._escape_ascii(return_buffer)
+            return return_buffer, start_actual, end_actual, absolute_end
+
         return_buffer = StringIO()
         if end_line is not None:
             end_line = int(end_line)
@@ -0,0 +1,197 @@
+# Copyright (c) 2020 Ansible by Red Hat
+# All Rights Reserved.
+
+'''
+Helpers for measuring the cost of a task manager scheduling cycle; used by the
+`task_manager_benchmark` management command and the scheduler benchmarks in
+the test suite.
+'''
+
+# Python
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+# Django
+from django.db import connection
+from django.db.models import Max
+from django.utils.timezone import now
+
+# AWX
+from awx.main.models import (
+    Instance,
+    InstanceGroup,
+    Inventory,
+    Job,
+    JobTemplate,
+    Organization,
+    Project,
+    UnifiedJob,
+)
+from awx.main.scheduler.task_manager import TaskManager
+from awx.main.signals import disable_activity_stream, disable_computed_fields
+
+
+__all__ = ['PHASES', 'seed', 'reset', 'complete_started', 'CycleTimer', 'run_cycle']
+
+
+# TaskManager methods which are timed individually; timings are inclusive, so
+# e.g., `process_tasks` includes `generate_dependencies`
+PHASES = (
+    'get_tasks',
+    'after_lock_init',
+    'process_finished_workflow_jobs',
+    'spawn_workflow_graph_jobs',
+    'timeout_approval_node',
+    'reap_jobs_from_orphaned_instances',
+    'process_tasks',
+    'calculate_capacity_consumed',
+    'process_running_tasks',
+    'generate_dependencies',
+    'process_pending_tasks',
+    'start_task',
+)
+
+
+def seed(jobs=100, instance_groups=1, instances=1, capacity=100, projects=1,
+         project_updates=False, inventories=1, inventory_sources=0,
+         prefix='tm-benchmark'):
+    '''
+    Create `jobs` pending jobs spread across `instance_groups` instance groups
+    of `instances` instances each.
+
+    Jobs are spread round-robin over one job template per
+    project/inventory pair; when `project_updates` is set the projects are
+    updated on launch, and each inventory gets `inventory_sources` sources
+    which are updated on launch.
+    '''
+    high_water = UnifiedJob.objects.aggregate(Max('pk'))['pk__max'] or 0
+    with disable_activity_stream(), disable_computed_fields():
+        org = Organization.objects.create(name=prefix)
+
+        groups = []
+        for g in range(instance_groups):
+            group = InstanceGroup.objects.create(name='{}-{}'.format(prefix, g))
+            for i in range(instances):
+                group.instances.add(Instance.objects.create(
+                    hostname='{}-{}-{}'.format(prefix, g, i), capacity=capacity
+                ))
+            groups.append(group)
+        # so project and inventory updates run on the seeded groups, too
+        org.instance_groups.add(*groups)
+
+        project_objs = []
+        for p in range(projects):
+            project = Project(
+                name='{}-{}'.format(prefix, p), organization=org,
+                scm_type='git', scm_url='https://github.com/ansible/test-playbooks',
+                scm_update_on_launch=project_updates, scm_update_cache_timeout=0
+            )
+            project.save(skip_update=True)
+            project_objs.append(project)
+
+        inventory_objs = []
+        for i in range(inventories):
+            inventory = Inventory.objects.create(name='{}-{}'.format(prefix, i), organization=org)
+            for s in range(inventory_sources):
+                inventory.inventory_sources.create(
+                    name='{}-{}-{}'.format(prefix, i, s), source='ec2',
+                    update_on_launch=True, update_cache_timeout=0
+                )
+            inventory_objs.append(inventory)
+
+        templates = []
+        for t, (project, inventory) in enumerate(
+            (p, i) for p in project_objs for i in inventory_objs
+        ):
+            jt = JobTemplate.objects.create(
+                name='{}-{}'.format(prefix, t), project=project, inventory=inventory,
+                playbook='debug.yml', allow_simultaneous=True
+            )
+            jt.instance_groups.add(groups[t % len(groups)])
+            templates.append(jt)
+
+        job_objs = []
+        for j in range(jobs):
+            jt = templates[j % len(templates)]
+            job_objs.append(Job.objects.create(
+                name='{}-{}'.format(prefix, j), job_template=jt,
+                project=jt.project, inventory=jt.inventory, playbook=jt.playbook,
+                organization=org, status='pending', launch_type='manual'
+            ))
+    return SimpleNamespace(jobs=job_objs, instance_groups=groups, high_water=high_water)
+
+
+def reset(seeded):
+    '''
+    Put seeded jobs back into the pending state, removing any dependencies
+    the task manager created for them.
+    '''
+    with disable_activity_stream():
+        UnifiedJob.objects.filter(pk__gt=seeded.high_water).exclude(
+            pk__in=[j.pk for j in seeded.jobs]
+        ).delete()
+        UnifiedJob.objects.filter(pk__in=[j.pk for j in seeded.jobs]).update(
+            status='pending', dependencies_processed=False, execution_node='',
+            instance_group=None, celery_task_id=''
+        )
+
+
+def complete_started(seeded):
+    '''
+    Mark everything the task manager started as successful, freeing capacity
+    for the next cycle.
+    '''
+    return UnifiedJob.objects.filter(
+        pk__gt=seeded.high_water, status__in=('waiting', 'running')
+    ).update(status='successful', finished=now())
+
+
+class CycleTimer(object):
+    '''
+    Record wall time, call counts and query counts for each of `PHASES` while
+    a TaskManager runs.
+    '''
+
+    def __init__(self, task_manager):
+        self.task_manager = task_manager
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.active = []
+        for name in PHASES:
+            setattr(task_manager, name, self.wrap(name, getattr(task_manager, name)))
+
+    def wrap(self, name, method):
+        def timed(*args, **kwargs):
+            self.active.append(name)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+                self.active.pop()
+        return timed
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries['total'] += 1
+        for name in set(self.active):
+            self.queries[name] += 1
+        return execute(sql, params, many, context)
+
+    def run(self):
+        start = time.perf_counter()
+        with connection.execute_wrapper(self.count_query):
+            self.task_manager._schedule()
+        self.seconds['total'] = time.perf_counter() - start
+        self.calls['total'] = 1
+        return self
+
+
+def run_cycle():
+    '''
+    Run one scheduling cycle (without the advisory lock taken by
+    `TaskManager.schedule`) and return its `CycleTimer`.
+    '''
+    return CycleTimer(TaskManager()).run()
@@ -0,0 +1,86 @@
+import heapq
+
+
+class CapacityIndex(object):
+    '''
+    Per instance group heaps of instances, used by the task manager to place
+    tasks without scanning every instance of a group for every pending task.
+
+    Instances are shared between the groups that contain them, so capacity
+    consumed through one group is seen by every other group.  Heaps are
+    updated lazily: placing a task pushes fresh entries for the instance
+    into each of its groups' heaps, and entries that no longer match the
+    instance are discarded when they reach the top.
+
+    Selection matches `InstanceGroup.fit_task_to_most_remaining_capacity_instance`
+    and `InstanceGroup.find_largest_idle_instance` when instances are given in
+    `hostname` order.
+    '''
+
+    def __init__(self):
+        self.instances = {}
+        # hostname -> position in hostname order, used to break ties
+        self.rank = {}
+        # hostname -> names of the groups containing the instance
+        self.memberships = {}
+        # group name -> heap of (-remaining_capacity, rank, hostname)
+        self.remaining = {}
+        # group name -> heap of (-capacity, rank, hostname) for idle instances
+        self.idle = {}
+
+    def add_instance(self, instance):
+        '''
+        Register an instance; instances must be added in hostname order.
+        '''
+        self.instances[instance.hostname] = instance
+        self.rank[instance.hostname] = len(self.rank)
+        self.memberships[instance.hostname] = set()
+
+    def add_group(self, name, instances):
+        remaining, idle = [], []
+        for instance in instances:
+            self.memberships[instance.hostname].add(name)
+            remaining.append(self._remaining_entry(instance))
+            if instance.jobs_running == 0:
+                idle.append((-instance.capacity, self.rank[instance.hostname], instance.hostname))
+        heapq.heapify(remaining)
+        heapq.heapify(idle)
+        self.remaining[name] = remaining
+        self.idle[name] = idle
+
+    def _remaining_entry(self, instance):
+        return (-instance.remaining_capacity, self.rank[instance.hostname], instance.hostname)
+
+    def fit_task_to_most_remaining_capacity_instance(self, group, impact):
+        '''
+        Return the instance of `group` with the most remaining capacity, if it
+        can fit a task of `impact`.
+        '''
+        heap = self.remaining.get(group, [])
+        while heap:
+            remaining, _, hostname = heap[0]
+            instance = self.instances[hostname]
+            if -remaining != instance.remaining_capacity:
+                heapq.heappop(heap)  # stale
+                continue
+            if instance.remaining_capacity >= impact:
+                return instance
+            return None
+        return None
+
+    def find_largest_idle_instance(self, group):
+        heap = self.idle.get(group, [])
+        while heap:
+            instance = self.instances[heap[0][2]]
+            if instance.jobs_running == 0:
+                return instance
+            # instances never become idle again within a cycle
+            heapq.heappop(heap)
+        return None
+
+    def consume(self, instance, impact):
+        instance.remaining_capacity = max(0, instance.remaining_capacity - impact)
+        instance.jobs_running += 1
+        entry = self._remaining_entry(instance)
+        for group in self.memberships[instance.hostname]:
+            heapq.heappush(self.remaining[group], entry)
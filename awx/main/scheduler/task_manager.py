@@ -14,9 +14,10 @@ from django.db import transaction, connection
 from django.utils.translation import ugettext_lazy as _, gettext_noop
 from django.utils.timezone import now as tz_now
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Q, OuterRef, Subquery
 
 # AWX
+from awx.main.dispatch import publisher
 from awx.main.dispatch.reaper import reap_job
 from awx.main.models import (
     AdHocCommand,
@@ -33,6 +34,7 @@ from awx.main.models import (
     WorkflowJob,
     WorkflowJobTemplate
 )
+from awx.main.scheduler.capacity import CapacityIndex
 from awx.main.scheduler.dag_workflow import WorkflowDAG
 from awx.main.utils.pglock import advisory_lock
 from awx.main.utils import get_type_for_model, task_manager_bulk_reschedule, schedule_task_manager
@@ -68,7 +70,7 @@ class TaskManager():
         '''
         Init AFTER we know this instance of the task manager will run because the lock is acquired.
         '''
-        instances = Instance.objects.filter(~Q(hostname=None), capacity__gt=0, enabled=True)
+        instances = Instance.objects.filter(~Q(hostname=None), capacity__gt=0, enabled=True).order_by('hostname')
         self.real_instances = {i.hostname: i for i in instances}
 
         instances_partial = [SimpleNamespace(obj=instance,
@@ -79,14 +81,21 @@ class TaskManager():
 
         instances_by_hostname = {i.hostname: i for i in instances_partial}
 
+        self.capacity_index = CapacityIndex()
+        for instance in instances_partial:
+            self.capacity_index.add_instance(instance)
+
         for rampart_group in InstanceGroup.objects.prefetch_related('instances'):
+            # instances_by_hostname only holds enabled instances with capacity
+            group_instances = sorted(
+                (instances_by_hostname[i.hostname] for i in rampart_group.instances.all() if i.hostname in instances_by_hostname),
+                key=lambda i: self.capacity_index.rank[i.hostname]
+            )
             self.graph[rampart_group.name] = dict(graph=DependencyGraph(rampart_group.name),
                                                   capacity_total=rampart_group.capacity,
                                                   consumed_capacity=0,
-                                                  instances=[])
-            for instance in rampart_group.instances.filter(capacity__gt=0, enabled=True).order_by('hostname'):
-                if instance.hostname in instances_by_hostname:
-                    self.graph[rampart_group.name]['instances'].append(instances_by_hostname[instance.hostname])
+                                                  instances=group_instances)
+            self.capacity_index.add_group(rampart_group.name, group_instances)
 
     def is_job_blocked(self, task):
         # TODO: I'm not happy with this, I think blocking behavior should be decided outside of the dependency graph
@@ -382,11 +391,19 @@ class TaskManager():
                 # Add task + all deps except self
                 dep.dependent_jobs.add(*([task] + [d for d in dependencies if d != dep]))
 
-    def get_latest_inventory_update(self, inventory_source):
-        latest_inventory_update = InventoryUpdate.objects.filter(inventory_source=inventory_source).order_by("-created")
-        if not latest_inventory_update.exists():
-            return None
-        return latest_inventory_update.first()
+    def get_latest_inventory_updates(self, inventory_source_ids):
+        '''
+        Map each inventory source id to its most recently created inventory
+        update (if any), in two queries regardless of the number of sources.
+        '''
+        latest = InventoryUpdate.objects.filter(inventory_source=OuterRef('pk')).order_by('-created').values('pk')[:1]
+        update_ids = InventorySource.objects.filter(id__in=inventory_source_ids).annotate(
+            latest_update_id=Subquery(latest)
+        ).exclude(latest_update_id=None).values_list('latest_update_id', flat=True)
+        return {
+            iu.inventory_source_id: iu
+            for iu in InventoryUpdate.objects.filter(id__in=list(update_ids)).select_related('inventory_source')
+        }
 
     def should_update_inventory_source(self, job, latest_inventory_update):
         now = tz_now()
@@ -408,11 +425,27 @@ class TaskManager():
             return True
         return False
 
-    def get_latest_project_update(self, job):
-        latest_project_update = ProjectUpdate.objects.filter(project=job.project, job_type='check').order_by("-created")
-        if not latest_project_update.exists():
-            return None
-        return latest_project_update.first()
+    def get_latest_project_updates(self, project_ids):
+        '''
+        Map each project id to its most recently created check project update
+        (if any), in two queries regardless of the number of projects.
+        '''
+        latest = ProjectUpdate.objects.filter(project=OuterRef('pk'), job_type='check').order_by('-created').values('pk')[:1]
+        update_ids = Project.objects.filter(id__in=project_ids).annotate(
+            latest_update_id=Subquery(latest)
+        ).exclude(latest_update_id=None).values_list('latest_update_id', flat=True)
+        return {
+            pu.project_id: pu
+            for pu in ProjectUpdate.objects.filter(id__in=list(update_ids)).select_related('project')
+        }
+
+    @staticmethod
+    def track_latest(latest_updates, key, update):
+        # keep the prefetched "latest update" maps current as dependencies
+        # are spawned, matching what a fresh order_by('-created') would find
+        current = latest_updates.get(key)
+        if current is None or update.created >= current.created:
+            latest_updates[key] = update
 
     def should_update_related_project(self, job, latest_project_update):
         now = tz_now()
@@ -449,33 +482,51 @@ class TaskManager():
 
     def generate_dependencies(self, undeped_tasks):
         created_dependencies = []
-        for task in undeped_tasks:
+        jobs = [task for task in undeped_tasks if type(task) is Job]
+
+        # look up everything the dependency decisions need up front, rather
+        # than with several queries per pending job
+        projects = Project.objects.filter(
+            id__in=set(job.project_id for job in jobs if job.project_id),
+            scm_update_on_launch=True
+        ).in_bulk()
+        latest_project_updates = self.get_latest_project_updates(list(projects))
+        inventory_sources = {}
+        for invsrc in self.all_inventory_sources:
+            inventory_sources.setdefault(invsrc.inventory_id, []).append(invsrc)
+        latest_inventory_updates = self.get_latest_inventory_updates(
+            [invsrc.id for invsrc in self.all_inventory_sources if invsrc.update_on_launch]
+        )
+
+        for task in jobs:
             dependencies = []
-            if not type(task) is Job:
-                continue
             # TODO: Can remove task.project None check after scan-job-default-playbook is removed
-            if task.project is not None and task.project.scm_update_on_launch is True:
-                latest_project_update = self.get_latest_project_update(task)
+            if task.project_id in projects:
+                latest_project_update = latest_project_updates.get(task.project_id)
                 if self.should_update_related_project(task, latest_project_update):
                     project_task = self.create_project_update(task)
+                    self.track_latest(latest_project_updates, task.project_id, project_task)
                     created_dependencies.append(project_task)
                     dependencies.append(project_task)
                 else:
                     dependencies.append(latest_project_update)
 
             # Inventory created 2 seconds behind job
-            try:
-                start_args = json.loads(decrypt_field(task, field_name="start_args"))
-            except ValueError:
-                start_args = dict()
-            for inventory_source in [invsrc for invsrc in self.all_inventory_sources if invsrc.inventory == task.inventory]:
-                if "inventory_sources_already_updated" in start_args and inventory_source.id in start_args['inventory_sources_already_updated']:
-                    continue
+            start_args = None
+            for inventory_source in inventory_sources.get(task.inventory_id, []):
                 if not inventory_source.update_on_launch:
                     continue
-                latest_inventory_update = self.get_latest_inventory_update(inventory_source)
+                if start_args is None:
+                    try:
+                        start_args = json.loads(decrypt_field(task, field_name="start_args"))
+                    except ValueError:
+                        start_args = dict()
+                if "inventory_sources_already_updated" in start_args and inventory_source.id in start_args['inventory_sources_already_updated']:
+                    continue
+                latest_inventory_update = latest_inventory_updates.get(inventory_source.id)
                 if self.should_update_inventory_source(task, latest_inventory_update):
                     inventory_task = self.create_inventory_update(task, inventory_source)
+                    self.track_latest(latest_inventory_updates, inventory_source.id, inventory_task)
                     created_dependencies.append(inventory_task)
                     dependencies.append(inventory_task)
                 else:
@@ -519,13 +570,12 @@ class TaskManager():
                                  rampart_group.name, remaining_capacity))
                     continue
 
-                execution_instance = InstanceGroup.fit_task_to_most_remaining_capacity_instance(task, self.graph[rampart_group.name]['instances']) or \
-                    InstanceGroup.find_largest_idle_instance(self.graph[rampart_group.name]['instances'])
+                execution_instance = self.capacity_index.fit_task_to_most_remaining_capacity_instance(rampart_group.name, task.task_impact) or \
+                    self.capacity_index.find_largest_idle_instance(rampart_group.name)
 
                 if execution_instance or rampart_group.is_containerized:
                     if not rampart_group.is_containerized:
-                        execution_instance.remaining_capacity = max(0, execution_instance.remaining_capacity - task.task_impact)
-                        execution_instance.jobs_running += 1
+                        self.capacity_index.consume(execution_instance, task.task_impact)
                         logger.debug("Starting {} in group {} instance {} (remaining_capacity={})".format(
                                      task.log_format, rampart_group.name, execution_instance.hostname, remaining_capacity))
 
@@ -637,7 +687,8 @@ class TaskManager():
     def schedule(self):
         # Lock
         with advisory_lock('task_manager_lock', wait=False) as acquired:
-            with transaction.atomic():
+            # tasks are submitted on commit; send them in one round trip
+            with publisher.batch(), transaction.atomic():
                 if acquired is False:
                     logger.debug("Not running scheduler, another task holds lock")
                     return
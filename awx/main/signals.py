@@ -34,7 +34,8 @@ from awx.main.models import (
     Job, JobHostSummary, JobTemplate, OAuth2AccessToken, Organization, Project,
     Role, SystemJob, SystemJobTemplate, UnifiedJob, UnifiedJobTemplate, User,
     UserSessionMembership, WorkflowJobTemplateNode, WorkflowApproval,
-    WorkflowApprovalTemplate, ROLE_SINGLETON_SYSTEM_ADMINISTRATOR
+    WorkflowApprovalTemplate, ROLE_SINGLETON_SYSTEM_ADMINISTRATOR,
+    invalidate_access_cache
 )
 from awx.main.constants import CENSOR_VALUE
 from awx.main.utils import model_instance_diff, model_to_dict, camelcase_to_underscore, get_current_apps
@@ -121,6 +122,11 @@ def sync_superuser_status_to_rbac(instance, **kwargs):
         Role.singleton(ROLE_SINGLETON_SYSTEM_ADMINISTRATOR).members.remove(instance)
 
 
+def invalidate_access_cache_on_membership_change(sender, **kwargs):
+    if kwargs['action'] in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_access_cache()
+
+
 def sync_rbac_to_superuser_status(instance, sender, **kwargs):
     'When the is_superuser flag is false but a user has the System Admin role, update the database to reflect that'
     if kwargs['action'] in ['post_add', 'post_remove', 'post_clear']:
@@ -219,6 +225,7 @@ m2m_changed.connect(rbac_activity_stream, Role.members.through)
 m2m_changed.connect(rbac_activity_stream, Role.parents.through)
 post_save.connect(sync_superuser_status_to_rbac, sender=User)
 m2m_changed.connect(sync_rbac_to_superuser_status, Role.members.through)
+m2m_changed.connect(invalidate_access_cache_on_membership_change, Role.members.through)
 pre_delete.connect(cleanup_detached_labels_on_deleted_parent, sender=UnifiedJob)
 pre_delete.connect(cleanup_detached_labels_on_deleted_parent, sender=UnifiedJobTemplate)
 
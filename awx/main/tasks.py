@@ -56,31 +56,35 @@ from awx.main.analytics import all_collectors, expensive_collectors
 from awx.main.redact import UriCleaner
 from awx.main.models import (
     Schedule, TowerScheduleState, Instance, InstanceGroup,
-    UnifiedJob, Notification,
+    UnifiedJob, UnifiedJobTemplate, Notification,
     Inventory, InventorySource, SmartInventoryMembership,
     Job, AdHocCommand, ProjectUpdate, InventoryUpdate, SystemJob,
     JobEvent, ProjectUpdateEvent, InventoryUpdateEvent, AdHocCommandEvent, SystemJobEvent,
     build_safe_env, enforce_bigint_pk_migration
 )
+from awx.main.models.rbac import bump_access_cache_generation
 from awx.main.constants import ACTIVE_STATES
 from awx.main.exceptions import AwxTaskError, PostRunError
 from awx.main.queue import CallbackQueueDispatcher
 from awx.main.isolated import manager as isolated_manager
 from awx.main.dispatch.publish import task
-from awx.main.dispatch import get_local_queuename, reaper
+from awx.main.dispatch import get_local_queuename, publisher, reaper
 from awx.main.utils import (update_scm_url,
                             ignore_inventory_computed_fields,
                             ignore_inventory_group_removal, extract_ansible_vars, schedule_task_manager,
-                            get_awx_version)
+                            task_manager_bulk_reschedule, get_awx_version)
 from awx.main.utils.ansible import read_ansible_config
 from awx.main.utils.common import get_custom_venv_choices
+from awx.main.utils.db import create_partition
 from awx.main.utils.external_logging import reconfigure_rsyslog
 from awx.main.utils.safe_yaml import safe_dump, sanitize_jinja
 from awx.main.utils.reload import stop_local_services
 from awx.main.utils.pglock import advisory_lock
 from awx.main.utils.handlers import SpecialInventoryHandler
-from awx.main.consumers import emit_channel_notification
+from awx.main.utils.stdout_cache import StdoutArtifact
+from awx.main.consumers import emit_channel_notification, emitter
 from awx.main import analytics
+from awx.main.analytics import metrics
 from awx.conf import settings_registry
 from awx.conf.license import get_license
 
@@ -100,6 +104,12 @@ isn't supported by the installed version of OpenSSH on this instance. \
 Try upgrading OpenSSH or providing your private key in an different format. \
 '''
 
+# failed playbook_on_stats processing is retried this many times, waiting
+# PLAYBOOK_ON_STATS_RETRY_DELAY seconds before the first retry (and twice as
+# long before each of the next)
+PLAYBOOK_ON_STATS_RETRIES = 3
+PLAYBOOK_ON_STATS_RETRY_DELAY = 5
+
 logger = logging.getLogger('awx.main.tasks')
 
 
@@ -293,6 +303,11 @@ def handle_setting_changes(setting_keys):
         reconfigure_rsyslog()
 
 
+@task(queue='tower_broadcast_all')
+def handle_role_changes():
+    bump_access_cache_generation()
+
+
 @task(queue='tower_broadcast_all')
 def delete_project_files(project_path):
     # TODO: possibly implement some retry logic
@@ -424,10 +439,44 @@ def gather_analytics():
 @task(queue=get_local_queuename)
 def purge_old_stdout_files():
     nowtime = time.time()
-    for f in os.listdir(settings.JOBOUTPUT_ROOT):
-        if os.path.getctime(os.path.join(settings.JOBOUTPUT_ROOT,f)) < nowtime - settings.LOCAL_STDOUT_EXPIRE_TIME:
-            os.unlink(os.path.join(settings.JOBOUTPUT_ROOT,f))
-            logger.debug("Removing {}".format(os.path.join(settings.JOBOUTPUT_ROOT,f)))
+    # created on first download (see UnifiedJob.result_stdout_raw_handle)
+    if os.path.isdir(settings.JOBOUTPUT_ROOT):
+        for f in os.listdir(settings.JOBOUTPUT_ROOT):
+            if os.path.getctime(os.path.join(settings.JOBOUTPUT_ROOT,f)) < nowtime - settings.LOCAL_STDOUT_EXPIRE_TIME:
+                os.unlink(os.path.join(settings.JOBOUTPUT_ROOT,f))
+                logger.debug("Removing {}".format(os.path.join(settings.JOBOUTPUT_ROOT,f)))
+    # cached stdout artifacts live on each node's local disk, so each node
+    # removes its own expired ones, and those of jobs which have been deleted
+    artifacts = list(StdoutArtifact.all())
+    for i in range(0, len(artifacts), 1000):
+        batch = artifacts[i:i + 1000]
+        existing = set(UnifiedJob.objects.filter(
+            pk__in=[artifact.pk for artifact in batch]
+        ).values_list('pk', flat=True))
+        for artifact in batch:
+            try:
+                expired = os.path.getctime(artifact.path) < nowtime - settings.LOCAL_STDOUT_EXPIRE_TIME
+            except FileNotFoundError:
+                continue
+            if expired or artifact.pk not in existing:
+                artifact.delete()
+                logger.debug("Removing {}".format(artifact.path))
+
+
+@task(queue=get_local_queuename)
+def gather_metrics():
+    metrics.store_counters()
+    if not settings.METRICS_CACHE_SECONDS:
+        # the metrics endpoint computes every gauge on each request
+        return
+    # the gauges are the same on every node, so only one node computes them
+    with advisory_lock('gather_metrics_lock', wait=False) as acquired:
+        if acquired is False:
+            return
+        age, _ = metrics.cached_gauges()
+        if age is not None and age < settings.METRICS_CACHE_SECONDS / 2:
+            return
+        metrics.refresh()
 
 
 @task(queue=get_local_queuename)
@@ -548,6 +597,58 @@ def awx_isolated_heartbeat():
         isolated_manager.IsolatedManager(CallbackQueueDispatcher.dispatch).health_check(isolated_instance_qs)
 
 
+def spawn_scheduled_jobs(schedule_ids, invalid_license=False):
+    """
+    Launch a job for each of the given schedules.  Schedules (and their
+    prompts) are loaded together, and each template is loaded once, with
+    the jobs spawned from it created in one transaction.
+    """
+    schedules = Schedule.objects.filter(pk__in=schedule_ids).select_related('inventory').prefetch_related('credentials')
+    by_template = OrderedDict()
+    for schedule in schedules.order_by('unified_job_template_id', 'pk'):
+        by_template.setdefault(schedule.unified_job_template_id, []).append(schedule)
+    templates = UnifiedJobTemplate.objects.in_bulk(list(by_template))
+
+    for template_id, template_schedules in by_template.items():
+        template = templates.get(template_id)
+        if template is None:
+            continue
+        if template.cache_timeout_blocked:
+            logger.warn("Cache timeout is in the future, bypassing schedule for template %s" % str(template.id))
+            continue
+        with transaction.atomic():
+            for schedule in template_schedules:
+                schedule.unified_job_template = template
+                try:
+                    with transaction.atomic():
+                        job_kwargs = schedule.get_job_kwargs()
+                        new_unified_job = template.create_unified_job(**job_kwargs)
+                        logger.debug('Spawned {} from schedule {}-{}.'.format(
+                            new_unified_job.log_format, schedule.name, schedule.pk))
+
+                        if invalid_license:
+                            new_unified_job.status = 'failed'
+                            new_unified_job.job_explanation = str(invalid_license)
+                            new_unified_job.save(update_fields=['status', 'job_explanation'])
+                            new_unified_job.websocket_emit_status("failed")
+                            can_start = False
+                        else:
+                            can_start = new_unified_job.signal_start()
+                except Exception:
+                    logger.exception('Error spawning scheduled job.')
+                    continue
+                if invalid_license:
+                    logger.error('Error spawning scheduled job: {}'.format(invalid_license))
+                    continue
+                if not can_start:
+                    new_unified_job.status = 'failed'
+                    new_unified_job.job_explanation = gettext_noop("Scheduled job could not start because it \
+                        was not in the right state or required manual credentials")
+                    new_unified_job.save(update_fields=['status', 'job_explanation'])
+                    new_unified_job.websocket_emit_status("failed")
+                emit_channel_notification('schedules-changed', dict(id=schedule.id, group_name="schedules"))
+
+
 @task(queue=get_local_queuename)
 def awx_periodic_scheduler():
     with advisory_lock('awx_periodic_scheduler_lock', wait=False) as acquired:
@@ -563,46 +664,23 @@ def awx_periodic_scheduler():
         state.schedule_last_run = run_now
         state.save()
 
-        old_schedules = Schedule.objects.enabled().before(last_run)
-        for schedule in old_schedules:
-            schedule.update_computed_fields()
-        schedules = Schedule.objects.enabled().between(last_run, run_now)
-
         invalid_license = False
         try:
             access_registry[Job](None).check_license(quiet=True)
         except PermissionDenied as e:
             invalid_license = e
 
-        for schedule in schedules:
-            template = schedule.unified_job_template
-            schedule.update_computed_fields() # To update next_run timestamp.
-            if template.cache_timeout_blocked:
-                logger.warn("Cache timeout is in the future, bypassing schedule for template %s" % str(template.id))
-                continue
-            try:
-                job_kwargs = schedule.get_job_kwargs()
-                new_unified_job = schedule.unified_job_template.create_unified_job(**job_kwargs)
-                logger.debug('Spawned {} from schedule {}-{}.'.format(
-                    new_unified_job.log_format, schedule.name, schedule.pk))
-
-                if invalid_license:
-                    new_unified_job.status = 'failed'
-                    new_unified_job.job_explanation = str(invalid_license)
-                    new_unified_job.save(update_fields=['status', 'job_explanation'])
-                    new_unified_job.websocket_emit_status("failed")
-                    raise invalid_license
-                can_start = new_unified_job.signal_start()
-            except Exception:
-                logger.exception('Error spawning scheduled job.')
-                continue
-            if not can_start:
-                new_unified_job.status = 'failed'
-                new_unified_job.job_explanation = gettext_noop("Scheduled job could not start because it \
-                    was not in the right state or required manual credentials")
-                new_unified_job.save(update_fields=['status', 'job_explanation'])
-                new_unified_job.websocket_emit_status("failed")
-            emit_channel_notification('schedules-changed', dict(id=schedule.id, group_name="schedules"))
+        # websocket notifications (and the task manager) are sent once, for
+        # everything launched in this run
+        with task_manager_bulk_reschedule(), publisher.batch(), emitter.batch():
+            # one range query finds every schedule that's due (or was missed
+            # while the scheduler wasn't running); their next runs come from
+            # the stored occurrences, and are saved in bulk
+            schedules = list(Schedule.objects.enabled().before(run_now))
+            due = [s.pk for s in schedules if s.next_run > last_run]
+            Schedule.advance(schedules, run_now)
+            if due:
+                spawn_scheduled_jobs(due, invalid_license)
         state.save()
 
 
@@ -678,6 +756,67 @@ def handle_success_and_failure_notifications(job_id):
     logger.warn(f"Failed to even try to send notifications for job '{uj}' due to job not being in finished state.")
 
 
+@task(queue=get_local_queuename)
+def process_playbook_on_stats(event_id, job_id, host_map=None, retries=PLAYBOOK_ON_STATS_RETRIES, not_before=None):
+    '''
+    Apply the side effects of a job's playbook_on_stats event (host summaries,
+    inventory computed fields and notifications) outside of the callback
+    receiver.
+
+    Failed attempts are requeued with a `not_before` timestamp, doubling the
+    delay (from PLAYBOOK_ON_STATS_RETRY_DELAY seconds) on each retry.  The
+    dispatcher can't delay messages, so an early retry waits at most a second
+    and goes to the back of the queue again.
+    '''
+    if not_before is not None and time.time() < not_before:
+        time.sleep(min(not_before - time.time(), 1))
+        if time.time() < not_before:
+            process_playbook_on_stats.apply_async([event_id, job_id], {
+                'host_map': host_map, 'retries': retries, 'not_before': not_before
+            })
+            return
+    try:
+        # the job knows which table (and partition) its events are in
+        event = Job.objects.get(pk=job_id).get_event_queryset().get(pk=event_id)
+    except ObjectDoesNotExist:
+        logger.error('playbook_on_stats processing failed due to missing event {}'.format(event_id))
+        return
+    event.host_map = host_map or {}
+    start = time.time()
+    try:
+        event.process_playbook_on_stats()
+    except DatabaseError:
+        metrics.inc_counter('awx_playbook_on_stats_processed', status='failed')
+        if retries <= 0:
+            logger.exception('Database error processing playbook_on_stats for job {}, giving up'.format(event.job_id))
+            return
+        delay = PLAYBOOK_ON_STATS_RETRY_DELAY * 2 ** (PLAYBOOK_ON_STATS_RETRIES - retries)
+        logger.warning('Database error processing playbook_on_stats for job {}, retrying in {} seconds '
+                       '(retries remaining: {})'.format(event.job_id, delay, retries), exc_info=True)
+        # go to the back of the queue rather than holding this worker
+        process_playbook_on_stats.apply_async([event_id, job_id], {
+            'host_map': host_map, 'retries': retries - 1, 'not_before': time.time() + delay
+        })
+        return
+    elapsed = time.time() - start
+    metrics.inc_counter('awx_playbook_on_stats_processed', status='successful')
+    metrics.inc_counter('awx_playbook_on_stats_hosts', len(event.host_map))
+    metrics.inc_counter('awx_playbook_on_stats_milliseconds', int(elapsed * 1000))
+    logger.debug('Processed playbook_on_stats for job {} ({} hosts) in {:.3f}s'.format(event.job_id, len(event.host_map), elapsed))
+
+
+@task(queue=get_local_queuename)
+def propagate_parent_changes(job_id):
+    '''
+    Propagate changed/failed flags to the parent events of a job whose
+    parents the callback receiver gave up waiting for.
+    '''
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        return
+    job.propagate_parent_changes()
+
+
 @task(queue=get_local_queuename)
 def update_inventory_computed_fields(inventory_id):
     '''
@@ -754,11 +893,17 @@ def migrate_legacy_event_data(tblname):
                 return None
 
         with connection.cursor() as cursor:
+            # rows that are still waiting to be migrated belong to jobs created
+            # before the event tables were partitioned
+            target = tblname
+            cursor.execute('SELECT to_regclass(%s)', [f'_unpartitioned_{tblname}'])
+            if cursor.fetchone()[0] is not None:
+                target = f'_unpartitioned_{tblname}'
             total_rows = _remaining()
             while total_rows:
                 with transaction.atomic():
                     cursor.execute(
-                        f'INSERT INTO {tblname} SELECT * FROM _old_{tblname} ORDER BY id DESC LIMIT {chunk} RETURNING id;'
+                        f'INSERT INTO {target} SELECT * FROM _old_{tblname} ORDER BY id DESC LIMIT {chunk} RETURNING id;'
                     )
                     last_insert_pk = cursor.fetchone()
                     if last_insert_pk is None:
@@ -837,6 +982,7 @@ class BaseTask(object):
         self.cleanup_paths = []
         self.parent_workflow_job_id = None
         self.host_map = {}
+        self.job_created = None
 
     def update_model(self, pk, _attempt=0, **updates):
         """Reload the model instance from the database and update the
@@ -1270,6 +1416,7 @@ class BaseTask(object):
                 pass
 
         event_data.setdefault(self.event_data_key, self.instance.id)
+        event_data.setdefault('job_created', self.job_created)
         self.dispatcher.dispatch(event_data)
         self.event_ct += 1
 
@@ -1364,6 +1511,12 @@ class BaseTask(object):
         extra_update_fields = {}
         fact_modification_times = {}
         self.event_ct = 0
+        # every event is saved with the job's created time, which decides the
+        # event table partition it goes to (jobs created before the tables
+        # were partitioned keep saving to the _unpartitioned_ tables)
+        if not self.instance.has_unpartitioned_events:
+            create_partition(self.event_model._meta.db_table, self.instance.created)
+        self.job_created = str(self.instance.created)
 
         '''
         Needs to be an object property because status_handler uses it in a callback context
@@ -2987,6 +3140,8 @@ class RunSystemJob(BaseTask):
                     args.extend(['--days', str(json_vars.get('days', 60))])
                 if 'dry_run' in json_vars and json_vars['dry_run']:
                     args.extend(['--dry-run'])
+            if system_job.job_type == 'cleanup_activitystream' and 'time_limit' in json_vars:
+                args.extend(['--time-limit', str(json_vars['time_limit'])])
             if system_job.job_type == 'cleanup_jobs':
                 args.extend(['--jobs', '--project-updates', '--inventory-updates',
                              '--management-jobs', '--ad-hoc-commands', '--workflow-jobs',
@@ -1,8 +1,13 @@
+import json
+from unittest import mock
+
 import pytest
 
 from prometheus_client.parser import text_string_to_metric_families
 from awx.main import models
+from awx.main.analytics import metrics as metrics_module
 from awx.main.analytics.metrics import metrics
+from awx.main.tasks import gather_metrics
 from awx.api.versioning import reverse
 from awx.main.models.rbac import Role
 
@@ -86,3 +91,97 @@ def test_metrics_http_methods(get, post, patch, put, options, admin):
     assert options(reverse('api:metrics_view'), user=admin).status_code == 200
 
 
+def gauge_value(output, name):
+    for family in text_string_to_metric_families(output.decode('UTF-8')):
+        for sample in family.samples:
+            if sample[0] == name:
+                return sample[2]
+
+
+@pytest.mark.django_db
+def test_metrics_gauges_are_cached(settings, organization):
+    settings.METRICS_CACHE_SECONDS = 30
+    assert gauge_value(metrics(), 'awx_organizations_total') == 1
+    models.Organization.objects.create(name='another')
+    assert gauge_value(metrics(), 'awx_organizations_total') == 1
+
+    settings.METRICS_CACHE_SECONDS = 0
+    assert gauge_value(metrics(), 'awx_organizations_total') == 2
+
+
+@pytest.mark.django_db
+def test_gather_metrics_skips_fresh_gauges(settings):
+    settings.METRICS_CACHE_SECONDS = 30
+    with mock.patch.object(metrics_module, 'refresh') as refresh:
+        with mock.patch.object(metrics_module, 'cached_gauges', return_value=(5, b'')):
+            gather_metrics()
+        refresh.assert_not_called()
+        with mock.patch.object(metrics_module, 'cached_gauges', return_value=(20, b'')):
+            # another node is computing the gauges
+            with mock.patch('awx.main.tasks.advisory_lock') as advisory_lock:
+                advisory_lock.return_value.__enter__.return_value = False
+                gather_metrics()
+            refresh.assert_not_called()
+            gather_metrics()
+        refresh.assert_called_once_with()
+
+
+@pytest.mark.django_db
+def test_metrics_gauges_are_shared_by_nodes(settings):
+    settings.METRICS_CACHE_SECONDS = 30
+    gauges = metrics_module.refresh()
+    assert metrics_module.cached_gauges()[1] == gauges
+    # other nodes serve the stored gauges rather than computing their own
+    with mock.patch.object(metrics_module, 'generate_latest', return_value=b'') as generate_latest:
+        assert metrics().startswith(gauges)
+    generate_latest.assert_called_once_with(metrics_module.COUNTER_REGISTRY)
+
+
+@pytest.mark.django_db
+def test_metrics_counters(settings):
+    settings.CLUSTER_HOST_ID = 'awx-1'
+    # the last copy of another node's counters (see store_counters)
+    models.InstanceMetrics.objects.create(
+        instance=models.Instance.objects.create(hostname='awx-2'),
+        counters={json.dumps(['awx_events_processed', ['awx-2', 'JobEvent']]): 7},
+    )
+    client = mock.Mock()
+    with mock.patch.object(metrics_module, 'redis_client', return_value=client):
+        metrics_module.inc_counter('awx_events_processed', 5, type='JobEvent')
+        field = json.dumps(['awx_events_processed', ['awx-1', 'JobEvent']])
+        client.hincrby.assert_called_once_with(metrics_module.METRICS_COUNTERS_KEY, field, 5)
+
+        client.hgetall.return_value = {
+            field.encode('utf-8'): b'5',
+            json.dumps(['awx_job_status_transitions', ['awx-1', 'running']]).encode('utf-8'): b'2',
+        }
+        output = metrics_module.generate_latest(metrics_module.COUNTER_REGISTRY).decode('utf-8')
+    samples = [
+        (sample[0], sample[1], sample[2])
+        for family in text_string_to_metric_families(output)
+        for sample in family.samples
+    ]
+    assert ('awx_events_processed_total', {'node': 'awx-1', 'type': 'JobEvent'}, 5) in samples
+    assert ('awx_job_status_transitions_total', {'node': 'awx-1', 'status': 'running'}, 2) in samples
+    assert ('awx_events_processed_total', {'node': 'awx-2', 'type': 'JobEvent'}, 7) in samples
+
+
+@pytest.mark.django_db
+def test_metrics_counters_are_stored(settings):
+    settings.CLUSTER_HOST_ID = 'awx-1'
+    instance = models.Instance.objects.create(hostname='awx-1')
+    field = json.dumps(['awx_events_processed', ['awx-1', 'JobEvent']])
+    client = mock.Mock()
+    client.hgetall.return_value = {field.encode('utf-8'): b'5'}
+    with mock.patch.object(metrics_module, 'redis_client', return_value=client):
+        metrics_module.store_counters()
+        client.hgetall.return_value = {field.encode('utf-8'): b'6'}
+        metrics_module.store_counters()
+    assert models.InstanceMetrics.objects.get(instance=instance).counters == {field: 6}
+
+
+def test_metrics_redis_client_is_reused():
+    with mock.patch.object(metrics_module, '_redis', []):
+        with mock.patch('awx.main.analytics.metrics.redis.Redis.from_url') as from_url:
+            assert metrics_module.redis_client() is metrics_module.redis_client()
+    from_url.assert_called_once()
@@ -1,7 +1,9 @@
 import pytest
 
+from django.db import connection
+
 from awx.api.versioning import reverse
-from awx.main.models import AdHocCommand, AdHocCommandEvent, JobEvent
+from awx.main.models import AdHocCommand, AdHocCommandEvent, Job, JobEvent, UnpartitionedJobEvent
 
 
 @pytest.mark.django_db
@@ -43,3 +45,41 @@ def test_ad_hoc_events_sublist_truncation(get, organization_factory, job_templat
 
     response = get(url, user=objs.superusers.admin, expect=200)
     assert (len(response.data['results'][0]['stdout']) == 1025) == expected
+
+
+@pytest.fixture
+def unpartitioned_job_events():
+    # the _unpartitioned_ tables only exist on upgraded installs
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(UnpartitionedJobEvent)
+    yield
+    with connection.schema_editor() as schema_editor:
+        schema_editor.delete_model(UnpartitionedJobEvent)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_job_events_of_jobs_created_before_partitioning(get, admin, group, host, unpartitioned_job_events):
+    old_job = Job.objects.create(inventory=host.inventory)
+    new_job = Job.objects.create(inventory=host.inventory)
+    # both tables draw ids from the same sequence in postgres
+    parent = UnpartitionedJobEvent.objects.create(id=1000, job=old_job, host=host, uuid='abc123',
+                                                  event='playbook_on_task_start')
+    UnpartitionedJobEvent.objects.create(id=1001, job=old_job, host=host, parent_uuid='abc123',
+                                         event='runner_on_ok')
+    JobEvent.create_from_data(job_id=new_job.pk, host_id=host.pk, event='runner_on_ok').save()
+
+    response = get(reverse('api:job_event_detail', kwargs={'pk': parent.pk}), user=admin, expect=200)
+    assert response.data['event'] == 'playbook_on_task_start'
+    response = get(reverse('api:job_event_children_list', kwargs={'pk': parent.pk}), user=admin, expect=200)
+    assert [e['id'] for e in response.data['results']] == [1001]
+    response = get(reverse('api:job_event_hosts_list', kwargs={'pk': parent.pk}), user=admin, expect=200)
+    assert [h['id'] for h in response.data['results']] == [host.pk]
+
+    for url in (reverse('api:job_event_list'),
+                reverse('api:host_job_events_list', kwargs={'pk': host.pk}),
+                reverse('api:group_job_events_list', kwargs={'pk': group.pk})):
+        response = get(url + '?order_by=-id', user=admin, expect=200)
+        assert response.data['count'] == 3
+        assert [e['job'] for e in response.data['results']] == [old_job.pk, old_job.pk, new_job.pk]
+        response = get(url + '?event=runner_on_ok', user=admin, expect=200)
+        assert sorted(e['job'] for e in response.data['results']) == sorted([old_job.pk, new_job.pk])
@@ -29,6 +29,13 @@ def _mk_inventory_update():
     return iu
 
 
+def _content(response):
+    # downloads are streamed
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize('Parent, Child, relation, view', [
     [Job, JobEvent, 'job', 'api:job_stdout'],
@@ -44,7 +51,7 @@ def test_text_stdout(sqlite_copy_expert, Parent, Child, relation, view, get, adm
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=txt'
 
     response = get(url, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['Testing %d' % i for i in range(3)]
+    assert smart_str(_content(response)).splitlines() == ['Testing %d' % i for i in range(3)]
 
 
 @pytest.mark.django_db
@@ -70,14 +77,14 @@ def test_ansi_stdout_filtering(sqlite_copy_expert, Parent, Child, relation,
     # ansi codes in ?format=txt should get filtered
     fmt = "?format={}".format("txt_download" if download else "txt")
     response = get(url + fmt, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['Testing %d' % i for i in range(3)]
+    assert smart_str(_content(response)).splitlines() == ['Testing %d' % i for i in range(3)]
     has_download_header = response.has_header('Content-Disposition')
     assert has_download_header if download else not has_download_header
 
     # ask for ansi and you'll get it
     fmt = "?format={}".format("ansi_download" if download else "ansi")
     response = get(url + fmt, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['\x1B[0;36mTesting %d\x1B[0m' % i for i in range(3)]
+    assert smart_str(_content(response)).splitlines() == ['\x1B[0;36mTesting %d\x1B[0m' % i for i in range(3)]
     has_download_header = response.has_header('Content-Disposition')
     assert has_download_header if download else not has_download_header
 
@@ -101,9 +108,9 @@ def test_colorized_html_stdout(sqlite_copy_expert, Parent, Child, relation, view
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=html'
 
     response = get(url, user=admin, expect=200)
-    assert '.ansi36 { color: #2dbaba; }' in smart_str(response.content)
+    assert '.ansi36 { color: #2dbaba; }' in smart_str(_content(response))
     for i in range(3):
-        assert '<span class="ansi36">Testing {}</span>'.format(i) in smart_str(response.content)
+        assert '<span class="ansi36">Testing {}</span>'.format(i) in smart_str(_content(response))
 
 
 @pytest.mark.django_db
@@ -121,7 +128,40 @@ def test_stdout_line_range(sqlite_copy_expert, Parent, Child, relation, view, ge
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=html&start_line=5&end_line=10'
 
     response = get(url, user=admin, expect=200)
-    assert re.findall('Testing [0-9]+', smart_str(response.content)) == ['Testing %d' % i for i in range(5, 10)]
+    assert re.findall('Testing [0-9]+', smart_str(_content(response))) == ['Testing %d' % i for i in range(5, 10)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('Parent, Child, relation, view', [
+    [Job, JobEvent, 'job', 'api:job_stdout'],
+    [AdHocCommand, AdHocCommandEvent, 'ad_hoc_command', 'api:ad_hoc_command_stdout'],
+    [_mk_project_update, ProjectUpdateEvent, 'project_update', 'api:project_update_stdout'],
+    [_mk_inventory_update, InventoryUpdateEvent, 'inventory_update', 'api:inventory_update_stdout'],
+])
+@pytest.mark.parametrize('query, expected, expected_range', [
+    ['start_line=5&end_line=10', range(5, 10), {'start': 5, 'end': 10, 'absolute_end': 40}],
+    ['start_line=-3', range(37, 40), {'start': 37, 'end': 40, 'absolute_end': 40}],
+    ['start_line=38&end_line=100', range(38, 40), {'start': 38, 'end': 40, 'absolute_end': 40}],
+])
+def test_stdout_line_range_indexed(Parent, Child, relation, view, query, expected, expected_range, get, admin):
+    # events with line numbers are read by range, without copying out the
+    # stdout of the entire job
+    job = Parent()
+    job.save()
+    for i in range(20):
+        Child(**{
+            relation: job,
+            'stdout': 'Testing {}\r\nTesting {}'.format(i * 2, i * 2 + 1),
+            'start_line': i * 2,
+            'end_line': i * 2 + 2
+        }).save()
+    url = reverse(view, kwargs={'pk': job.pk}) + '?format=json&' + query
+
+    with mock.patch.object(job.__class__, 'result_stdout_raw_handle') as handle:
+        response = get(url, user=admin, expect=200)
+        handle.assert_not_called()
+    assert response.data['range'] == expected_range
+    assert re.findall('Testing [0-9]+', smart_str(response.data['content'])) == ['Testing %d' % i for i in expected]
 
 
 @pytest.mark.django_db
@@ -171,7 +211,7 @@ def test_max_bytes_display(sqlite_copy_expert, Parent, Child, relation, view, fm
     url = reverse(view, kwargs={'pk': job.pk})
 
     response = get(url + '?format={}'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == (
+    assert smart_str(_content(response)) == (
         'Standard Output too large to display ({actual} bytes), only download '
         'supported for sizes over {max} bytes.'.format(
             actual=total_bytes,
@@ -180,7 +220,7 @@ def test_max_bytes_display(sqlite_copy_expert, Parent, Child, relation, view, fm
     )
 
     response = get(url + '?format={}_download'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == large_stdout
+    assert smart_str(_content(response)) == large_stdout
 
 
 @pytest.mark.django_db
@@ -200,7 +240,7 @@ def test_legacy_result_stdout_text_fallback(Cls, view, fmt, get, admin):
     url = reverse(view, kwargs={'pk': job.pk})
 
     response = get(url + '?format={}'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == 'LEGACY STDOUT!'
+    assert smart_str(_content(response)) == 'LEGACY STDOUT!'
 
 
 @pytest.mark.django_db
@@ -220,7 +260,7 @@ def test_legacy_result_stdout_with_max_bytes(Cls, view, fmt, get, admin):
     url = reverse(view, kwargs={'pk': job.pk})
 
     response = get(url + '?format={}'.format(fmt), user=admin, expect=200)
-    assert smart_str(response.content) == (
+    assert smart_str(_content(response)) == (
         'Standard Output too large to display ({actual} bytes), only download '
         'supported for sizes over {max} bytes.'.format(
             actual=total_bytes,
@@ -229,7 +269,7 @@ def test_legacy_result_stdout_with_max_bytes(Cls, view, fmt, get, admin):
     )
 
     response = get(url + '?format={}'.format(fmt + '_download'), user=admin, expect=200)
-    assert smart_str(response.content) == large_stdout
+    assert smart_str(_content(response)) == large_stdout
 
 
 @pytest.mark.django_db
@@ -249,7 +289,61 @@ def test_text_with_unicode_stdout(sqlite_copy_expert, Parent, Child, relation,
     url = reverse(view, kwargs={'pk': job.pk}) + '?format=' + fmt
 
     response = get(url, user=admin, expect=200)
-    assert smart_str(response.content).splitlines() == ['オ%d' % i for i in range(3)]
+    assert smart_str(_content(response)).splitlines() == ['オ%d' % i for i in range(3)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fmt', ['txt_download', 'ansi_download'])
+def test_download_stdout_is_streamed(sqlite_copy_expert, get, admin, fmt):
+    job = Job()
+    job.save()
+    for i in range(3):
+        JobEvent(job=job, stdout='Testing {}\n'.format(i), start_line=i).save()
+    url = reverse('api:job_stdout', kwargs={'pk': job.pk}) + '?format=' + fmt
+
+    with mock.patch.object(Job, 'result_stdout_raw_handle') as handle:
+        response = get(url, user=admin, expect=200)
+        handle.assert_not_called()
+    assert response.streaming
+    assert smart_str(_content(response)).splitlines() == ['Testing %d' % i for i in range(3)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fmt', ['txt', 'ansi', 'txt_download', 'ansi_download', 'json'])
+def test_stdout_served_from_cache(sqlite_copy_expert, settings, tmpdir, get, admin, fmt):
+    settings.STDOUT_CACHE_ENABLED = True
+    settings.STDOUT_CACHE_ROOT = str(tmpdir)
+    job = Job(status='successful', emitted_events=3)
+    job.save()
+    for i in range(3):
+        JobEvent(job=job, stdout='Testing {}\n'.format(i), start_line=i).save()
+    url = reverse('api:job_stdout', kwargs={'pk': job.pk}) + '?format=' + fmt
+
+    response = get(url, user=admin, expect=200)
+    assert 'Testing 2' in smart_str(_content(response))
+    assert len(tmpdir.listdir()) == 2  # compressed stdout, and its line index
+
+    # finished output is immutable, so later reads are served from disk
+    JobEvent.objects.filter(job=job).delete()
+    response = get(url, user=admin, expect=200)
+    assert re.findall('Testing [0-9]+', smart_str(_content(response))) == ['Testing %d' % i for i in range(3)]
+
+
+@pytest.mark.django_db
+def test_stdout_cache_waits_for_events(sqlite_copy_expert, settings, tmpdir, mocker):
+    settings.STDOUT_CACHE_ENABLED = True
+    settings.STDOUT_CACHE_ROOT = str(tmpdir)
+    job = Job(status='successful')
+    job.save()
+    JobEvent(job=job, stdout='Testing 0\n', start_line=0).save()
+    finished = mocker.patch.object(Job, 'event_processing_finished', new_callable=mocker.PropertyMock,
+                                   return_value=False)
+
+    # the output isn't final, and that's only checked once in a while
+    for i in range(2):
+        assert 'Testing 0' in job.result_stdout
+    assert finished.call_count == 1
+    assert tmpdir.listdir() == []
 
 
 @pytest.mark.django_db
@@ -264,5 +358,5 @@ def test_unicode_with_base64_ansi(sqlite_copy_expert, get, admin):
     ) + '?format=json&content_encoding=base64'
 
     response = get(url, user=admin, expect=200)
-    content = base64.b64decode(json.loads(smart_str(response.content))['content'])
+    content = base64.b64decode(json.loads(smart_str(_content(response)))['content'])
     assert smart_str(content).splitlines() == ['オ%d' % i for i in range(3)]
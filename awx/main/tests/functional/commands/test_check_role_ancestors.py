@@ -0,0 +1,26 @@
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from awx.main.models.rbac import RoleAncestorEntry
+
+
+@pytest.mark.django_db
+def test_check_role_ancestors(organization, project, alice):
+    call_command('check_role_ancestors')
+
+    # corrupt the ancestry of the project's roles
+    RoleAncestorEntry.objects.filter(descendent=project.read_role, ancestor=organization.admin_role).delete()
+    RoleAncestorEntry.objects.create(
+        descendent=project.admin_role, ancestor=organization.auditor_role,
+        role_field='admin_role', content_type_id=0, object_id=0
+    )
+    with pytest.raises(CommandError):
+        call_command('check_role_ancestors', '--chunk-size', '3')
+
+    organization.admin_role.members.add(alice)
+    assert alice not in project.read_role
+    call_command('check_role_ancestors', '--chunk-size', '3', '--repair')
+    assert alice in project.read_role
+    call_command('check_role_ancestors')
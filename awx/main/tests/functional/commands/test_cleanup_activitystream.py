@@ -0,0 +1,27 @@
+import pytest
+from datetime import timedelta
+
+from django.utils.timezone import now
+
+from awx.main.management.commands.cleanup_activitystream import Command
+from awx.main.models import ActivityStream
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('dry_run', [True, False])
+def test_cleanup_activitystream(organization, dry_run):
+    ActivityStream.objects.all().delete()
+    entries = []
+    for i in range(5):
+        entry = ActivityStream.objects.create(operation='update', object1='organization')
+        entry.organization.add(organization)
+        entries.append(entry)
+    ActivityStream.objects.filter(pk__in=[e.pk for e in entries[:3]]).update(timestamp=now() - timedelta(days=100))
+
+    Command().handle(days=90, dry_run=dry_run, batch_size=2, time_limit=0, verbosity=0)
+
+    remaining = 5 if dry_run else 2
+    assert ActivityStream.objects.count() == remaining
+    assert ActivityStream.organization.through.objects.count() == remaining
+    if not dry_run:
+        assert set(ActivityStream.objects.values_list('pk', flat=True)) == {e.pk for e in entries[3:]}
@@ -6,10 +6,11 @@ from collections import OrderedDict
 from django.db.models.deletion import Collector, SET_NULL, CASCADE
 from django.core.management import call_command
 
+from awx.main.management.commands.cleanup_jobs import Command
 from awx.main.utils.deletion import AWXCollector
 from awx.main.models import (
     JobTemplate, User, Job, JobEvent, Notification,
-    WorkflowJobNode, JobHostSummary
+    WorkflowJobNode, JobHostSummary, Label, Project, ProjectUpdate, UnifiedJob
 )
 
 
@@ -111,6 +112,63 @@ def test_cleanup_jobs(setup_environment):
             assert not getattr(model.objects.get(pk=v), fieldname)
 
 
+@pytest.mark.django_db
+def test_cleanup_jobs_removes_events_of_deleted_jobs(setup_environment):
+    (old_jobs, new_jobs, days_str) = setup_environment
+    call_command('cleanup_jobs', '--days', days_str, '--dry-run')
+    assert JobEvent.objects.count() == len(old_jobs) + len(new_jobs)
+
+    call_command('cleanup_jobs', '--days', days_str)
+    assert sorted(JobEvent.objects.values_list('job_id', flat=True)) == sorted(job.pk for job in new_jobs)
+
+
+@pytest.mark.django_db
+def test_delete_orphaned_events_in_batches():
+    job = Job.objects.create()
+    for job_id in (job.pk, job.pk + 1000, job.pk, job.pk + 1001, job.pk + 1000):
+        JobEvent.create_from_data(job_id=job_id, uuid='abc123', event='runner_on_start', stdout='a' * 1025).save()
+    command = Command()
+    command.batch_size, command.pause = 2, 0
+    assert command.delete_orphaned_events(JobEvent._meta.db_table, 'job_id') == 3
+    assert list(JobEvent.objects.values_list('job_id', flat=True)) == [job.pk, job.pk]
+
+
+@pytest.mark.django_db
+def test_cleanup_jobs_in_batches_updates_host_last_job(setup_environment, host):
+    (old_jobs, new_jobs, days_str) = setup_environment
+    new_summary = JobHostSummary.objects.create(job=new_jobs[0], host=host, host_name=host.name)
+    old_summary = JobHostSummary.objects.create(job=old_jobs[-1], host=host, host_name=host.name)
+    host.last_job = old_jobs[-1]
+    host.last_job_host_summary = old_summary
+    host.save()
+
+    call_command('cleanup_jobs', '--days', days_str, '--jobs', '--batch-size', '1')
+    assert not Job.objects.filter(pk__in=[obj.pk for obj in old_jobs]).exists()
+    host.refresh_from_db()
+    assert host.last_job == new_jobs[0]
+    assert host.last_job_host_summary == new_summary
+
+
+@pytest.mark.django_db
+def test_cleanup_project_updates_keeps_current_and_last(project):
+    old = datetime.now(tz=timezone('UTC')) - timedelta(days=10)
+    updates = []
+    for status in ('successful', 'successful', 'running', 'failed', 'successful'):
+        pu = ProjectUpdate.objects.create(project=project, status=status)
+        pu.created = old
+        pu.save()
+        updates.append(pu)
+    label = Label.objects.create(name='old', organization=project.organization)
+    updates[0].labels.add(label)
+    Project.objects.filter(pk=project.pk).update(current_job=updates[3], last_job=updates[4])
+
+    call_command('cleanup_jobs', '--days', '5', '--project-updates', '--batch-size', '1')
+    remaining = ProjectUpdate.objects.filter(pk__in=[pu.pk for pu in updates])
+    # the running update, and the project's current and last updates
+    assert set(remaining.values_list('pk', flat=True)) == {pu.pk for pu in updates[2:]}
+    assert not UnifiedJob.labels.through.objects.filter(label=label).exists()
+
+
 @pytest.mark.django_db
 def test_awxcollector(setup_environment):
     '''
@@ -648,9 +648,15 @@ def _request(verb):
             )
         if hasattr(response, 'render'):
             response.render()
+        if response.streaming:
+            # consume the stream once, and leave it readable for assertions
+            content = b''.join(response.streaming_content)
+            response.streaming_content = [content]
+        else:
+            content = response.content
         __SWAGGER_REQUESTS__.setdefault(request.path, {})[
             (request.method.lower(), response.status_code)
-        ] = (response.get('Content-Type', None), response.content, kwargs.get('data'))
+        ] = (response.get('Content-Type', None), content, kwargs.get('data'))
         return response
     return rf
 
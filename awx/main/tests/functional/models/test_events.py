@@ -1,35 +1,45 @@
+from datetime import timedelta
 from unittest import mock
 import pytest
 
+from django.db import connection, DatabaseError
 from django.utils.timezone import now
 
-from awx.main.models import Job, JobEvent, Inventory, Host, JobHostSummary
+from awx.main.dispatch.worker.callback import CallbackBrokerWorker
+from awx.main.models import Job, JobEvent, Inventory, Host, JobHostSummary, UnpartitionedJobEvent
+from awx.main.tasks import process_playbook_on_stats
+from awx.main.tests.functional import immediate_on_commit
+
+
+def flush(*events):
+    # save events the way the callback receiver does, which is where
+    # changed/failed flags are propagated to parent events
+    worker = CallbackBrokerWorker.__new__(CallbackBrokerWorker)
+    worker.buff = {JobEvent: list(events)}
+    worker.pending_parents = {}
+    with mock.patch('awx.main.dispatch.worker.callback.emit_event_detail'):
+        worker.flush(force=True)
+    return worker
 
 
 @pytest.mark.django_db
-@mock.patch('awx.main.models.events.emit_event_detail')
-def test_parent_changed(emit):
+def test_parent_changed():
     j = Job()
     j.save()
-    JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start').save()
+    flush(JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start'))
     assert JobEvent.objects.count() == 1
     for e in JobEvent.objects.all():
         assert e.changed is False
 
-    JobEvent.create_from_data(
+    worker = flush(JobEvent.create_from_data(
         job_id=j.pk,
         parent_uuid='abc123',
         event='runner_on_ok',
         event_data={
             'res': {'changed': ['localhost']}
         }
-    ).save()
-    # the `playbook_on_stats` event is where we update the parent changed linkage
-    JobEvent.create_from_data(
-        job_id=j.pk,
-        parent_uuid='abc123',
-        event='playbook_on_stats'
-    ).save()
+    ))
+    assert worker.pending_parents == {}
     events = JobEvent.objects.filter(event__in=['playbook_on_task_start', 'runner_on_ok'])
     assert events.count() == 2
     for e in events.all():
@@ -38,33 +48,107 @@ def test_parent_changed(emit):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize('event', JobEvent.FAILED_EVENTS)
-@mock.patch('awx.main.models.events.emit_event_detail')
-def test_parent_failed(emit, event):
+def test_parent_failed(event):
     j = Job()
     j.save()
-    JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start').save()
+    flush(JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start'))
     assert JobEvent.objects.count() == 1
     for e in JobEvent.objects.all():
         assert e.failed is False
 
-    JobEvent.create_from_data(
+    flush(JobEvent.create_from_data(
         job_id=j.pk,
         parent_uuid='abc123',
         event=event
-    ).save()
-
-    # the `playbook_on_stats` event is where we update the parent failed linkage
-    JobEvent.create_from_data(
-        job_id=j.pk,
-        parent_uuid='abc123',
-        event='playbook_on_stats'
-    ).save()
+    ))
     events = JobEvent.objects.filter(event__in=['playbook_on_task_start', event])
     assert events.count() == 2
     for e in events.all():
         assert e.failed is True
 
 
+@pytest.mark.django_db
+def test_parent_saved_in_a_later_flush():
+    # events for one job are spread across callback workers, so a child may
+    # be saved before its parent
+    j = Job()
+    j.save()
+    worker = flush(JobEvent.create_from_data(
+        job_id=j.pk,
+        parent_uuid='abc123',
+        event='runner_on_failed'
+    ))
+    assert worker.pending_parents[j.pk]['failed'] == {'abc123'}
+
+    flush(JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start'))
+    with mock.patch('awx.main.dispatch.worker.callback.emit_event_detail'):
+        worker.flush(force=True)
+    assert worker.pending_parents == {}
+    assert JobEvent.objects.get(uuid='abc123').failed is True
+
+
+@pytest.mark.django_db
+def test_parent_given_up_on_is_propagated_by_playbook_on_stats():
+    j = Job()
+    j.save()
+    worker = flush(JobEvent.create_from_data(
+        job_id=j.pk,
+        parent_uuid='abc123',
+        event='runner_on_failed'
+    ))
+    worker.pending_parents[j.pk]['since'] -= CallbackBrokerWorker.PARENT_UUID_TIMEOUT + 1
+    with mock.patch('awx.main.dispatch.worker.callback.propagate_parent_changes') as fallback:
+        worker.propagate_parent_changes()
+    fallback.apply_async.assert_called_once_with([j.pk])
+    assert worker.pending_parents == {}
+
+    # the parent is saved too late for the callback receiver...
+    JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start').save()
+    stats = JobEvent.create_from_data(job_id=j.pk, event='playbook_on_stats')
+    stats.save()
+    # ...but not for the set-based pass when playbook_on_stats is processed
+    stats.process_playbook_on_stats()
+    assert JobEvent.objects.get(uuid='abc123').failed is True
+
+
+@pytest.mark.django_db
+def test_events_are_saved_with_job_created():
+    j = Job()
+    j.save()
+    flush(JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_start'))
+    assert JobEvent.objects.get().job_created == j.created
+    assert j.get_event_queryset().count() == 1
+
+
+@pytest.fixture
+def unpartitioned_job_events():
+    # the _unpartitioned_ tables only exist on upgraded installs
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(UnpartitionedJobEvent)
+    yield
+    with connection.schema_editor() as schema_editor:
+        schema_editor.delete_model(UnpartitionedJobEvent)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_events_of_jobs_created_before_partitioning(unpartitioned_job_events):
+    j = Job()
+    j.save()
+    assert j.event_class is JobEvent
+    epoch = j.created + timedelta(seconds=1)
+    with mock.patch('awx.main.utils.db.get_event_partition_epoch', return_value=epoch):
+        assert j.event_class is UnpartitionedJobEvent
+        # events of the job are written where they are read from, whether
+        # they're saved by the callback receiver or directly
+        flush(JobEvent.create_from_data(job_id=j.pk, uuid='abc123', event='playbook_on_task_start'))
+        JobEvent.create_from_data(job_id=j.pk, parent_uuid='abc123', event='runner_on_failed').save()
+        assert JobEvent.objects.count() == 0
+        events = j.get_event_queryset()
+        assert events.model is UnpartitionedJobEvent
+        assert sorted(events.values_list('event', flat=True)) == ['playbook_on_task_start', 'runner_on_failed']
+        assert events.get(event='runner_on_failed').job_created == j.created
+
+
 @pytest.mark.django_db
 def test_host_summary_generation():
     hostnames = [f'Host {i}' for i in range(100)]
@@ -77,7 +161,7 @@ def test_host_summary_generation():
     j = Job(inventory=inv)
     j.save()
     host_map = dict((host.name, host.id) for host in inv.hosts.all())
-    JobEvent.create_from_data(
+    stats = JobEvent.create_from_data(
         job_id=j.pk,
         parent_uuid='abc123',
         event='playbook_on_stats',
@@ -92,7 +176,9 @@ def test_host_summary_generation():
             'skipped': {},
         },
         host_map=host_map
-    ).save()
+    )
+    stats.save()
+    stats.process_playbook_on_stats()
 
     assert j.job_host_summaries.count() == len(hostnames)
     assert sorted([s.host_name for s in j.job_host_summaries.all()]) == sorted(hostnames)
@@ -130,7 +216,7 @@ def test_host_summary_generation_with_deleted_hosts():
     for h in inv.hosts.all()[:5]:
         h.delete()
 
-    JobEvent.create_from_data(
+    stats = JobEvent.create_from_data(
         job_id=j.pk,
         parent_uuid='abc123',
         event='playbook_on_stats',
@@ -145,7 +231,9 @@ def test_host_summary_generation_with_deleted_hosts():
             'skipped': {},
         },
         host_map=host_map
-    ).save()
+    )
+    stats.save()
+    stats.process_playbook_on_stats()
 
 
     ids = sorted([s.host_id or -1 for s in j.job_host_summaries.order_by('id').all()])
@@ -179,7 +267,7 @@ def test_host_summary_generation_with_limit():
     # by making the playbook_on_stats *only* include Host 1, we're emulating
     # the behavior of a `--limit=Host 1`
     matching_host = Host.objects.get(name='Host 1')
-    JobEvent.create_from_data(
+    stats = JobEvent.create_from_data(
         job_id=j.pk,
         parent_uuid='abc123',
         event='playbook_on_stats',
@@ -194,7 +282,9 @@ def test_host_summary_generation_with_limit():
             'skipped': {},
         },
         host_map=host_map
-    ).save()
+    )
+    stats.save()
+    stats.process_playbook_on_stats()
 
     # since the playbook_on_stats only references one host,
     # there should *only* be on JobHostSummary record (and it should
@@ -208,3 +298,70 @@ def test_host_summary_generation_with_limit():
             # all other hosts in the inventory should remain untouched
             assert h.last_job_id is None
             assert h.last_job_host_summary_id is None
+
+
+@pytest.mark.django_db
+def test_playbook_on_stats_side_effects_are_deferred():
+    inv = Inventory()
+    inv.save()
+    host = Host.objects.create(name='Host 1', inventory=inv)
+    j = Job(inventory=inv)
+    j.save()
+    stats = JobEvent.create_from_data(
+        job_id=j.pk,
+        parent_uuid='abc123',
+        event='playbook_on_stats',
+        event_data={'ok': {'Host 1': 1}},
+        host_map={'Host 1': host.id}
+    )
+    stats.save()
+    # creating the event itself has no side effects
+    assert JobHostSummary.objects.count() == 0
+
+    with mock.patch.object(process_playbook_on_stats, 'apply_async') as apply_async:
+        stats.defer_playbook_on_stats()
+    apply_async.assert_called_once_with([stats.pk, j.pk], {'host_map': {'Host 1': host.id}})
+
+    process_playbook_on_stats(stats.pk, j.pk, host_map={'Host 1': host.id})
+    summary = JobHostSummary.objects.get()
+    assert summary.host_id == host.id
+    assert Host.objects.get(pk=host.pk).last_job_host_summary_id == summary.id
+
+
+@pytest.mark.django_db
+def test_playbook_on_stats_saved_directly_are_deferred():
+    j = Job()
+    j.save()
+    stats = JobEvent.create_from_data(job_id=j.pk, event='playbook_on_stats', event_data={})
+    with mock.patch.object(process_playbook_on_stats, 'apply_async') as apply_async:
+        with immediate_on_commit():
+            stats.save()
+            # updates aren't new events
+            stats.save()
+    apply_async.assert_called_once_with([stats.pk, j.pk], {'host_map': {}})
+
+
+@pytest.mark.django_db
+def test_playbook_on_stats_retries_back_off():
+    j = Job()
+    j.save()
+    stats = JobEvent.create_from_data(job_id=j.pk, event='playbook_on_stats', event_data={})
+    stats.save()
+    with mock.patch.object(JobEvent, 'process_playbook_on_stats', side_effect=DatabaseError), \
+            mock.patch.object(process_playbook_on_stats, 'apply_async') as apply_async, \
+            mock.patch('awx.main.tasks.time.time', return_value=1000), \
+            mock.patch('awx.main.tasks.time.sleep') as sleep, \
+            mock.patch('awx.main.tasks.logger') as logger:
+        process_playbook_on_stats(stats.pk, j.pk, retries=2)
+        apply_async.assert_called_once_with([stats.pk, j.pk], {'host_map': None, 'retries': 1, 'not_before': 1010})
+
+        # a retry which comes around too early waits its turn again
+        apply_async.reset_mock()
+        process_playbook_on_stats(stats.pk, j.pk, retries=1, not_before=1010)
+        sleep.assert_called_once_with(1)
+        apply_async.assert_called_once_with([stats.pk, j.pk], {'host_map': None, 'retries': 1, 'not_before': 1010})
+
+        apply_async.reset_mock()
+        process_playbook_on_stats(stats.pk, j.pk, retries=0, not_before=1000)
+        assert not apply_async.called
+        assert 'giving up' in logger.exception.call_args[0][0]
@@ -515,3 +515,72 @@ def test_duplicate_name_within_template(job_template):
         s2.save()
 
     assert str(ierror.value) == "UNIQUE constraint failed: main_schedule.unified_job_template_id, main_schedule.name"
+
+
+@pytest.mark.django_db
+def test_cached_rrulestr():
+    rrule = 'DTSTART:20300112T210000Z RRULE:FREQ=DAILY;INTERVAL=1'
+    assert Schedule.cached_rrulestr(rrule) is Schedule.cached_rrulestr(rrule)
+    assert list(Schedule.cached_rrulestr(rrule)[:3]) == list(Schedule.rrulestr(rrule)[:3])
+
+
+@pytest.mark.django_db
+def test_occurrences_are_stored(job_template, settings):
+    settings.SCHEDULE_STORED_OCCURRENCES = 5
+    s = Schedule.objects.create(
+        name='Some Schedule',
+        rrule='DTSTART:20300112T210000Z RRULE:FREQ=DAILY;INTERVAL=1',
+        unified_job_template=job_template
+    )
+    runs = list(s.occurrences.order_by('run_time').values_list('run_time', flat=True))
+    assert len(runs) == 5
+    assert runs[0] == s.next_run
+    assert runs[4] - runs[0] == timedelta(days=4)
+
+    s.enabled = False
+    s.save()
+    assert not s.occurrences.exists()
+
+
+@pytest.mark.django_db
+def test_advance(job_template, settings):
+    settings.SCHEDULE_STORED_OCCURRENCES = 3
+    s = Schedule.objects.create(
+        name='Some Schedule',
+        rrule='DTSTART:20300112T210000Z RRULE:FREQ=DAILY;INTERVAL=1;COUNT=4',
+        unified_job_template=job_template
+    )
+    first = datetime(2030, 1, 12, 21, tzinfo=pytz.utc)
+    with mock.patch('awx.main.models.schedules.emit_channel_notification'):
+        Schedule.advance([s], first + timedelta(hours=1))
+        s.refresh_from_db()
+        assert s.next_run == first + timedelta(days=1)
+        assert s.occurrences.count() == 3
+
+        Schedule.advance([s], first + timedelta(days=3, hours=1))
+        s.refresh_from_db()
+        assert s.next_run is None
+        assert not s.occurrences.exists()
+    job_template.refresh_from_db()
+    assert job_template.next_job_run == first + timedelta(days=1)
+
+
+@pytest.mark.django_db
+def test_advance_uses_the_current_rrule(job_template, settings):
+    settings.SCHEDULE_STORED_OCCURRENCES = 3
+    s = Schedule.objects.create(
+        name='Some Schedule',
+        rrule='DTSTART:20300112T210000Z RRULE:FREQ=DAILY;INTERVAL=1',
+        unified_job_template=job_template
+    )
+    stale = Schedule.objects.get(pk=s.pk)
+    # the schedule is changed after the scheduler loaded it
+    s.rrule = 'DTSTART:20300112T210000Z RRULE:FREQ=WEEKLY;INTERVAL=1'
+    s.save()
+    first = datetime(2030, 1, 12, 21, tzinfo=pytz.utc)
+    with mock.patch('awx.main.models.schedules.emit_channel_notification'):
+        Schedule.advance([stale], first + timedelta(hours=1))
+    s.refresh_from_db()
+    assert s.next_run == first + timedelta(weeks=1)
+    runs = list(s.occurrences.order_by('run_time').values_list('run_time', flat=True))
+    assert runs == [first + timedelta(weeks=i) for i in (1, 2, 3)]
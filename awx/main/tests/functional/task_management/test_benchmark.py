@@ -0,0 +1,88 @@
+from io import StringIO
+from unittest import mock
+
+import pytest
+
+from django.core.management import call_command
+
+from awx.main.models import Job, UnifiedJob
+from awx.main.scheduler.benchmark import seed, reset, complete_started, run_cycle
+
+
+try:
+    import pytest_benchmark  # noqa
+    HAS_BENCHMARK = True
+except ImportError:
+    HAS_BENCHMARK = False
+
+requires_benchmark = pytest.mark.skipif(not HAS_BENCHMARK, reason='pytest-benchmark is not installed')
+
+
+@pytest.fixture
+def no_side_effects():
+    # jobs are dispatched (and websocket messages sent) on commit, which
+    # never happens inside of a test
+    with mock.patch('awx.main.utils.common._schedule_task_manager'):
+        yield
+
+
+@pytest.mark.django_db
+def test_cycle_timings(no_side_effects):
+    seeded = seed(jobs=10, instance_groups=2, inventories=2,
+                  project_updates=True, inventory_sources=1)
+
+    # the first cycle only starts the project and inventory updates...
+    timer = run_cycle()
+    assert timer.calls['start_task'] == 3
+    assert timer.calls['generate_dependencies'] == 1
+    assert timer.queries['generate_dependencies'] > 0
+    assert timer.queries['total'] >= timer.queries['process_tasks']
+    assert timer.seconds['total'] >= timer.seconds['process_tasks']
+
+    # ...which the jobs have to wait on
+    assert complete_started(seeded) == 3
+    timer = run_cycle()
+    assert timer.calls['start_task'] == 10
+    assert set(
+        Job.objects.filter(pk__in=[j.pk for j in seeded.jobs]).values_list('instance_group__name', flat=True)
+    ) == set(g.name for g in seeded.instance_groups)
+
+    reset(seeded)
+    assert Job.objects.filter(status='pending', dependencies_processed=False).count() == 10
+    assert UnifiedJob.objects.count() == 10
+
+
+@pytest.mark.django_db
+def test_task_manager_benchmark_command(no_side_effects):
+    out = StringIO()
+    call_command('task_manager_benchmark', jobs=5, cycles=2, stdout=out, stderr=StringIO())
+    out = out.getvalue()
+    assert 'cycle 1: started 5 task(s)' in out
+    assert 'cycle 2: started 0 task(s)' in out
+    assert 'process_pending_tasks' in out
+    # everything is rolled back
+    assert UnifiedJob.objects.count() == 0
+
+
+@requires_benchmark
+@pytest.mark.django_db
+@pytest.mark.parametrize('jobs, instance_groups, inventory_sources', [
+    (100, 1, 0),
+    (100, 4, 0),
+    (100, 4, 1),
+])
+def test_benchmark_schedule(benchmark, no_side_effects, settings, jobs, instance_groups, inventory_sources):
+    settings.START_TASK_LIMIT = jobs
+    seeded = seed(
+        jobs=jobs, instance_groups=instance_groups, instances=2, inventories=instance_groups,
+        project_updates=bool(inventory_sources), inventory_sources=inventory_sources
+    )
+    timers = []
+
+    def cycle():
+        timers.append(run_cycle())
+
+    benchmark.pedantic(cycle, setup=lambda: reset(seeded), rounds=5)
+    benchmark.extra_info['queries'] = timers[-1].queries['total']
+    benchmark.extra_info['started'] = timers[-1].calls['start_task']
+    assert timers[-1].calls['start_task'] > 0
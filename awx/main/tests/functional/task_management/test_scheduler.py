@@ -415,3 +415,39 @@ def test_generate_dependencies_only_once(job_template_factory):
         # the first positional arg, i.e. the first argument of
         # .generate_dependencies()
         assert tm.generate_dependencies.call_args[0][0] == []
+
+
+@pytest.mark.django_db
+def test_generate_dependencies_per_inventory(default_instance_group, job_template_factory, inventory_source_factory):
+    objects = job_template_factory('jt', organization='org1', project='proj',
+                                   inventory='inv', credential='cred')
+    sources = {}
+    jobs = {}
+    for name in ('one', 'two'):
+        inventory_source = inventory_source_factory(name, source='ec2')
+        inventory_source.update_on_launch = True
+        inventory_source.save()
+        sources[name] = inventory_source
+        for i in range(2):
+            job = objects.job_template.create_job()
+            job.inventory = inventory_source.inventory
+            job.status = 'pending'
+            job.save()
+            jobs.setdefault(name, []).append(job)
+    # an earlier update which is still running covers the first inventory
+    running = sources['one'].create_inventory_update()
+    running.status = 'running'
+    running.save()
+
+    tm = TaskManager()
+    tm.all_inventory_sources = tm.get_inventory_source_tasks(jobs['one'] + jobs['two'])
+    with mock.patch.object(TaskManager, 'get_latest_inventory_updates', wraps=tm.get_latest_inventory_updates) as latest:
+        created = tm.generate_dependencies(jobs['one'] + jobs['two'])
+        assert latest.call_count == 1
+
+    # a single update is spawned for the second inventory, and shared by its jobs
+    assert [iu.inventory_source for iu in created] == [sources['two']]
+    for job in jobs['one']:
+        assert list(job.dependent_jobs.all()) == [running]
+    for job in jobs['two']:
+        assert list(job.dependent_jobs.all()) == created
@@ -1,15 +1,19 @@
 import datetime
+import json
 import multiprocessing
+import os
 import random
 import signal
 import time
+from queue import Full as QueueFull
 from unittest import mock
 
 from django.utils.timezone import now as tz_now
+import psycopg2
 import pytest
 
 from awx.main.models import Job, WorkflowJob, Instance
-from awx.main.dispatch import reaper
+from awx.main.dispatch import reaper, Publisher, MessageAssembler, encode_payload
 from awx.main.dispatch.pool import StatefulPoolWorker, WorkerPool, AutoscalePool
 from awx.main.dispatch.publish import task
 from awx.main.dispatch.worker import BaseWorker, TaskWorker
@@ -273,6 +277,73 @@ class TestAutoScaling:
         assert len(self.pool) == 2
 
 
+@pytest.mark.usefixtures("disable_database_settings")
+class TestWorkerRouting:
+
+    def setup_method(self, test_method):
+        # workers are never started, so every message stays in their backlog
+        self.pool = AutoscalePool(min_workers=4, max_workers=4)
+        self.pool.workers = [
+            StatefulPoolWorker(1000, SimpleWorker().work_loop, (i,)) for i in range(4)
+        ]
+
+    def job(self):
+        return {'task': 'awx.main.tasks.RunJob', 'args': [1]}
+
+    def test_long_tasks_skip_reserved_workers(self, settings):
+        settings.DISPATCHER_SHORT_TASK_WORKERS = 2
+        # reserved workers are marked, so they needn't be first in the list
+        # (e.g., after other workers were cleaned up and replaced)
+        self.pool.workers[1].reserved = self.pool.workers[3].reserved = True
+        for i in range(6):
+            self.pool.write(0, self.job())
+        assert [w.long_running for w in self.pool.workers] == [3, 0, 3, 0]
+
+        self.pool.write(0, {'task': 'awx.main.tasks.awx_periodic_scheduler'})
+        self.pool.write(0, {'task': 'awx.main.tasks.awx_periodic_scheduler'})
+        assert [w.backlog for w in self.pool.workers] == [3, 1, 3, 1]
+
+    def test_full_queues_keep_the_reserved_lane(self, settings):
+        settings.DISPATCHER_SHORT_TASK_WORKERS = 2
+        self.pool.workers[1].reserved = self.pool.workers[3].reserved = True
+        with mock.patch.object(self.pool.workers[0], 'put', side_effect=QueueFull):
+            # the least loaded worker is full, so the next one is used
+            assert self.pool.write(0, self.job()) == 2
+            with mock.patch.object(self.pool.workers[2], 'put', side_effect=QueueFull):
+                # ...but never one in the reserved lane
+                assert self.pool.write(0, self.job()) is None
+        assert [w.backlog for w in self.pool.workers] == [0, 0, 1, 0]
+
+    def test_reserved_workers_are_marked_when_spawned(self, settings):
+        settings.DISPATCHER_SHORT_TASK_WORKERS = 1
+        pool = AutoscalePool(min_workers=1, max_workers=3)
+        with mock.patch.object(StatefulPoolWorker, 'start'):
+            pool.init_workers(SimpleWorker().work_loop)
+            pool.up()
+            # the reserved worker goes away, and its replacement takes over
+            pool.workers.pop(0)
+            pool.up()
+        assert [w.reserved for w in pool.workers] == [False, True]
+        assert pool.reserved == [pool.workers[1]]
+
+    def test_short_tasks_avoid_long_tasks(self, settings):
+        settings.DISPATCHER_SHORT_TASK_WORKERS = 0
+        for i in range(3):
+            self.pool.write(0, self.job())
+        for i in range(3):
+            self.pool.write(0, {'task': 'awx.main.tasks.awx_periodic_scheduler'})
+        assert [w.backlog for w in self.pool.workers] == [1, 1, 1, 3]
+
+    def test_time_queued(self):
+        before = time.time()
+        worker = self.pool.workers[0]
+        worker.put(self.job())
+        worker.put(self.job())
+        for body in worker.managed_tasks.values():
+            assert before <= body['time_queued'] <= time.time()
+        assert 'queued for: 0.0s' in WorkerPool.debug(self.pool)
+
+
 @pytest.mark.usefixtures("disable_database_settings")
 class TestTaskDispatcher:
 
@@ -366,6 +437,111 @@ class TestTaskPublisher:
         assert queue == 'called'
 
 
+class TestPGPublisher:
+
+    @pytest.fixture
+    def connect(self, mocker):
+        return mocker.patch('awx.main.dispatch.pg_connect', side_effect=lambda: mock.MagicMock(closed=0))
+
+    def executed(self, conn):
+        return [c[1] for c in conn.cursor.return_value.__enter__.return_value.execute.mock_calls]
+
+    def test_connection_is_reused(self, connect):
+        publisher = Publisher()
+        publisher.notify('foo', '1')
+        publisher.notify('bar', '2')
+        assert connect.call_count == 1
+        assert self.executed(publisher.conn) == [
+            ('SELECT pg_notify(%s, %s);', ['foo', '1']),
+            ('SELECT pg_notify(%s, %s);', ['bar', '2']),
+        ]
+
+    def test_batch_is_one_round_trip(self, connect):
+        publisher = Publisher()
+        with publisher.batch():
+            publisher.notify('foo', '1')
+            with publisher.batch():
+                publisher.notify('bar', '2')
+            assert connect.call_count == 0
+        assert self.executed(publisher.conn) == [
+            ('SELECT pg_notify(%s, %s), pg_notify(%s, %s);', ['foo', '1', 'bar', '2']),
+        ]
+
+    def test_batch_is_not_published_on_error(self, connect):
+        publisher = Publisher()
+        with pytest.raises(ZeroDivisionError):
+            with publisher.batch():
+                publisher.notify('foo', '1')
+                1 / 0
+        assert connect.call_count == 0
+        publisher.notify('bar', '2')
+        assert self.executed(publisher.conn) == [('SELECT pg_notify(%s, %s);', ['bar', '2'])]
+
+    def test_reconnect_on_failure(self, connect):
+        publisher = Publisher()
+        publisher.notify('foo', '1')
+        broken = publisher.conn
+        broken.cursor.side_effect = psycopg2.OperationalError()
+        publisher.notify('foo', '2')
+        assert broken.close.call_count == 1
+        assert publisher.conn is not broken
+        assert self.executed(publisher.conn) == [('SELECT pg_notify(%s, %s);', ['foo', '2'])]
+
+    def test_connection_is_not_shared_across_fork(self, connect, mocker):
+        publisher = Publisher()
+        publisher.notify('foo', '1')
+        parent = publisher.conn
+        mocker.patch('awx.main.dispatch.os.getpid', return_value=-1)
+        publisher.notify('foo', '2')
+        assert publisher.conn is not parent
+        # closing the parent's connection would end its session
+        assert parent.close.call_count == 0
+
+    def test_chunks_are_sent_in_one_transaction(self, connect):
+        publisher = Publisher()
+        payload = json.dumps({'args': [os.urandom(16).hex() for i in range(1000)]})
+        publisher.notify('foo', payload)
+        [(sql, params)] = self.executed(publisher.conn)
+        assert sql.count('pg_notify') == len(params) / 2 > 1
+
+        assembler = MessageAssembler()
+        bodies = [assembler.feed(p) for p in params[1::2]]
+        assert bodies[-1] == json.loads(payload)
+        assert not any(bodies[:-1])
+
+
+class TestMessageEncoding:
+
+    def test_small_messages_are_untouched(self):
+        payload = json.dumps({'uuid': 'abc', 'args': [1, 2]})
+        assert encode_payload(payload) == [payload]
+        assert MessageAssembler().feed(payload) == {'uuid': 'abc', 'args': [1, 2]}
+
+    def test_compression(self, settings):
+        settings.DISPATCHER_COMPRESSION_THRESHOLD = 100
+        payload = json.dumps({'kwargs': {'host_map': {'host-{}'.format(i): i for i in range(20)}}})
+        [encoded] = encode_payload(payload)
+        assert len(encoded) < len(payload)
+        assert MessageAssembler().feed(encoded) == json.loads(payload)
+
+        settings.DISPATCHER_COMPRESSION_THRESHOLD = None
+        assert encode_payload(payload) == [payload]
+
+    def test_oversized_messages_are_chunked(self):
+        payload = json.dumps({'kwargs': {'blob': os.urandom(32 * 1024).hex(), 'name': 'ünïcode'}})
+        encoded = encode_payload(payload)
+        assert len(encoded) > 1
+        assert all(len(e.encode('utf-8')) < 8000 for e in encoded)
+
+        assembler = MessageAssembler()
+        # chunks of different messages never interleave, but a listener may
+        # see other messages before or after them
+        assert assembler.feed('["status"]') == ['status']
+        assert [assembler.feed(e) for e in encoded[:-1]] == [None] * (len(encoded) - 1)
+        assert assembler.feed(encoded[-1]) == json.loads(payload)
+        assert assembler.partial == {}
+
+
 yesterday = tz_now() - datetime.timedelta(days=1)
 
 
@@ -1,11 +1,17 @@
+from unittest import mock
 import pytest
 
+from django.core.cache import cache
+from django.db import transaction
+
 from awx.main.models import (
     Role,
     Organization,
     Project,
+    Team,
 )
 from awx.main.fields import update_role_parentage_for_instance
+from awx.main.tasks import handle_role_changes
 
 
 @pytest.mark.django_db
@@ -211,3 +217,56 @@ def test_update_parents_keeps_teams(team, project):
     assert team.member_role in project.update_role  # test prep sanity check
     update_role_parentage_for_instance(project)
     assert team.member_role in project.update_role  # actual assertion
+
+
+@pytest.mark.django_db(transaction=True)
+def test_accessible_ids_cache(organization, alice, settings):
+    settings.RBAC_ACCESS_CACHE_SECONDS = 30
+    cache.clear()
+    team = Team.objects.create(name='team', organization=organization)
+    # outside of a transaction, invalidation happens right away
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == []
+
+    # role membership changes invalidate the cached ids
+    team.member_role.members.add(alice)
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == []
+    # as do changes to the role hierarchy
+    organization.admin_role.parents.add(team.member_role)
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == [organization.pk]
+    assert list(Organization.accessible_objects(alice, 'admin_role')) == [organization]
+
+    team.member_role.members.remove(alice)
+    assert not Organization.accessible_objects(alice, 'admin_role').exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_accessible_ids_cache_limit(organization, alice, settings):
+    settings.RBAC_ACCESS_CACHE_SECONDS = 30
+    settings.RBAC_ACCESS_CACHE_MAX_IDS = 0
+    cache.clear()
+    organization.admin_role.members.add(alice)
+    # too many ids to cache, so the subquery is used
+    pk_qs = Organization.accessible_pk_qs(alice, 'admin_role')
+    assert not isinstance(pk_qs, list)
+    assert list(Organization.accessible_objects(alice, 'admin_role')) == [organization]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_accessible_ids_cache_is_invalidated_on_every_node(organization, alice, settings):
+    settings.RBAC_ACCESS_CACHE_SECONDS = 30
+    cache.clear()
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == []
+    with mock.patch.object(handle_role_changes, 'delay') as delay:
+        with transaction.atomic():
+            organization.admin_role.members.add(alice)
+            organization.member_role.members.add(alice)
+    # each node's cache is invalidated by a broadcast task, once per transaction
+    assert delay.call_count == 1
+
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == [organization.pk]
+    # a role change made on another node reaches this one through that task
+    with mock.patch('awx.main.models.rbac.bump_access_cache_generation'):
+        organization.admin_role.members.remove(alice)
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == [organization.pk]
+    handle_role_changes()
+    assert Organization.accessible_pk_qs(alice, 'admin_role') == []
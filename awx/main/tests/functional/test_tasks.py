@@ -7,12 +7,16 @@ from django.utils.timezone import now, timedelta
 from awx.main.tasks import (
     RunProjectUpdate, RunInventoryUpdate,
     awx_isolated_heartbeat,
-    isolated_manager
+    isolated_manager,
+    purge_old_stdout_files,
+    spawn_scheduled_jobs
 )
 from awx.main.models import (
     ProjectUpdate, InventoryUpdate, InventorySource,
-    Instance, InstanceGroup
+    Instance, InstanceGroup, Job, JobTemplate, Schedule
 )
+from awx.main.utils import task_manager_bulk_reschedule
+from awx.main.utils.stdout_cache import StdoutArtifact
 
 
 @pytest.fixture
@@ -144,3 +148,58 @@ class TestIsolatedManagementTask:
         iso_instance = Instance.objects.get(hostname='isolated')
         check_mock.assert_not_called()
         assert iso_instance.capacity == 103
+
+
+@pytest.mark.django_db
+class TestSpawnScheduledJobs:
+
+    rrule = 'DTSTART:20300112T210000Z RRULE:FREQ=DAILY;INTERVAL=1'
+
+    @pytest.fixture
+    def schedules(self, inventory, project):
+        schedules = []
+        for i in range(2):
+            jt = JobTemplate.objects.create(name='jt-{}'.format(i), inventory=inventory, project=project)
+            for j in range(2):
+                schedules.append(Schedule.objects.create(
+                    name='schedule-{}'.format(j), rrule=self.rrule, unified_job_template=jt
+                ))
+        return schedules
+
+    def test_jobs_are_spawned(self, schedules):
+        with mock.patch('awx.main.tasks.emit_channel_notification') as emit, \
+                mock.patch('awx.main.utils.common._schedule_task_manager') as schedule_task_manager:
+            with task_manager_bulk_reschedule():
+                spawn_scheduled_jobs([s.pk for s in schedules])
+        assert schedule_task_manager.call_count == 1
+        assert emit.call_count == 4
+        for s in schedules:
+            job = Job.objects.get(schedule=s)
+            assert job.status == 'pending'
+            assert job.launch_type == 'scheduled'
+            assert job.job_template_id == s.unified_job_template_id
+
+    def test_invalid_license(self, schedules):
+        with mock.patch('awx.main.tasks.emit_channel_notification') as emit:
+            spawn_scheduled_jobs([schedules[0].pk], invalid_license=Exception('no license'))
+        job = Job.objects.get(schedule=schedules[0])
+        assert job.status == 'failed'
+        assert job.job_explanation == 'no license'
+        assert not emit.called
+
+
+@pytest.mark.django_db
+def test_purge_old_stdout_files_removes_cached_stdout(settings, tmpdir):
+    settings.STDOUT_CACHE_ROOT = str(tmpdir.mkdir('cache'))
+    settings.JOBOUTPUT_ROOT = str(tmpdir.join('missing'))
+    jobs = [Job.objects.create() for i in range(3)]
+    for job in jobs:
+        StdoutArtifact('job', job.pk).build(['some output\n'])
+    jobs[0].delete()
+
+    purge_old_stdout_files()
+    assert sorted(a.pk for a in StdoutArtifact.all()) == [job.pk for job in jobs[1:]]
+
+    settings.LOCAL_STDOUT_EXPIRE_TIME = -1
+    purge_old_stdout_files()
+    assert list(StdoutArtifact.all()) == []
@@ -1,6 +1,7 @@
 import datetime
 
 from awx.main.analytics.broadcast_websocket import FixedSlidingWindow
+from awx.main.analytics.broadcast_websocket import BroadcastWebsocketStats
 from awx.main.analytics.broadcast_websocket import dt_to_seconds
 
 
@@ -67,3 +68,16 @@ class TestFixedSlidingWindow():
 
         assert 0 == fsw.render(self.ts(minute=1, second=20, microsecond=0)), \
             "F. First second one minute after all record() calls"
+
+
+def test_batched_messages_received():
+    stats = BroadcastWebsocketStats('awx-1', 'awx-2')
+    stats.record_message_received(count=10, size=200)
+    stats.record_message_received(size=50)
+    stats.record_interest(3)
+    serialized = stats.serialize()
+    assert 'awx_awx_2_messages_received_total 11.0' in serialized
+    assert 'awx_awx_2_frames_received_total 2.0' in serialized
+    assert 'awx_awx_2_bytes_received_total 250.0' in serialized
+    assert 'awx_awx_2_subscribed_groups 3.0' in serialized
+    assert 'awx_awx_2_messages_received_per_minute 11.0' in serialized
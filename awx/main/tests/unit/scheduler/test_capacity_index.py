@@ -0,0 +1,75 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from awx.main.models import InstanceGroup
+from awx.main.scheduler.capacity import CapacityIndex
+
+
+def Inst(hostname, remaining_capacity, capacity=100, jobs_running=0):
+    return SimpleNamespace(hostname=hostname, remaining_capacity=remaining_capacity,
+                           capacity=capacity, jobs_running=jobs_running)
+
+
+def index_for(groups):
+    index = CapacityIndex()
+    instances = {i.hostname: i for members in groups.values() for i in members}
+    instances = [instances[hostname] for hostname in sorted(instances)]
+    for instance in instances:
+        index.add_instance(instance)
+    for name, members in groups.items():
+        index.add_group(name, sorted(members, key=lambda i: i.hostname))
+    return index
+
+
+@pytest.mark.parametrize('remaining, impact, expected', [
+    ([100], 100, 'a'),
+    ([100, 100], 100, 'a'),
+    ([50, 100], 100, 'b'),
+    ([50, 0, 20, 100, 100, 100, 30, 20], 100, 'd'),
+    ([50, 0, 20, 99, 11, 1, 5, 99], 100, None),
+])
+def test_fit_task(remaining, impact, expected):
+    instances = [Inst(chr(ord('a') + n), r) for n, r in enumerate(remaining)]
+    picked = index_for({'tower': instances}).fit_task_to_most_remaining_capacity_instance('tower', impact)
+    assert (picked.hostname if picked else None) == expected
+
+
+def test_largest_idle():
+    instances = [Inst('a', 0, 100), Inst('b', 0, 200), Inst('c', 0, 10000, jobs_running=1), Inst('d', 0, 700), Inst('e', 0, 699)]
+    index = index_for({'tower': instances})
+    assert index.find_largest_idle_instance('tower').hostname == 'd'
+    index.consume(instances[3], 10)
+    assert index.find_largest_idle_instance('tower').hostname == 'e'
+
+
+def test_capacity_is_shared_by_overlapping_groups():
+    a, b, c = Inst('a', 100), Inst('b', 80), Inst('c', 60)
+    index = index_for({'one': [a, b], 'two': [b, c]})
+    assert index.fit_task_to_most_remaining_capacity_instance('two', 10) is b
+    index.consume(b, 50)
+    assert b.remaining_capacity == 30 and b.jobs_running == 1
+    assert index.fit_task_to_most_remaining_capacity_instance('two', 10) is c
+    assert index.fit_task_to_most_remaining_capacity_instance('one', 10) is a
+    assert index.fit_task_to_most_remaining_capacity_instance('one', 101) is None
+    assert index.find_largest_idle_instance('two') is c
+
+
+def test_matches_linear_scan():
+    rng = random.Random(0)
+    instances = [Inst('node-{:02d}'.format(n), rng.randint(0, 200), rng.randint(1, 200)) for n in range(30)]
+    groups = {'group-{}'.format(g): rng.sample(instances, 10) for g in range(6)}
+    index = index_for(groups)
+    for _ in range(500):
+        name = rng.choice(list(groups))
+        impact = rng.randint(1, 60)
+        members = sorted(groups[name], key=lambda i: i.hostname)
+        task = SimpleNamespace(task_impact=impact)
+        expected = InstanceGroup.fit_task_to_most_remaining_capacity_instance(task, members) or \
+            InstanceGroup.find_largest_idle_instance(members)
+        picked = index.fit_task_to_most_remaining_capacity_instance(name, impact) or \
+            index.find_largest_idle_instance(name)
+        assert picked is expected
+        if picked:
+            index.consume(picked, impact)
@@ -0,0 +1,107 @@
+from collections import deque
+from unittest import mock
+import json
+import re
+
+import pytest
+from django.db import DataError, OperationalError, connection
+from django.utils.timezone import now
+
+from awx.main.dispatch.worker.callback import CallbackBrokerWorker
+from awx.main.models import JobEvent, ProjectUpdateEvent
+
+
+@pytest.fixture
+def worker():
+    # avoid __init__, which connects to redis
+    return CallbackBrokerWorker.__new__(CallbackBrokerWorker)
+
+
+def test_persist_bisects_to_isolate_bad_events(worker):
+    events = [JobEvent(counter=i) for i in range(16)]
+    saved = []
+
+    def write(cls, batch):
+        if any(e.counter in (3, 11) for e in batch):
+            raise DataError()
+        saved.extend(batch)
+
+    with mock.patch('awx.main.dispatch.worker.callback.logger') as logger:
+        with mock.patch.object(worker, 'events_saved') as events_saved:
+            worker.persist(write, JobEvent, events)
+    assert sorted(e.counter for e in saved) == [i for i in range(16) if i not in (3, 11)]
+    assert sorted(e.counter for call in events_saved.call_args_list for e in call[0][1]) == \
+        [i for i in range(16) if i not in (3, 11)]
+    assert logger.exception.call_count == 2
+
+
+def test_persist_reraises_connectivity_errors(worker):
+    write = mock.Mock(side_effect=OperationalError())
+    with pytest.raises(OperationalError):
+        worker.persist(write, JobEvent, [JobEvent(counter=i) for i in range(4)])
+    assert write.call_count == 1
+
+
+def test_read_batch_drains_queue_in_order(worker, settings):
+    settings.JOB_EVENT_READ_BATCH_SIZE = 100
+    settings.JOB_EVENT_WORKERS = 2
+    worker.pending = deque()
+    worker.batch_size = 10
+    worker.total = 0
+    worker.redis = mock.MagicMock()
+    worker.redis.blpop.return_value = (settings.CALLBACK_QUEUE, json.dumps({'counter': 0}))
+    pipe = worker.redis.pipeline.return_value
+    pipe.execute.return_value = [[json.dumps({'counter': i}) for i in range(1, 11)], True, 60]
+
+    with mock.patch.object(worker, 'record_statistics'):
+        assert [worker.read(None)['counter'] for i in range(11)] == list(range(11))
+    assert worker.redis.blpop.call_count == 1
+    assert worker.total == 11
+    pipe.lrange.assert_called_once_with(settings.CALLBACK_QUEUE, 0, 9)
+    pipe.ltrim.assert_called_once_with(settings.CALLBACK_QUEUE, 10, -1)
+    # the next batch is sized to this worker's share of the remaining backlog
+    assert worker.batch_size == 30
+
+
+def test_retried_flush_skips_written_events(worker, settings):
+    settings.JOB_EVENT_PERSISTENCE_MODE = 'bulk_create'
+    worker.pending_parents = {}
+    worker.buff = {
+        JobEvent: [JobEvent(counter=1, job_id=1, job_created=now())],
+        ProjectUpdateEvent: [ProjectUpdateEvent(counter=2, project_update_id=1, job_created=now())],
+    }
+    failures = [OperationalError()]
+    written = []
+
+    def bulk_create_events(cls, events):
+        if cls is ProjectUpdateEvent and failures:
+            raise failures.pop()
+        written.extend(e.counter for e in events)
+
+    with mock.patch.object(worker, 'bulk_create_events', bulk_create_events), \
+            mock.patch('awx.main.dispatch.worker.callback.predates_event_partitions', return_value=False), \
+            mock.patch('awx.main.dispatch.worker.callback.inc_counter'), \
+            mock.patch('awx.main.dispatch.worker.callback.emit_event_detail') as emit_event_detail:
+        with pytest.raises(OperationalError):
+            worker.flush_buffer(now())
+        # perform_work() retries the flush with the same buffer
+        worker.flush_buffer(now())
+    assert written == [1, 2]
+    assert [call[0][0].counter for call in emit_event_detail.call_args_list] == [1, 2]
+
+
+def test_copy_events_escapes_values(worker):
+    event = JobEvent(pk=1, job_id=2, job_created=now(), counter=3, host_id=None,
+                     stdout='say "hi",\nbye', play='')
+    with mock.patch.object(connection, 'cursor') as cursor:
+        worker.copy_events(JobEvent, [event])
+    sql, buff = cursor.return_value.__enter__.return_value.copy_expert.call_args[0]
+    columns = [c.strip('"') for c in sql[sql.index('(') + 1:sql.index(')')].split(', ')]
+    # every value is quoted (with quotes doubled), except NULL which is empty
+    values = re.findall(r'(?:^|,)("(?:[^"]|"")*"|)', buff.getvalue()[:-1], re.S)
+    row = dict(zip(columns, values))
+    assert len(values) == len(columns)
+    assert row['stdout'] == '"say ""hi"",\nbye"'
+    assert row['play'] == '""'
+    assert row['host_id'] == ''
+    assert row['counter'] == '"3"'
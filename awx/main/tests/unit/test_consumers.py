@@ -0,0 +1,236 @@
+import asyncio
+import json
+from unittest import mock
+
+import pytest
+
+from awx.main.consumers import (
+    BroadcastConsumer, ChannelEmitter, EventConsumer, emit_channel_notification, subscription_options
+)
+from awx.main.models.events import EventRateLimiter
+from awx.main.wsbroadcast import decompress_broadcast_msgs
+
+
+class FakeChannelLayer:
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+def test_batch_sends_one_message_per_group(settings):
+    settings.BROADCAST_WEBSOCKET_GROUP_NAME = 'broadcast-group_send'
+    layer = FakeChannelLayer()
+    emitter = ChannelEmitter()
+    with mock.patch('awx.main.consumers.get_channel_layer', return_value=layer):
+        with emitter.batch():
+            with emitter.batch():
+                for i in range(3):
+                    emitter.notify('job_events-1', str(i))
+            emitter.notify('job_events-2', 'x')
+            assert layer.sent == []
+    assert layer.sent[0] == ('job_events-1', {'type': 'internal.batch', 'texts': ['0', '1', '2']})
+    assert layer.sent[1] == ('broadcast-group_send', {'type': 'broadcast.messages', 'group': 'job_events-1', 'texts': ['0', '1', '2']})
+    assert layer.sent[2] == ('job_events-2', {'type': 'internal.message', 'text': 'x'})
+    assert len(layer.sent) == 4
+
+
+def test_batch_is_not_sent_on_error():
+    layer = FakeChannelLayer()
+    emitter = ChannelEmitter()
+    with mock.patch('awx.main.consumers.get_channel_layer', return_value=layer):
+        with pytest.raises(ZeroDivisionError):
+            with emitter.batch():
+                emitter.notify('job_events-1', '0')
+                1 / 0
+        assert layer.sent == []
+        # and the next notification isn't batched
+        emitter.notify('job_events-1', '1')
+    assert layer.sent[0] == ('job_events-1', {'type': 'internal.message', 'text': '1'})
+
+
+def test_event_loop_is_reused():
+    layer = FakeChannelLayer()
+    emitter = ChannelEmitter()
+    with mock.patch('awx.main.consumers.get_channel_layer', return_value=layer):
+        emitter.notify('jobs-status_changed', '{}')
+        loop = emitter.event_loop()
+        emitter.notify('jobs-status_changed', '{}')
+    assert emitter.event_loop() is loop
+    assert len(layer.sent) == 4
+
+
+def test_emit_channel_notification_dumps_payload():
+    with mock.patch('awx.main.consumers.emitter') as emitter:
+        emit_channel_notification('schedules-changed', {'id': 1})
+    emitter.notify.assert_called_once_with('schedules-changed', '{"id": 1}')
+
+
+def test_event_rate_limit():
+    limiter = EventRateLimiter()
+    with mock.patch('awx.main.models.events.time.time', return_value=100.5):
+        assert [limiter.allow('job_events-1', 2) for i in range(3)] == [True, True, False]
+        assert limiter.allow('job_events-2', 2)
+    with mock.patch('awx.main.models.events.time.time', return_value=101.0):
+        assert limiter.allow('job_events-1', 2)
+
+
+@pytest.mark.parametrize('options', [
+    [], {'events': 'runner_on_ok'}, {'fields': [1]}, {'max_events_per_second': 0},
+    {'max_events_per_second': True}, {'bogus': 1},
+])
+def test_invalid_subscription_options(options):
+    with pytest.raises(ValueError):
+        subscription_options(options)
+
+
+class TestEventConsumer:
+
+    def setup_method(self, method):
+        self.consumer = EventConsumer({'type': 'websocket'})
+        self.consumer.channel_name = 'test'
+        self.sent = []
+
+        async def send(text):
+            self.sent.append(json.loads(text))
+        self.consumer.send = send
+
+    def deliver(self, *messages):
+        loop = asyncio.new_event_loop()
+
+        async def _deliver():
+            for message in messages:
+                await self.consumer.deliver(json.dumps(message))
+            if self.consumer.sender:
+                await self.consumer.sender
+
+        async def sleep(delay):
+            pass
+        with mock.patch('awx.main.consumers.asyncio.sleep', new=sleep):
+            loop.run_until_complete(_deliver())
+        loop.close()
+
+    def test_filters(self):
+        self.consumer.options = subscription_options({'events': ['runner_on_ok', 'playbook_on_stats'], 'fields': ['stdout']})
+        self.deliver(
+            {'id': 1, 'group_name': 'job_events', 'event': 'runner_on_ok', 'stdout': 'ok', 'event_data': {'res': {}}},
+            {'id': 2, 'group_name': 'job_events', 'event': 'runner_on_skipped', 'stdout': 'skipped'},
+            {'unified_job_id': 1, 'group_name': 'jobs', 'status': 'running'},
+        )
+        assert self.sent == [
+            {'id': 1, 'group_name': 'job_events', 'event': 'runner_on_ok', 'stdout': 'ok'},
+            {'unified_job_id': 1, 'group_name': 'jobs', 'status': 'running'},
+        ]
+
+    def test_summary(self):
+        self.consumer.options = subscription_options({'summary': True})
+        self.deliver({'event': 'runner_on_ok'}, {'event': 'playbook_on_stats'})
+        assert self.sent == [{'event': 'playbook_on_stats'}]
+
+    def test_rate_limited_buffer(self, settings):
+        settings.WEBSOCKET_SEND_BUFFER_SIZE = 3
+        self.consumer.options = subscription_options({'max_events_per_second': 1})
+        self.deliver(
+            {'unified_job_id': 1, 'group_name': 'jobs', 'status': 'pending'},
+            {'event': 'runner_on_ok', 'counter': 1},
+            {'unified_job_id': 1, 'group_name': 'jobs', 'status': 'running'},
+            {'event': 'runner_on_ok', 'counter': 2},
+            {'event': 'runner_on_ok', 'counter': 3},
+        )
+        # the pending status is replaced by running, and the oldest message is
+        # dropped once the buffer is full
+        assert self.sent == [
+            {'unified_job_id': 1, 'group_name': 'jobs', 'status': 'running'},
+            {'event': 'runner_on_ok', 'counter': 2},
+            {'event': 'runner_on_ok', 'counter': 3},
+        ]
+
+    def test_buffer_without_rate_limit(self, settings):
+        settings.WEBSOCKET_SEND_BUFFER_SIZE = 2
+        settings.WEBSOCKET_MAX_EVENTS_PER_SECOND = None
+        # messages which arrive while the client is behind are buffered (and
+        # bounded) even without a rate
+        self.deliver(
+            {'event': 'runner_on_ok', 'counter': 1},
+            {'event': 'runner_on_ok', 'counter': 2},
+            {'event': 'runner_on_ok', 'counter': 3},
+        )
+        assert self.sent == [
+            {'event': 'runner_on_ok', 'counter': 2},
+            {'event': 'runner_on_ok', 'counter': 3},
+        ]
+        assert self.consumer.sender is None
+
+    def test_access_checks_are_batched_and_cached(self, settings):
+        settings.WEBSOCKET_ACCESS_CACHE_SECONDS = 30
+        queries = []
+
+        async def user_visible_object_ids(access_cls, oids):
+            queries.append(list(oids))
+            return {str(oid) for oid in oids if oid % 2}
+        self.consumer.user_visible_object_ids = user_visible_object_ids
+
+        loop = asyncio.new_event_loop()
+        visible = loop.run_until_complete(self.consumer.visible_object_ids('job_events', None, [1, 2, 3]))
+        assert visible == {'1', '3'}
+        visible = loop.run_until_complete(self.consumer.visible_object_ids('job_events', None, [2, 3, 4, 5]))
+        assert visible == {'3', '5'}
+        loop.close()
+        assert queries == [[1, 2, 3], [4, 5]]
+
+
+    def test_open_connections_refresh_subscriptions(self):
+        self.consumer.scope['session'] = {'groups': {'jobs-status_changed'}}
+        sleeps = []
+
+        async def sleep(delay):
+            sleeps.append(delay)
+            if len(sleeps) > 2:
+                raise asyncio.CancelledError()
+
+        loop = asyncio.new_event_loop()
+        with mock.patch('awx.main.consumers.asyncio.sleep', new=sleep), \
+                mock.patch('awx.main.wsbroadcast.record_subscriptions') as record_subscriptions:
+            with pytest.raises(asyncio.CancelledError):
+                loop.run_until_complete(self.consumer.refresh_subscriptions())
+        loop.close()
+        assert record_subscriptions.call_args_list == [
+            mock.call('test', {'jobs-status_changed'}),
+            mock.call('test', {'jobs-status_changed'}),
+        ]
+
+
+class TestBroadcastConsumer:
+
+    def setup_method(self, method):
+        self.consumer = BroadcastConsumer({'type': 'websocket'})
+        self.consumer.interest = None
+        self.consumer.compress = False
+        self.sent = []
+
+        async def send(text_data=None, bytes_data=None):
+            self.sent.append(text_data or bytes_data)
+        self.consumer.send = send
+
+    def broadcast(self, *messages):
+        loop = asyncio.new_event_loop()
+        for group, texts in messages:
+            loop.run_until_complete(self.consumer.broadcast_messages({'group': group, 'texts': texts}))
+        loop.close()
+
+    def test_sends_everything_until_interest_is_known(self):
+        self.broadcast(('job_events-1', ['a', 'b']))
+        assert [json.loads(text) for text in self.sent] == [
+            {'group': 'job_events-1', 'message': 'a'},
+            {'group': 'job_events-1', 'message': 'b'},
+        ]
+
+    def test_interest(self):
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.consumer.receive_json({'interest': ['job_events-2'], 'compress': True}))
+        loop.close()
+        self.broadcast(('job_events-1', ['a', 'b']), ('job_events-2', ['c', 'd']))
+        assert len(self.sent) == 1
+        assert decompress_broadcast_msgs(self.sent[0]) == ('job_events-2', ['c', 'd'])
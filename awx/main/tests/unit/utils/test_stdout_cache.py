@@ -0,0 +1,55 @@
+# awx.main.utils.stdout_cache
+import pytest
+
+from awx.main.utils.stdout_cache import StdoutArtifact
+
+
+@pytest.fixture
+def artifact(settings, tmpdir, mocker):
+    settings.STDOUT_CACHE_ROOT = str(tmpdir)
+    mocker.patch.object(StdoutArtifact, 'BLOCK_LINES', 10)
+    return StdoutArtifact('job', 42)
+
+
+@pytest.fixture
+def stdout():
+    return ''.join('line {}\n'.format(i) for i in range(95))
+
+
+def test_build_from_chunks_split_mid_line(artifact, stdout):
+    artifact.build([stdout[i:i + 7] for i in range(0, len(stdout), 7)])
+    assert artifact.exists()
+    assert artifact.lines == 95
+    assert artifact.size == len(stdout)
+    assert len(artifact.index['blocks']) == 10
+    assert ''.join(artifact.iter_chunks()) == stdout
+    with artifact.open() as f:
+        assert f.read() == stdout
+
+
+@pytest.mark.parametrize('start, end', [(0, 1), (5, 25), (9, 11), (90, 95), (94, 200), (95, 95)])
+def test_read_lines(artifact, stdout, start, end):
+    artifact.build([stdout])
+    assert artifact.read_lines(start, end) == ''.join(stdout.splitlines(True)[start:end])
+
+
+def test_read_lines_keeps_carriage_returns(artifact):
+    artifact.build(['one\rtwo\n', 'three\n'])
+    assert artifact.lines == 2
+    assert artifact.read_lines(1, 2) == 'three\n'
+
+
+def test_empty_stdout(artifact):
+    artifact.build([])
+    assert artifact.lines == 0
+    assert list(artifact.iter_chunks()) == []
+    assert artifact.read_lines(0, 10) == ''
+
+
+def test_all_and_delete(artifact, stdout):
+    artifact.build([stdout])
+    StdoutArtifact('project_update', 7).build([stdout])
+    assert sorted((a.name, a.pk) for a in StdoutArtifact.all()) == [('job', 42), ('project_update', 7)]
+    artifact.delete()
+    assert not artifact.exists()
+    assert [(a.name, a.pk) for a in StdoutArtifact.all()] == [('project_update', 7)]
@@ -1,8 +1,12 @@
 # Copyright (c) 2017 Ansible by Red Hat
 # All Rights Reserved.
 
+from datetime import datetime, timedelta
 from itertools import chain
 
+from django.db import connection, transaction, DatabaseError
+from django.utils.timezone import utc
+
 
 def get_all_field_names(model):
     # Implements compatibility with _meta.get_all_field_names
@@ -14,3 +18,107 @@ def get_all_field_names(model):
         # GenericForeignKey from the results.
         if not (field.many_to_one and field.related_model is None)
     )))
+
+
+# Event tables are range partitioned by job_created (the created time of the
+# job each event belongs to), one partition per (UTC) day; see
+# awx/main/migrations/0125_event_partitions.py
+EVENT_PARTITION_MIGRATION = '0125_event_partitions'
+
+_created_partitions = set()
+_partition_epoch = []
+
+
+def partition_bounds(when):
+    start = when.astimezone(utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+def partition_name(tblname, start):
+    return f'{tblname}_{start:%Y%m%d}'
+
+
+def create_partition(tblname, when):
+    '''
+    Create (if it doesn't exist yet) the partition of an event table that
+    holds the events of jobs created at `when`.
+    '''
+    if connection.vendor != 'postgresql':
+        return
+    start, end = partition_bounds(when)
+    name = partition_name(tblname, start)
+    if name in _created_partitions:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is None:
+            try:
+                with transaction.atomic():
+                    cursor.execute(
+                        f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {tblname} '
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');"
+                    )
+            except DatabaseError:
+                # another process may have created it at the same time
+                cursor.execute('SELECT to_regclass(%s)', [name])
+                if cursor.fetchone()[0] is None:
+                    raise
+    _created_partitions.add(name)
+
+
+def event_partitions(tblname):
+    '''
+    Return a (name, start, end) tuple for each partition of an event table.
+    '''
+    if connection.vendor != 'postgresql':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+            'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+            'WHERE parent.relname = %s ORDER BY child.relname',
+            [tblname]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        start = datetime.strptime(name[len(tblname) + 1:], '%Y%m%d').replace(tzinfo=utc)
+        partitions.append((name, start, start + timedelta(days=1)))
+    return partitions
+
+
+def table_exists(tblname):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [tblname])
+            return cursor.fetchone()[0] is not None
+    return tblname in connection.introspection.table_names()
+
+
+def get_event_partition_epoch():
+    '''
+    Return when the event tables were partitioned. Jobs created before then
+    keep their events in the _unpartitioned_ tables.
+    '''
+    if not _partition_epoch:
+        from django.db.migrations.recorder import MigrationRecorder
+        migration = MigrationRecorder.Migration.objects.filter(
+            app='main', name=EVENT_PARTITION_MIGRATION
+        ).first()
+        if migration is None:
+            # not migrated yet (e.g., a process started before the upgrade
+            # finished); look again next time
+            return None
+        _partition_epoch.append(migration.applied)
+    return _partition_epoch[0]
+
+
+def predates_event_partitions(when):
+    '''
+    Whether the events of a job created at `when` belong in the
+    _unpartitioned_ tables; this decides both where they are saved and where
+    they are read from.
+    '''
+    epoch = get_event_partition_epoch()
+    return bool(epoch and when and when < epoch)
@@ -0,0 +1,163 @@
+# Copyright (c) 2020 Ansible by Red Hat
+# All Rights Reserved.
+
+import gzip
+import json
+import logging
+import mmap
+import os
+import tempfile
+import zlib
+from io import StringIO
+
+from django.conf import settings
+
+
+logger = logging.getLogger('awx.main.utils.stdout_cache')
+
+
+__all__ = ['StdoutArtifact']
+
+
+class StdoutArtifact(object):
+    '''
+    A compacted copy of the stdout of a finished job, stored on local disk.
+
+    The stdout is written as a series of independently gzipped blocks of
+    `BLOCK_LINES` lines each; concatenated gzip members are themselves a valid
+    gzip file, so the whole output can be streamed with `gzip.open`.
+    Alongside it, a JSON index records the first line and byte offset of
+    every block, so that a range of lines can be served by decompressing only
+    the blocks which contain it.
+    '''
+
+    BLOCK_LINES = 1000
+
+    def __init__(self, name, pk):
+        self.name = name
+        self.pk = pk
+        self._index = None
+
+    @property
+    def path(self):
+        return os.path.join(settings.STDOUT_CACHE_ROOT, '{}-{}.out.gz'.format(self.name, self.pk))
+
+    @property
+    def index_path(self):
+        return self.path + '.idx'
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    @property
+    def index(self):
+        if self._index is None:
+            with open(self.index_path, 'r') as f:
+                self._index = json.load(f)
+        return self._index
+
+    @property
+    def size(self):
+        return self.index['size']
+
+    @property
+    def lines(self):
+        return self.index['lines']
+
+    def build(self, chunks):
+        '''
+        Write the artifact from an iterable of stdout text chunks.
+
+        Files are written to temporary paths and moved into place, so
+        concurrent readers (or builders) never see a partial artifact.
+        '''
+        os.makedirs(settings.STDOUT_CACHE_ROOT, exist_ok=True)
+        index = {'lines': 0, 'size': 0, 'blocks': []}
+        with tempfile.NamedTemporaryFile(dir=settings.STDOUT_CACHE_ROOT, delete=False) as out:
+            block, pending = [], ''
+
+            def write_block():
+                data = gzip.compress(''.join(block).encode('utf-8'))
+                index['blocks'].append([index['lines'] - len(block), out.tell(), len(data)])
+                out.write(data)
+                del block[:]
+
+            for chunk in chunks:
+                index['size'] += len(chunk)
+                lines = (pending + chunk).split('\n')
+                pending = lines.pop()
+                for line in lines:
+                    block.append(line + '\n')
+                    index['lines'] += 1
+                    if len(block) >= self.BLOCK_LINES:
+                        write_block()
+            if pending:
+                block.append(pending)
+                index['lines'] += 1
+            if block:
+                write_block()
+        try:
+            os.rename(out.name, self.path)
+            with tempfile.NamedTemporaryFile(mode='w', dir=settings.STDOUT_CACHE_ROOT, delete=False) as f:
+                json.dump(index, f)
+            os.rename(f.name, self.index_path)
+        except Exception:
+            self.delete()
+            raise
+        self._index = index
+        logger.debug('Built stdout artifact {} ({} lines, {} bytes).'.format(self.path, index['lines'], index['size']))
+
+    def _blocks(self, start_line=0, end_line=None):
+        blocks = self.index['blocks']
+        with open(self.path, 'rb') as f:
+            if not blocks or os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for i, (first_line, offset, length) in enumerate(blocks):
+                    last_line = blocks[i + 1][0] if i + 1 < len(blocks) else self.lines
+                    if last_line <= start_line:
+                        continue
+                    if end_line is not None and first_line >= end_line:
+                        break
+                    text = zlib.decompress(m[offset:offset + length], 16 + zlib.MAX_WBITS)
+                    yield first_line, text.decode('utf-8')
+
+    def iter_chunks(self):
+        for _, text in self._blocks():
+            yield text
+
+    def read_lines(self, start_line, end_line):
+        '''
+        Return the text of lines [start_line, end_line).
+        '''
+        content = []
+        for first_line, text in self._blocks(start_line, end_line):
+            for lineno, line in enumerate(StringIO(text).readlines(), start=first_line):
+                if start_line <= lineno < end_line:
+                    content.append(line)
+        return ''.join(content)
+
+    @classmethod
+    def all(cls):
+        '''
+        Yield every artifact found in `settings.STDOUT_CACHE_ROOT`.
+        '''
+        if not os.path.isdir(settings.STDOUT_CACHE_ROOT):
+            return
+        for filename in os.listdir(settings.STDOUT_CACHE_ROOT):
+            if not filename.endswith('.out.gz'):
+                continue
+            name, _, pk = filename[:-len('.out.gz')].rpartition('-')
+            if name and pk.isdigit():
+                yield cls(name, int(pk))
+
+    def open(self):
+        return gzip.open(self.path, 'rt', encoding='utf-8', newline='\n')
+
+    def delete(self):
+        for path in (self.index_path, self.path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._index = None
@@ -1,9 +1,12 @@
 import json
 import logging
 import asyncio
+import time
+import zlib
 
 import aiohttp
 from aiohttp import client_exceptions
+import redis
 
 from channels.layers import get_channel_layer
 
@@ -19,6 +22,21 @@ from awx.main.analytics.broadcast_websocket import (
 
 logger = logging.getLogger('awx.main.wsbroadcast')
 
+# redis hash of websocket channel name -> the groups it's subscribed to
+BROADCAST_WEBSOCKET_SUBSCRIPTIONS_KEY = 'broadcast_websocket_subscriptions'
+
+# group used to tell the local broadcast process that subscriptions changed
+BROADCAST_WEBSOCKET_INTEREST_GROUP = 'broadcast-interest_changed'
+
+# subscriptions not updated for this long are assumed to belong to a
+# connection that went away without cleaning up; this matches the channel
+# layer's default group expiry
+BROADCAST_WEBSOCKET_SUBSCRIPTION_EXPIRY = 86400
+
+# how often open connections record their subscriptions again, so that they
+# aren't mistaken for abandoned ones
+BROADCAST_WEBSOCKET_SUBSCRIPTION_REFRESH = 3600
+
 
 def wrap_broadcast_msg(group, message: str):
     # TODO: Maybe wrap as "group","message" so that we don't need to
@@ -30,6 +48,43 @@ def unwrap_broadcast_msg(payload: dict):
     return (payload['group'], payload['message'])
 
 
+def compress_broadcast_msgs(group, messages):
+    return zlib.compress(json.dumps(dict(group=group, messages=messages)).encode('utf-8'))
+
+
+def decompress_broadcast_msgs(data: bytes):
+    payload = json.loads(zlib.decompress(data).decode('utf-8'))
+    return (payload['group'], payload['messages'])
+
+
+def record_subscriptions(channel_name, groups):
+    '''
+    Record the groups a local websocket connection is subscribed to, so that
+    the broadcast process can tell other nodes which messages it wants.
+    '''
+    conn = redis.Redis.from_url(settings.BROKER_URL)
+    if groups:
+        conn.hset(BROADCAST_WEBSOCKET_SUBSCRIPTIONS_KEY, channel_name,
+                  json.dumps(dict(groups=sorted(groups), time=time.time())))
+    else:
+        conn.hdel(BROADCAST_WEBSOCKET_SUBSCRIPTIONS_KEY, channel_name)
+
+
+def get_local_subscriptions():
+    conn = redis.Redis.from_url(settings.BROKER_URL)
+    groups, expired = set(), []
+    cutoff = time.time() - BROADCAST_WEBSOCKET_SUBSCRIPTION_EXPIRY
+    for channel_name, value in conn.hgetall(BROADCAST_WEBSOCKET_SUBSCRIPTIONS_KEY).items():
+        subscription = json.loads(value)
+        if subscription['time'] < cutoff:
+            expired.append(channel_name)
+        else:
+            groups.update(subscription['groups'])
+    if expired:
+        conn.hdel(BROADCAST_WEBSOCKET_SUBSCRIPTIONS_KEY, *expired)
+    return groups
+
+
 def get_broadcast_hosts():
     Instance = apps.get_model('main', 'Instance')
     instances = Instance.objects.filter(rampart_groups__controller__isnull=True) \
@@ -64,6 +119,10 @@ class WebsocketTask():
         self.protocol = protocol
         self.verify_ssl = verify_ssl
         self.channel_layer = None
+        self.websocket = None
+        # the groups this node has subscribers for; None until known, in
+        # which case the remote host sends everything
+        self.interest = None
 
     async def run_loop(self, websocket: aiohttp.ClientWebSocketResponse):
         raise RuntimeError("Implement me")
@@ -125,13 +184,40 @@ class WebsocketTask():
 
 
 class BroadcastWebsocketTask(WebsocketTask):
+    def advertise(self, interest):
+        self.interest = interest
+        self.stats.record_interest(len(interest))
+        if self.websocket is not None and not self.websocket.closed:
+            self.event_loop.create_task(self.send_interest(self.websocket))
+
+    async def send_interest(self, websocket: aiohttp.ClientWebSocketResponse):
+        # ask the remote host to only send messages for groups with local
+        # subscribers, batched and compressed
+        try:
+            await websocket.send_json({'interest': sorted(self.interest), 'compress': True})
+        except Exception as e:
+            logger.warn(f"Failed to send subscriptions from {self.name} to {self.remote_host}: '{e}'.")
+
     async def run_loop(self, websocket: aiohttp.ClientWebSocketResponse):
-        async for msg in websocket:
-            self.stats.record_message_received()
+        from awx.main.consumers import channel_layer_message # noqa
 
+        self.websocket = websocket
+        if self.interest is not None:
+            await self.send_interest(websocket)
+        async for msg in websocket:
             if msg.type == aiohttp.WSMsgType.ERROR:
                 break
+            elif msg.type == aiohttp.WSMsgType.BINARY:
+                try:
+                    (group, messages) = decompress_broadcast_msgs(msg.data)
+                except (zlib.error, ValueError, KeyError):
+                    logger.warn("Failed to decode compressed broadcast message")
+                    continue
+                self.stats.record_message_received(count=len(messages), size=len(msg.data))
+
+                await self.channel_layer.group_send(group, channel_layer_message(messages))
             elif msg.type == aiohttp.WSMsgType.TEXT:
+                self.stats.record_message_received(size=len(msg.data))
                 try:
                     payload = json.loads(msg.data)
                 except json.JSONDecodeError:
@@ -159,6 +245,32 @@ class BroadcastWebsocketManager(object):
         self.broadcast_tasks = dict()
         self.local_hostname = get_local_host()
         self.stats_mgr = BroadcastWebsocketStatsManager(self.event_loop, self.local_hostname)
+        self.interest = None
+
+    async def run_interest_loop(self):
+        '''
+        Keep every remote host up to date with the groups that have local
+        subscribers.  Websocket consumers notify this process when their
+        subscriptions change; subscriptions are also re-read periodically in
+        case a notification is missed.
+        '''
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        while True:
+            try:
+                await channel_layer.group_add(BROADCAST_WEBSOCKET_INTEREST_GROUP, channel_name)
+                interest = await self.event_loop.run_in_executor(None, get_local_subscriptions)
+                if interest != self.interest:
+                    self.interest = interest
+                    for broadcast_task in self.broadcast_tasks.values():
+                        broadcast_task.advertise(interest)
+            except Exception as e:
+                logger.warn(f"Failed to update websocket subscriptions: '{e}'.")
+            try:
+                await asyncio.wait_for(channel_layer.receive(channel_name),
+                                       timeout=settings.BROADCAST_WEBSOCKET_INTEREST_POLL_RATE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
 
     async def run_per_host_websocket(self):
 
@@ -192,6 +304,8 @@ class BroadcastWebsocketManager(object):
                                                         event_loop=self.event_loop,
                                                         stats=stats,
                                                         remote_host=known_hosts[h])
+                if self.interest is not None:
+                    broadcast_task.advertise(self.interest)
                 broadcast_task.start()
                 self.broadcast_tasks[h] = broadcast_task
 
@@ -200,5 +314,6 @@ class BroadcastWebsocketManager(object):
     def start(self):
         self.stats_mgr.start()
 
+        self.interest_task = self.event_loop.create_task(self.run_interest_loop())
         self.async_task = self.event_loop.create_task(self.run_per_host_websocket())
         return self.async_task
@@ -145,6 +145,10 @@ NAMED_URL_GRAPH = {}
 # Note: This setting may be overridden by database settings.
 SCHEDULE_MAX_JOBS = 10
 
+# The number of upcoming runs stored for each enabled schedule, so that the
+# periodic scheduler only needs to parse a schedule's rrule every few runs
+SCHEDULE_STORED_OCCURRENCES = 10
+
 SITE_ID = 1
 
 # Make this unique, and don't share it with anybody.
@@ -181,6 +185,11 @@ MAX_UI_JOB_EVENTS = 4000
 # to update job data in response to status changes websocket events
 UI_LIVE_UPDATES_ENABLED = True
 
+# The maximum number of job events per second sent over websockets for any
+# one job; events beyond this are dropped (play, task and stats events are
+# always sent).  None sends every event.
+UI_LIVE_UPDATES_MAX_EVENTS_PER_SECOND = None
+
 # The maximum size of the ansible callback event's res data structure
 # beyond this limit and the value will be removed
 MAX_EVENT_RES_DATA = 700000
@@ -188,10 +197,20 @@ MAX_EVENT_RES_DATA = 700000
 # Note: This setting may be overridden by database settings.
 EVENT_STDOUT_MAX_BYTES_DISPLAY = 1024
 
-# The amount of time before a stdout file is expired and removed locally
+# The amount of time before a stdout file is expired and removed locally (by
+# the hourly purge_old_stdout_files task on each node)
 # Note that this can be recreated if the stdout is downloaded
 LOCAL_STDOUT_EXPIRE_TIME = 2592000
 
+# Keep a compressed, line-indexed copy of the stdout of finished jobs on local
+# disk, so that repeated views of the same output don't re-read every event
+# from the database.  Artifacts are not shared between nodes: each node builds
+# its own on the first read it serves after all of the job's events are saved.
+# Each node's hourly purge_old_stdout_files task removes its artifacts once they
+# expire (see LOCAL_STDOUT_EXPIRE_TIME) or their job is deleted.
+STDOUT_CACHE_ENABLED = False
+STDOUT_CACHE_ROOT = '/var/lib/awx/job_stdout_cache/'
+
 # The number of processes spawned by the callback receiver to process job
 # events into the database
 JOB_EVENT_WORKERS = 4
@@ -200,6 +219,17 @@ JOB_EVENT_WORKERS = 4
 # writes in memory before flushing via JobEvent.objects.bulk_create()
 JOB_EVENT_BUFFER_SECONDS = .1
 
+# The maximum number of messages a callback receiver worker reads from redis
+# in a single round trip; the actual batch size adapts to the depth of the
+# queue.  A value of 1 reads one message per round trip.
+JOB_EVENT_READ_BATCH_SIZE = 1
+
+# How the callback receiver writes buffered events to the database:
+# 'bulk_create' uses Django's bulk_create(); 'copy' streams them with
+# PostgreSQL's COPY FROM STDIN, which is considerably faster for large flushes.
+# In either mode, a failed batch is bisected to isolate (and drop) bad events.
+JOB_EVENT_PERSISTENCE_MODE = 'bulk_create'
+
 # The interval at which callback receiver statistics should be
 # recorded
 JOB_EVENT_STATISTICS_INTERVAL = 5
@@ -213,6 +243,18 @@ JOB_EVENT_MIGRATION_CHUNK_SIZE = 1000000
 # The maximum allowed jobs to start on a given task manager cycle
 START_TASK_LIMIT = 100
 
+# The number of dispatcher workers which never receive long-running tasks
+# (e.g., job runs), so that short tasks such as heartbeats and notifications
+# aren't stuck behind them.  Only applies while the pool has more workers
+# than this.
+DISPATCHER_SHORT_TASK_WORKERS = 2
+
+# Dispatcher messages larger than this many bytes are zlib compressed before
+# being sent over pg_notify (None disables compression).  Messages which are
+# still too large for a single notification (8000 bytes) are always
+# compressed and split into chunks, which the dispatcher reassembles.
+DISPATCHER_COMPRESSION_THRESHOLD = 4096
+
 # Disallow sending session cookies over insecure connections
 SESSION_COOKIE_SECURE = True
 
@@ -434,6 +476,11 @@ CELERYBEAT_SCHEDULE = {
         'task': 'awx.main.tasks.gather_analytics',
         'schedule': timedelta(minutes=5)
     },
+    'gather_metrics': {
+        'task': 'awx.main.tasks.gather_metrics',
+        'schedule': timedelta(seconds=15),
+        'options': {'expires': 10,}
+    },
     'task_manager': {
         'task': 'awx.main.scheduler.tasks.run_task_manager',
         'schedule': timedelta(seconds=20),
@@ -444,6 +491,12 @@ CELERYBEAT_SCHEDULE = {
         'schedule': timedelta(seconds=60),
         'options': {'expires': 50,}
     },
+    # runs on every node, since stdout files are kept on local disk
+    'purge_old_stdout_files': {
+        'task': 'awx.main.tasks.purge_old_stdout_files',
+        'schedule': timedelta(hours=1),
+        'options': {'expires': 600,}
+    },
     # 'isolated_heartbeat': set up at the end of production.py and development.py
 }
 
@@ -631,6 +684,11 @@ INSIGHTS_TRACKING_STATE = False
 # Last gather date for Analytics
 AUTOMATION_ANALYTICS_LAST_GATHER = None
 
+# Maximum age (in seconds) of the gauges served by /api/v2/metrics/; they are
+# recomputed in the background by the gather_metrics periodic task, and set
+# this to 0 to recompute them on every request instead
+METRICS_CACHE_SECONDS = 30
+
 # Default list of modules allowed for ad hoc commands.
 # Note: This setting may be overridden by database settings.
 AD_HOC_COMMANDS = [
@@ -1118,3 +1176,29 @@ BROADCAST_WEBSOCKET_NEW_INSTANCE_POLL_RATE_SECONDS = 10
 
 # How often websocket process will generate stats
 BROADCAST_WEBSOCKET_STATS_POLL_RATE_SECONDS = 5
+
+# How often websocket process re-reads local websocket subscriptions (in
+# addition to whenever they change) to tell other nodes which groups to send
+BROADCAST_WEBSOCKET_INTEREST_POLL_RATE_SECONDS = 30
+
+# The maximum number of messages per second sent to each websocket client
+# (clients may ask for less); None sends messages as they arrive
+WEBSOCKET_MAX_EVENTS_PER_SECOND = None
+
+# The number of messages held for a websocket client which falls behind (or is
+# rate limited); once full, the oldest messages are dropped
+WEBSOCKET_SEND_BUFFER_SIZE = 1000
+
+# How long a websocket connection remembers whether its user may subscribe to
+# a job's events
+WEBSOCKET_ACCESS_CACHE_SECONDS = 30
+
+# How long the ids of the objects each user can access through their roles
+# are cached, to filter list views with instead of the role ancestor
+# subqueries; 0 disables the cache.  Cached ids are invalidated whenever role
+# membership or the role hierarchy changes.
+RBAC_ACCESS_CACHE_SECONDS = 0
+
+# Accessible id sets larger than this are not cached, since a long list of ids
+# filters more slowly than the subquery it would replace
+RBAC_ACCESS_CACHE_MAX_IDS = 10000